@@ -61,6 +61,9 @@ setup(name='supasurvey',
         'jsonfield>=1.0.0',
         'django-floppyforms>=1.1.0'
     ],
+    extras_require={
+        'rescoring': ['numpy']
+    },
     tests_require=[
         'Django>=1.6.0',
         'jsonfield>=1.0.0',
@@ -1,31 +1,30 @@
-import os, csv
+import os
 
-from django.contrib import admin
+from django.contrib import admin, messages
 from django import forms
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
 from .models import SurveyResponse
-from .fields import *
+from .export import stream_survey_csv
 
 
 
 def export_survey_as_csv(modeladmin, request, queryset):
+    """ Streams the selected reports as CSV, one row per report with a column
+    for every answer of the survey schema.
+    """
+    survey_ids = set(queryset.order_by().values_list('survey', flat=True).distinct())
+    if len(survey_ids) != 1:
+        modeladmin.message_user(request, 'Select the reports of a single survey to export.', level=messages.ERROR)
+        return None
+
+    survey_response = queryset.order_by('id')[0]
     opts = modeladmin.model._meta
 
-    response = HttpResponse(mimetype='text/csv')
+    response = StreamingHttpResponse(stream_survey_csv(queryset, survey_response.get_schema_handler()), content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename=%s.csv' % unicode(opts).replace('.', '_')
 
-    writer = csv.writer(response)
-
-    field_names = modeladmin.get_survey_csv_headers()
-    writer.writerow(list(field_names))
-
-    for obj in queryset:
-        csv_data = modeladmin.get_survey_csv_data(obj.data)
-        data = [unicode(val).encode('utf-8','replace') for val in csv_data]
-        writer.writerow(data)
-
     return response
 
 export_survey_as_csv.short_description = 'Export selected responses as CSV file'
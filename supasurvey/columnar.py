@@ -0,0 +1,262 @@
+import json, collections
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from supasurvey.dependencies import get_question_key
+from supasurvey.facts import OTHER_CODE, get_options
+from supasurvey.jsonfields import load_json
+from supasurvey.models import SurveyResponse, QuestionResponse
+from supasurvey.scoring import CHOICE_TYPES
+
+
+COLUMNAR_CHUNK_SIZE = 500
+
+NUMBER_TYPES = ('integerfield', 'moneyfield')
+TEXT_TYPES = ('textfield', 'textarea', 'emailfield')
+
+# option codes: 0 is unanswered, options count from 1, OTHER_CODE is an
+# answer that is none of the options
+NO_CODE = 0
+
+# checkbox answers with more options than the bits of an int64 code, less
+# the sign bit, get one 0/1 flag column per option instead of a bitmask
+BITMASK_OPTIONS = 63
+
+# the report totals exported as numbers
+REPORT_NUMBER_COLUMNS = ('completion', 'max_score', 'verified_score', 'computed_score')
+
+
+
+class ColumnLayout(object):
+    """ The columns of a survey schema, every questionset_X__answer_Y key of
+    every question mapped to a fixed index in one of three arrays.
+
+    codes holds integer option codes: the position of the chosen option of
+    radio answers, and a bitmask of the checked options of checkbox answers.
+    A checkbox answer with more than BITMASK_OPTIONS options instead has a
+    column per option, set to 1 when it is checked.
+    numbers holds floats: numeric answers, the score of every question and the
+    report totals.  text holds the text answers, and the other text of radio-open
+    answers.  Repeater rows are combined: checkbox bitmasks are or-ed, numbers and
+    scores summed, text joined with newlines, and radio answers take the first
+    answered row.
+    """
+
+    def __init__(self, schema_data):
+        self.columns = {'codes': [], 'numbers': [], 'text': []}
+        self.answers = collections.defaultdict(list)
+        self.scores = {}
+
+        for column in REPORT_NUMBER_COLUMNS:
+            self.add('numbers', None, None, {'name': column, 'kind': 'report'})
+
+        for section_id, section in (schema_data or {}).items():
+            for questionset_id, questionset in (section.get('questionsets') or {}).items():
+                question = get_question_key(section_id, questionset_id)
+
+                self.scores[question] = self.add('numbers', None, None, {'name': '%s:computed_score' % question,
+                    'kind': 'score', 'question': question})
+
+                for answer_id, answer in (questionset.get('answers') or {}).items():
+                    answer_type = answer.get('type')
+                    key = 'questionset_%s__answer_%s' % (questionset_id, answer_id)
+
+                    meta = {
+                        'name': '%s:%s' % (question, key),
+                        'question': question,
+                        'key': key,
+                        'type': answer_type,
+                        'label': answer.get('label', None) or questionset.get('title', None),
+                        'repeater': questionset.get('repeater', False),
+                    }
+
+                    options = get_options(answer)
+
+                    if answer_type == 'checkbox' and len(options) > BITMASK_OPTIONS:
+                        for option in options:
+                            self.add('codes', question, key, dict(meta, name = '%s:%s' % (meta['name'], option),
+                                option = option, encoding = 'flag'))
+
+                    elif answer_type in CHOICE_TYPES or answer_type == 'checkbox':
+                        meta['options'] = options
+                        meta['encoding'] = 'bitmask' if answer_type == 'checkbox' else 'option'
+                        self.add('codes', question, key, meta)
+
+                        if answer_type == 'radio-open':
+                            other = dict(meta, name = '%s:other' % meta['name'], kind = 'other')
+                            del other['encoding']
+                            self.add('text', question, key, other)
+
+                    elif answer_type in NUMBER_TYPES:
+                        self.add('numbers', question, key, meta)
+                    elif answer_type in TEXT_TYPES:
+                        self.add('text', question, key, meta)
+
+
+    def add(self, array, question, key, meta):
+        index = len(self.columns[array])
+        meta['index'] = index
+        self.columns[array].append(meta)
+
+        if key is not None:
+            self.answers[(question, key)].append((array, index, meta))
+
+        return index
+
+
+    def get_manifest(self, **extra):
+        manifest = collections.OrderedDict(extra)
+        manifest['option_codes'] = {'unanswered': NO_CODE, 'other': OTHER_CODE}
+        manifest['bitmask_options'] = BITMASK_OPTIONS
+        manifest['arrays'] = collections.OrderedDict((array, self.columns[array]) for array in ('codes', 'numbers', 'text'))
+        return manifest
+
+
+
+def encode_option(options, value):
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return NO_CODE, None
+        other = value[1] if len(value) > 1 else None
+        if other:
+            return OTHER_CODE, other
+        value = value[0]
+
+    if not value:
+        return NO_CODE, None
+    if value in options:
+        return options.index(value) + 1, None
+    return OTHER_CODE, value
+
+
+def encode_bitmask(options, value):
+    values = value if isinstance(value, (list, tuple)) else [value]
+    bitmask = 0
+    for value in values:
+        if value in options:
+            bitmask |= 1 << options.index(value)
+    return bitmask
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError), e:
+        return numpy.nan
+
+
+
+class ColumnarExport(object):
+    """ The answers of the reports of a survey and year as dense typed arrays,
+    one row per report.
+
+    Question responses are streamed in chunks of reports with values_list, and
+    their answers are written straight into preallocated arrays at the column
+    index the layout assigned to their key.
+    """
+
+    def __init__(self, survey, year=None, chunk_size=COLUMNAR_CHUNK_SIZE):
+        if numpy is None:
+            raise ImproperlyConfigured('The columnar export requires numpy.')
+
+        self.survey = survey
+        self.year = year
+        self.chunk_size = chunk_size
+        self.layout = ColumnLayout(survey.get_schema_handler().data)
+
+
+    def get_reports(self):
+        queryset = SurveyResponse.objects.filter(survey = self.survey)
+        if self.year is not None:
+            queryset = queryset.filter(year = self.year)
+        return queryset.order_by('id')
+
+
+    def build(self):
+        """ The arrays, keyed by name, and the column manifest. """
+        reports = list(self.get_reports().values_list('id', *REPORT_NUMBER_COLUMNS))
+        count = len(reports)
+        layout = self.layout
+
+        report_ids = numpy.array([report[0] for report in reports], dtype=numpy.int64)
+        codes = numpy.zeros((count, len(layout.columns['codes'])), dtype=numpy.int64)
+        numbers = numpy.full((count, len(layout.columns['numbers'])), numpy.nan, dtype=numpy.float64)
+        text = numpy.full((count, len(layout.columns['text'])), None, dtype=object)
+
+        for index, report in enumerate(reports):
+            for offset, value in enumerate(report[1:]):
+                numbers[index, offset] = to_float(value)
+
+        positions = dict((report_id, index) for index, report_id in enumerate(report_ids.tolist()))
+
+        for start in range(0, count, self.chunk_size):
+            chunk_ids = report_ids[start:start + self.chunk_size].tolist()
+            rows = QuestionResponse.objects.filter(survey_response__in = chunk_ids, enabled = True).order_by().values_list(
+                'survey_response', 'survey_section', 'number', 'computed_score', 'response_data')
+
+            for survey_response_id, survey_section, number, computed_score, response_data in rows.iterator():
+                self.fill(positions[survey_response_id], get_question_key(survey_section, number), computed_score,
+                    load_json(response_data), codes, numbers, text)
+
+        arrays = {'report_id': report_ids, 'codes': codes, 'numbers': numbers, 'text': text}
+        manifest = layout.get_manifest(survey = self.survey.id, year = self.year, version = self.survey.version, rows = count)
+
+        return arrays, manifest
+
+
+    def fill(self, row, question, computed_score, response_data, codes, numbers, text):
+        layout = self.layout
+
+        score_index = layout.scores.get(question, None)
+        if score_index is not None:
+            numbers[row, score_index] = to_float(computed_score)
+
+        if not isinstance(response_data, list):
+            return
+
+        for response in response_data:
+            for key, value in response.items():
+                if not value:
+                    continue
+
+                for array, index, meta in layout.answers.get((question, key), ()):
+                    if array == 'codes':
+                        if meta['encoding'] == 'bitmask':
+                            codes[row, index] |= encode_bitmask(meta['options'], value)
+                        elif meta['encoding'] == 'flag':
+                            if meta['option'] in (value if isinstance(value, (list, tuple)) else [value]):
+                                codes[row, index] = 1
+                        elif codes[row, index] == NO_CODE:
+                            codes[row, index] = encode_option(meta['options'], value)[0]
+
+                    elif array == 'numbers':
+                        value = to_float(value[0] if isinstance(value, (list, tuple)) else value)
+                        if not numpy.isnan(value):
+                            numbers[row, index] = value if numpy.isnan(numbers[row, index]) else numbers[row, index] + value
+
+                    else:
+                        if meta.get('kind') == 'other':
+                            value = encode_option(meta['options'], value)[1]
+                            if not value:
+                                continue
+                        elif isinstance(value, (list, tuple)):
+                            value = ', '.join(v for v in value if v)
+
+                        text[row, index] = value if text[row, index] is None else '%s\n%s' % (text[row, index], value)
+
+
+    def write(self, fileobj, manifest_fileobj):
+        """ Writes the arrays as a compressed .npz and the manifest as JSON.
+        Text is stored in object arrays, so load them with allow_pickle=True.
+        """
+        arrays, manifest = self.build()
+
+        numpy.savez_compressed(fileobj, **arrays)
+        json.dump(manifest, manifest_fileobj, indent=2)
+
+        return manifest
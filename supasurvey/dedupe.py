@@ -0,0 +1,152 @@
+import copy
+
+from datetime import datetime
+
+from django.db import models, transaction
+
+from supasurvey.fragments import invalidate_question_fragments_many
+from supasurvey.jsonfields import load_json
+from supasurvey.models import QuestionResponse, SectionSummary, UploadedFile, AnswerCounter, Survey, SchemaFragment
+from supasurvey.rescoring import REBUILD_BATCH_SIZE
+
+
+# duplicate questions resolved with each transaction
+DEDUPE_CHUNK_SIZE = 500
+
+
+
+def get_duplicate_keys(queryset):
+    """ The (survey_response, survey_section, number) of every question that
+    has more than one question response.
+    """
+    rows = queryset.order_by().values('survey_response', 'survey_section', 'number').annotate(
+        responses = models.Count('id')).filter(responses__gt = 1)
+
+    return [(row['survey_response'], row['survey_section'], row['number']) for row in rows]
+
+
+def get_survivor(candidates):
+    """ The question response kept of duplicates given as (id, response_data,
+    updated_at) rows: the answered one saved last, and the first created of
+    those alike.
+    """
+    def key(candidate):
+        question_response_id, response_data, updated_at = candidate
+        return (bool(load_json(response_data)), updated_at or datetime.min, -question_response_id)
+
+    return max(candidates, key=key)[0]
+
+
+
+def merge_file_answers(schema_data, response_data, duplicate_response_data):
+    """ The response data of the question response kept, with the uploaded files
+    the answers of its duplicates refer to added to the same rows, or None when
+    it refers to them all already.
+    """
+    if not isinstance(schema_data, dict):
+        return None
+
+    file_keys = ['questionset_%s__answer_%s' % (schema_data.get('id'), answer_id)
+        for answer_id, answer in (schema_data.get('answers') or {}).items() if answer.get('type') == 'file-multiple']
+
+    merged = copy.deepcopy(response_data) if isinstance(response_data, list) else []
+    changed = False
+
+    for duplicate_data in duplicate_response_data:
+        if not isinstance(duplicate_data, list):
+            continue
+
+        for index, duplicate_row in enumerate(duplicate_data):
+            for file_key in file_keys:
+                file_ids = duplicate_row.get(file_key) if isinstance(duplicate_row, dict) else None
+                if not isinstance(file_ids, list) or not file_ids:
+                    continue
+
+                while len(merged) <= index:
+                    merged.append({})
+
+                row_file_ids = merged[index].get(file_key) or []
+                missing = [file_id for file_id in file_ids if file_id not in row_file_ids]
+                if missing:
+                    merged[index][file_key] = list(row_file_ids) + missing
+                    changed = True
+
+    return merged if changed else None
+
+
+
+class DedupeResult(object):
+    """ What removing duplicate question responses found and deleted. """
+
+    def __init__(self):
+        self.questions = 0
+        self.deleted = []
+        self.survey_response_ids = set()
+
+
+
+def dedupe_question_responses(queryset=None, dry_run=False):
+    """ Deletes all but one of the question responses of every question of a
+    report, moving the uploaded files of the others and the answers referring
+    to them to the one kept, then rebuilds the totals of the affected reports
+    and the answer counters of their surveys.
+    """
+    if queryset is None:
+        queryset = QuestionResponse.objects.all()
+
+    result = DedupeResult()
+    keys = get_duplicate_keys(queryset)
+    result.questions = len(keys)
+
+    for start in range(0, len(keys), DEDUPE_CHUNK_SIZE):
+        chunk = keys[start:start + DEDUPE_CHUNK_SIZE]
+
+        candidates = {}
+        schemas = {}
+        rows = QuestionResponse.objects.filter(survey_response__in = set(key[0] for key in chunk)).order_by().values_list(
+            'id', 'survey_response', 'survey_section', 'number', 'schema', 'response_data', 'updated_at')
+
+        for question_response_id, survey_response_id, survey_section, number, schema_hash, response_data, updated_at in rows.iterator():
+            candidates.setdefault((survey_response_id, survey_section, number), []).append((question_response_id, response_data, updated_at))
+            schemas[question_response_id] = schema_hash
+
+        survivors = []
+
+        with transaction.atomic():
+            for key in chunk:
+                survivor = get_survivor(candidates[key])
+                duplicates = [candidate[0] for candidate in candidates[key] if candidate[0] != survivor]
+
+                result.deleted.extend(duplicates)
+                result.survey_response_ids.add(key[0])
+
+                if not dry_run:
+                    UploadedFile.objects.filter(question_response__in = duplicates).update(question_response = survivor)
+                    QuestionResponse.objects.filter(id__in = duplicates).delete()
+                    survivors.append(survivor)
+
+                    # the answers of the one kept refer to the files moved to it,
+                    # and its facts and totals follow
+                    response_data = dict((candidate[0], load_json(candidate[1])) for candidate in candidates[key])
+                    schema_data = SchemaFragment.objects.get_cached(schemas[survivor]) if schemas[survivor] else None
+
+                    merged = merge_file_answers(schema_data, response_data[survivor], [response_data[duplicate] for duplicate in duplicates])
+                    if merged is not None:
+                        question_response = QuestionResponse.objects.get(id = survivor)
+                        question_response.response_data = merged
+                        question_response.save()
+
+        # the survivors render the files moved to them
+        invalidate_question_fragments_many(survivors)
+
+    if dry_run or not result.deleted:
+        return result
+
+    survey_response_ids = sorted(result.survey_response_ids)
+    for start in range(0, len(survey_response_ids), REBUILD_BATCH_SIZE):
+        SectionSummary.objects.rebuild_reports(survey_response_ids[start:start + REBUILD_BATCH_SIZE])
+
+    for survey in Survey.objects.filter(submissions__in = survey_response_ids).distinct():
+        AnswerCounter.objects.rebuild(survey)
+
+    return result
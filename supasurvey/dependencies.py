@@ -0,0 +1,216 @@
+import re, json, logging, collections
+
+
+# require_<section>-<questionset>_<answer value>, several separated by spaces or commas
+REQUIREMENT_RE = re.compile(r'^require_(?P<section>[^-_]+)-(?P<questionset>[^_]+)_(?P<value>.+)$')
+SEPARATOR_RE = re.compile(r'[\s,]+')
+
+logger = logging.getLogger(__name__)
+
+
+
+def get_question_key(section_id, questionset_id):
+    """ Questionset ids are only unique within a section. """
+    return '%s-%s' % (section_id, questionset_id)
+
+
+
+class Requirement(object):
+    """ A questionset that must be answered with a value, matched case-insensitively
+    against any answer of any of its rows.
+    """
+
+    __slots__ = ('question', 'value')
+
+    def __init__(self, question, value):
+        self.question = question
+        self.value = value.lower()
+
+
+    def is_met(self, response_data):
+        if not isinstance(response_data, list):
+            return False
+
+        for response in response_data:
+            for field_value in response.values():
+                values = field_value if isinstance(field_value, (list, tuple)) else [field_value]
+                for value in values:
+                    if isinstance(value, basestring) and value.lower() == self.value:
+                        return True
+
+        return False
+
+
+    def as_dict(self):
+        return {'question': self.question, 'value': self.value}
+
+
+
+def parse_dependencies(dependencies, strict=True):
+    """ The requirements of a questionset's dependencies string.  Invalid
+    dependencies raise ValueError, or are logged and ignored unless strict.
+    """
+    requirements = []
+
+    for dependency in SEPARATOR_RE.split(dependencies or ''):
+        if not dependency:
+            continue
+
+        match = REQUIREMENT_RE.match(dependency)
+        if match is None:
+            if strict:
+                raise ValueError('Invalid question dependency: %s' % dependency)
+            logger.warning('Ignoring invalid question dependency: %s', dependency)
+            continue
+
+        requirements.append(Requirement(get_question_key(match.group('section'), match.group('questionset')), match.group('value')))
+
+    return requirements
+
+
+
+class DependencyGraph(object):
+    """ The question dependencies of a survey schema, compiled into a DAG.
+
+    Questions are keyed '<section>-<questionset>'.  A question is enabled when
+    every one of its requirements is met by the responses to an enabled
+    question, so the questions are kept in topological order and evaluated in
+    one pass.
+
+    Schemas are validated with strict=True when they are saved.  Otherwise
+    invalid dependencies, and the questions of a cycle, are logged and ignored,
+    so a stored schema can always be read.
+    """
+
+    def __init__(self, schema_data, strict=False):
+        questions = []
+        requirements = collections.OrderedDict()
+
+        for section_id, section in (schema_data or {}).items():
+            for questionset_id, questionset in (section.get('questionsets') or {}).items():
+                question = get_question_key(section_id, questionset_id)
+                questions.append(question)
+
+                question_requirements = parse_dependencies(questionset.get('dependencies', None), strict)
+                if question_requirements:
+                    requirements[question] = question_requirements
+
+        dependents = collections.OrderedDict()
+        for question, question_requirements in requirements.items():
+            for requirement in question_requirements:
+                dependents.setdefault(requirement.question, []).append(question)
+
+        self.requirements = requirements
+        self.dependents = dependents
+        self.order = self.sort(questions, strict)
+        self._json = None
+
+
+    def sort(self, questions, strict=False):
+        """ The questions taking part in a dependency, every requirement ahead of
+        the questions depending on it, otherwise in schema order.  Questions in
+        or depending on a cycle are left out, so they are never disabled.
+        """
+        requirements, dependents = self.requirements, self.dependents
+
+        position = dict((question, index) for index, question in enumerate(questions))
+        nodes = [question for question in questions if question in requirements or question in dependents]
+
+        # requirements on questions missing from the schema are never met
+        nodes.extend(question for question in dependents.keys() if question not in position)
+
+        indegree = dict((question, len(set(requirement.question for requirement in requirements.get(question, ())))) for question in nodes)
+        ready = [question for question in nodes if not indegree[question]]
+        order = []
+
+        while ready:
+            question = ready.pop(0)
+            order.append(question)
+
+            for dependent in sorted(set(dependents.get(question, ())), key=lambda question: position.get(question, len(position))):
+                indegree[dependent] -= 1
+                if not indegree[dependent]:
+                    ready.append(dependent)
+
+        if len(order) != len(nodes):
+            message = 'Question dependencies form a cycle: %s' % ', '.join(question for question in nodes if question not in order)
+            if strict:
+                raise ValueError(message)
+            logger.warning(message)
+
+        return order
+
+
+    @property
+    def sources(self):
+        """ The questions others depend on. """
+        return self.dependents.keys()
+
+
+    def has_dependents(self, question):
+        return question in self.dependents
+
+
+    def get_disabled(self, responses):
+        """ The questions disabled by the given response data, keyed by question. """
+        disabled = set()
+
+        for question in self.order:
+            for requirement in self.requirements.get(question, ()):
+                if requirement.question in disabled or not requirement.is_met(responses.get(requirement.question, None)):
+                    disabled.add(question)
+                    break
+
+        return disabled
+
+
+    def as_dict(self):
+        return {
+            'order': list(self.order),
+            'requirements': collections.OrderedDict((question, [requirement.as_dict() for requirement in question_requirements])
+                for question, question_requirements in self.requirements.items()),
+        }
+
+
+    def as_json(self):
+        """ The compiled graph, for the client to evaluate the same way. """
+        if self._json is None:
+            self._json = json.dumps(self.as_dict(), separators=(',', ':'))
+        return self._json
+
+
+
+def validate_dependencies(schema_data):
+    """ Raises ValueError when a dependency of the schema is invalid or the
+    dependencies form a cycle.
+    """
+    DependencyGraph(schema_data, strict=True)
+
+
+
+def get_submitted_responses(data, section_id, questionset_ids):
+    """ The response rows of submitted formsets, read straight from the form
+    data so questions can be enabled by answers submitted with them.
+    """
+    responses = {}
+
+    for questionset_id in questionset_ids:
+        prefix = 'fs_%s-' % questionset_id
+        if '%sTOTAL_FORMS' % prefix not in data:
+            continue
+
+        rows = collections.OrderedDict()
+        for key in data.keys():
+            if not key.startswith(prefix):
+                continue
+
+            index, sep, field_name = key[len(prefix):].partition('-')
+            if not (sep and index.isdigit()):
+                continue
+
+            values = data.getlist(key) if hasattr(data, 'getlist') else [data[key]]
+            rows.setdefault(int(index), {})[field_name] = values[0] if len(values) == 1 else values
+
+        responses[get_question_key(section_id, questionset_id)] = [rows[index] for index in sorted(rows.keys())]
+
+    return responses
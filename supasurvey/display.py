@@ -0,0 +1,230 @@
+from django.forms.forms import pretty_name
+from django.utils.html import conditional_escape, format_html, format_html_join
+from django.utils.safestring import mark_safe
+
+from supasurvey.utils import LRUCache
+from supasurvey.widgets import NONEVALUE
+
+
+DISPLAY_CACHE_SIZE = 256
+
+# the answer types the survey forms have field classes for
+DISPLAY_TYPES = ('radio', 'radio-open', 'radio-yes-no', 'checkbox', 'emailfield', 'textfield',
+    'textarea', 'integerfield', 'moneyfield', 'file-multiple')
+
+
+
+class DisplaySpec(object):
+    """ Everything needed to display the stored value of one answer. """
+
+    __slots__ = ('key', 'type', 'label')
+
+    def __init__(self, key, type, label):
+        self.key = key
+        self.type = type
+        self.label = label
+
+
+
+class DisplayField(object):
+    """ A stored answer rendered for reading.  Stands in for a bound field of a
+    read-only survey form, so review templates can print it the same way.
+    """
+
+    errors = ()
+    is_hidden = False
+
+    def __init__(self, name, label, html):
+        self.name = name
+        self.label = label
+        self.html = html
+
+
+    def __unicode__(self):
+        return self.html
+
+
+    def __html__(self):
+        return self.html
+
+
+
+class DisplayForm(object):
+    """ The display fields of one repeater row. """
+
+    errors = {}
+
+    def __init__(self, fields, id=None, repeater=False, files=False):
+        self.fields = fields
+        self.id = id
+        self.repeater = repeater
+        self.files = files
+
+
+    def __iter__(self):
+        return iter(self.fields)
+
+
+    def __len__(self):
+        return len(self.fields)
+
+
+    def hidden_fields(self):
+        return []
+
+
+    def visible_fields(self):
+        return self.fields
+
+
+    def non_field_errors(self):
+        return []
+
+
+    def has_files(self):
+        return self.files
+
+
+
+class DisplayQuestion(object):
+    """ A question response rendered for reading.  Stands in for the formset of
+    a read-only section, with the same meta.
+    """
+
+    edit = False
+    management_form = ''
+
+    def __init__(self, forms, meta=None):
+        self.forms = forms
+        self.meta = meta or {}
+
+
+    def __iter__(self):
+        return iter(self.forms)
+
+
+    def __len__(self):
+        return len(self.forms)
+
+
+    def non_form_errors(self):
+        return []
+
+
+
+def compile_display_specs(schema):
+    """ Parses the answers of a questionset schema into display specs. """
+    questionset_id = int(schema.get('id'))
+    display_specs = []
+
+    for answer_id, answer in schema.get('answers').items():
+        answer_type = answer.get('type')
+        if answer_type not in DISPLAY_TYPES:
+            continue
+
+        answer_key = 'questionset_%s__answer_%s' % (questionset_id, answer_id)
+
+        if answer_type == 'file-multiple':
+            label = 'Attached files'
+        else:
+            label = answer.get('label', None) or pretty_name(answer_key)
+
+        display_specs.append(DisplaySpec(answer_key, answer_type, label))
+
+    return tuple(display_specs)
+
+
+
+_display_specs = LRUCache(DISPLAY_CACHE_SIZE)
+
+def get_display_specs(schema_key, schema):
+    """ Returns the display specs of a questionset schema, kept in a bounded LRU
+    keyed by schema_key.
+    """
+    return _display_specs.get_or_create(schema_key, lambda: compile_display_specs(schema))
+
+
+
+def get_choice_value(answer_type, value):
+    """ The chosen option, as the survey forms take it from the stored value. """
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return None
+        if answer_type == 'radio-open' and len(value) > 1:
+            return value[1] or value[0]
+        return value[0]
+
+    return value
+
+
+def render_files(value, uploaded_files):
+    if not isinstance(value, list):
+        value = [value] if value else []
+
+    files = []
+    for file_id in value:
+        try:
+            uploaded_file = uploaded_files.get(int(file_id), None)
+        except (TypeError, ValueError), e:
+            uploaded_file = None
+
+        if uploaded_file is not None:
+            files.append((uploaded_file.get_absolute_url(), uploaded_file.basename))
+
+    if not files:
+        return mark_safe('<span class="no-files">No uploaded files.</span>')
+
+    return format_html('<ul>{0}</ul>', format_html_join('', '<li><a href="{0}">{1}</a></li>', files))
+
+
+def render_value(answer_type, value, uploaded_files=None):
+    """ The html of a stored answer value, as the plain text widgets show it. """
+    if answer_type == 'file-multiple':
+        return render_files(value, uploaded_files or {})
+
+    if answer_type == 'checkbox':
+        if not isinstance(value, (list, tuple)):
+            value = [value] if value else []
+        return conditional_escape(', '.join(value))
+
+    if answer_type in ('radio', 'radio-open', 'radio-yes-no'):
+        value = get_choice_value(answer_type, value)
+
+    value = value if value else NONEVALUE
+
+    if answer_type in ('textfield', 'textarea'):
+        return format_html('<pre>{0}</pre>', value)
+
+    return conditional_escape(value)
+
+
+
+def render_rows(display_specs, response_data, uploaded_files=None, id=None, repeater=False):
+    """ The display forms of every repeater row of a question response, straight
+    from its response data.  A question without responses shows one empty row,
+    like the formset it stands in for.
+    """
+    rows = response_data if isinstance(response_data, list) and response_data else [{}]
+    has_files = any(spec.type == 'file-multiple' for spec in display_specs)
+    forms = []
+
+    for row in rows:
+        fields = []
+        for spec in display_specs:
+            html = render_value(spec.type, row.get(spec.key, None), uploaded_files)
+            fields.append(DisplayField(spec.key, spec.label, html))
+
+        forms.append(DisplayForm(fields, id=id, repeater=repeater, files=has_files))
+
+    return forms
+
+
+
+def render_verifier(verifier_notes, verified_score, scoring):
+    """ The verifier notes and score, as a read-only verifier form shows them. """
+    fields = [DisplayField('notes', 'Verifier Notes', render_value('textarea', verifier_notes))]
+
+    if scoring:
+        fields.append(DisplayField('score', 'Verifier Score', render_value(None, verified_score)))
+
+    return DisplayForm(fields)
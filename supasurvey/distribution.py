@@ -0,0 +1,175 @@
+import uuid, collections
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+DISTRIBUTION_KEY_PREFIX = 'supasurvey'
+
+DISTRIBUTION_COLUMNS = ('computed_score', 'verified_score', 'completion')
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+HISTOGRAM_BINS = 10
+
+
+
+def get_distribution_cache():
+    """ The cache score distributions are kept in, named by the
+    SUPASURVEY_DISTRIBUTION_CACHE setting and the default cache without it.
+    """
+    return caches[getattr(settings, 'SUPASURVEY_DISTRIBUTION_CACHE', 'default')]
+
+
+def get_version_key(survey_id, year):
+    return '%s:scores:%s:%s' % (DISTRIBUTION_KEY_PREFIX, survey_id, year)
+
+
+def invalidate_score_distribution(survey_id, year):
+    """ Drops the cached distributions of a survey and year by dropping the
+    token their keys are made of.  Called whenever report totals change.
+    """
+    if survey_id:
+        get_distribution_cache().delete(get_version_key(survey_id, year))
+
+
+def get_data_version(survey, year):
+    """ The schema version of the survey and the score token of its year,
+    created when the token was dropped.
+    """
+    cache = get_distribution_cache()
+    version_key = get_version_key(survey.id, year)
+
+    token = cache.get(version_key)
+    if token is None:
+        token = uuid.uuid4().hex
+        cache.add(version_key, token, None)
+        token = cache.get(version_key) or token
+
+    return '%s:%s' % (survey.version, token)
+
+
+
+def get_column_stats(values, bins=HISTOGRAM_BINS):
+    """ The histogram, mean and percentiles of a column, without missing values. """
+    present = values[~numpy.isnan(values)]
+
+    if not len(present):
+        return {'count': 0, 'mean': None, 'min': None, 'max': None,
+            'percentiles': collections.OrderedDict((p, None) for p in PERCENTILES), 'histogram': {'counts': [], 'edges': []}}
+
+    counts, edges = numpy.histogram(present, bins=bins)
+
+    return {
+        'count': int(len(present)),
+        'mean': float(present.mean()),
+        'min': float(present.min()),
+        'max': float(present.max()),
+        'percentiles': collections.OrderedDict(zip(PERCENTILES, [float(p) for p in numpy.percentile(present, PERCENTILES)])),
+        'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+    }
+
+
+def get_percentile_ranks(values):
+    """ The percentile rank of every value, the share of the cohort scoring
+    lower plus half of those scoring the same, or None when it is missing.
+    """
+    present = numpy.sort(values[~numpy.isnan(values)])
+    ranks = numpy.full(len(values), numpy.nan)
+
+    if len(present):
+        below = numpy.searchsorted(present, values, side='left')
+        upto = numpy.searchsorted(present, values, side='right')
+        ranks = (below + (upto - below) / 2.0) * 100.0 / len(present)
+        ranks[numpy.isnan(values)] = numpy.nan
+
+    return [None if numpy.isnan(rank) else round(float(rank), 3) for rank in ranks]
+
+
+def to_array(values):
+    return numpy.array([numpy.nan if value is None else float(value) for value in values], dtype=numpy.float64)
+
+
+
+def get_distribution(report_ids, columns, bins=HISTOGRAM_BINS):
+    """ The stats of every column of values, and each report's percentile rank
+    in each of them, keyed by report id.
+    """
+    stats = collections.OrderedDict()
+    ranks = dict((report_id, {}) for report_id in report_ids)
+
+    for column, values in columns.items():
+        values = to_array(values)
+        stats[column] = get_column_stats(values, bins)
+
+        for report_id, rank in zip(report_ids, get_percentile_ranks(values)):
+            ranks[report_id][column] = rank
+
+    return {'reports': len(report_ids), 'columns': stats, 'ranks': ranks}
+
+
+def get_queryset_distribution(queryset, sections=False, bins=HISTOGRAM_BINS):
+    """ The score distribution of the reports of queryset, from their score
+    columns read with values_list, and with sections from their section
+    summaries too.
+    """
+    from supasurvey.models import SectionSummary
+
+    if numpy is None:
+        raise ImproperlyConfigured('Score distributions require numpy.')
+
+    rows = list(queryset.order_by('id').values_list('id', *DISTRIBUTION_COLUMNS))
+    report_ids = [row[0] for row in rows]
+
+    distribution = get_distribution(report_ids, collections.OrderedDict(
+        (column, [row[index + 1] for row in rows]) for index, column in enumerate(DISTRIBUTION_COLUMNS)), bins)
+
+    if sections:
+        summaries = collections.defaultdict(list)
+        for row in SectionSummary.objects.filter(survey_response__in = report_ids).order_by().values_list(
+                'survey_section', 'survey_response', 'computed_score', 'verified_score', 'fields_complete', 'fields_total'):
+            summaries[row[0]].append(row[1:])
+
+        distribution['sections'] = collections.OrderedDict()
+        for section_id in sorted(summaries):
+            section_rows = summaries[section_id]
+
+            fields_complete = to_array([row[3] for row in section_rows])
+            fields_total = to_array([row[4] for row in section_rows])
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                completion = numpy.where(fields_total > 0, fields_complete * 100.0 / fields_total, 0.0)
+
+            distribution['sections'][section_id] = get_distribution([row[0] for row in section_rows], collections.OrderedDict((
+                ('computed_score', [row[1] for row in section_rows]),
+                ('verified_score', [row[2] for row in section_rows]),
+                ('completion', completion.tolist()),
+            )), bins)
+
+    return distribution
+
+
+
+def get_score_distribution(survey, year=None, sections=False, bins=HISTOGRAM_BINS):
+    """ The score distribution of the reports of a survey and year, cached per
+    survey, year and data version, so report views can show a report's rank
+    without reading the cohort again.
+    """
+    from supasurvey.models import SurveyResponse
+
+    cache = get_distribution_cache()
+    key = '%s:distribution:%s:%s:%s:%s:%s' % (DISTRIBUTION_KEY_PREFIX, survey.id, year,
+        get_data_version(survey, year), int(bool(sections)), bins)
+
+    distribution = cache.get(key)
+    if distribution is None:
+        distribution = SurveyResponse.objects.filter(survey = survey, year = year).score_distribution(sections = sections, bins = bins)
+        cache.set(key, distribution, getattr(settings, 'SUPASURVEY_DISTRIBUTION_TIMEOUT', DEFAULT_TIMEOUT))
+
+    return distribution
@@ -0,0 +1,159 @@
+import csv, os
+
+from decimal import Decimal
+
+from django.db.models import Prefetch
+
+from supasurvey.models import QuestionResponse, THREEPLACES
+
+
+EXPORT_CHUNK_SIZE = 200
+
+# the report columns leading every exported row
+REPORT_EXPORT_COLUMNS = ('id', 'year', 'status', 'submitted', 'reviewed', 'verified', 'completion', 'max_score', 'verified_score', 'computed_score')
+
+# repeater rows of one answer share a cell
+ROW_SEPARATOR = '\n'
+
+
+
+class ExportColumn(object):
+    """ One answer of the compiled schema, exported as a column. """
+
+    __slots__ = ('section_id', 'number', 'key', 'type', 'header')
+
+    def __init__(self, section_id, number, key, type, header):
+        self.section_id = section_id
+        self.number = number
+        self.key = key
+        self.type = type
+        self.header = header
+
+
+
+def get_export_columns(schema_handler):
+    """ The answer columns of a survey, in schema order. """
+    columns = []
+
+    for section_id, section in schema_handler.data.items():
+        for questionset_id, questionset in (section.get('questionsets') or {}).items():
+            for answer_id, answer in (questionset.get('answers') or {}).items():
+                label = answer.get('label', None) or questionset.get('title', None) or ''
+                header = '%s.%s.%s %s' % (section_id, questionset_id, answer_id, label)
+
+                columns.append(ExportColumn(int(section_id), int(questionset_id),
+                    'questionset_%s__answer_%s' % (questionset_id, answer_id), answer.get('type'), header.strip()))
+
+    return columns
+
+
+
+def format_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ', '.join(format_value(v) for v in value if v not in (None, ''))
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, Decimal):
+        return unicode(value.quantize(THREEPLACES))
+    return unicode(value)
+
+
+def format_files(value, uploaded_files):
+    if not isinstance(value, list):
+        value = [value] if value else []
+
+    names = []
+    for file_id in value:
+        try:
+            uploaded_file = uploaded_files.get(int(file_id), None)
+        except (TypeError, ValueError), e:
+            uploaded_file = None
+
+        if uploaded_file is not None:
+            names.append(os.path.basename(uploaded_file.upload.name))
+
+    return ', '.join(names)
+
+
+
+def get_export_row(survey_response, columns):
+    """ One wide row of a report: its totals, then every answer of its question
+    responses, from the prefetched questions and files.
+    """
+    question_responses = dict(((question_response.survey_section, question_response.number), question_response)
+        for question_response in survey_response.question_responses.all())
+
+    row = [format_value(getattr(survey_response, column)) for column in REPORT_EXPORT_COLUMNS]
+
+    for column in columns:
+        question_response = question_responses.get((column.section_id, column.number), None)
+
+        # the answers of disabled questions do not apply
+        response_data = None
+        if question_response is not None and question_response.enabled:
+            response_data = question_response.response_data
+
+        if not isinstance(response_data, list):
+            row.append('')
+            continue
+
+        if column.type == 'file-multiple':
+            uploaded_files = dict((uploaded_file.id, uploaded_file) for uploaded_file in question_response.uploaded_files.all())
+            values = [format_files(response.get(column.key, None), uploaded_files) for response in response_data]
+        else:
+            values = [format_value(response.get(column.key, None)) for response in response_data]
+
+        row.append(ROW_SEPARATOR.join(values) if any(values) else '')
+
+    return row
+
+
+
+def iter_reports(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """ The reports of queryset with their question responses and uploaded files,
+    read in chunks of chunk_size.  Prefetching does not apply to iterator() in
+    this Django, so every chunk is a keyset page with its own prefetch queries.
+    """
+    question_responses = QuestionResponse.objects.only('survey_response', 'survey_section', 'number', 'response_data', 'enabled')
+    queryset = queryset.order_by('id').prefetch_related(
+        Prefetch('question_responses', queryset = question_responses),
+        'question_responses__uploaded_files')
+
+    last_id = 0
+    while True:
+        chunk = list(queryset.filter(id__gt = last_id)[:chunk_size])
+        if not chunk:
+            break
+
+        for survey_response in chunk:
+            yield survey_response
+
+        last_id = chunk[-1].id
+
+
+
+class Echo(object):
+    """ A file-like object that hands back what is written to it, so csv.writer
+    can produce one line at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+
+def encode_row(row):
+    return [unicode(value).encode('utf-8') for value in row]
+
+
+def stream_survey_csv(queryset, schema_handler, chunk_size=EXPORT_CHUNK_SIZE):
+    """ Yields the CSV lines of the reports in queryset, the header first. """
+    writer = csv.writer(Echo())
+    columns = get_export_columns(schema_handler)
+
+    yield writer.writerow(encode_row(list(REPORT_EXPORT_COLUMNS) + [column.header for column in columns]))
+
+    for survey_response in iter_reports(queryset, chunk_size):
+        yield writer.writerow(encode_row(get_export_row(survey_response, columns)))
@@ -0,0 +1,136 @@
+from supasurvey.scoring import CHOICE_TYPES, ZERO, THREEPLACES, AnswerScoring
+from supasurvey.utils import LRUCache, get_schema_version
+
+
+ANSWER_FACT_PLAN_CACHE_SIZE = 512
+
+# answers that are not recorded as facts, uploaded files have their own table
+SKIPPED_TYPES = ('file-multiple',)
+
+# option codes, as in the columnar export: options count from 1, and OTHER is
+# an answer that is none of the options
+OTHER_CODE = -1
+
+OPTION_MAX_LENGTH = 255
+
+
+
+def get_options(answer_dct):
+    options = answer_dct.get('options', None)
+    if options:
+        return options.split('|')
+    if answer_dct.get('type') == 'radio-yes-no':
+        return ['Yes', 'No']
+    return []
+
+
+def get_key_answer_id(field_id):
+    """ The integer answer id of a questionset_X__answer_Y key. """
+    try:
+        return int(field_id.split('_')[-1])
+    except ValueError, e:
+        return None
+
+
+
+class AnswerFactPlan(object):
+    """ A questionset schema compiled for splitting responses into answer facts:
+    the type, options and scoring rules of every answer, keyed by answer id.
+    """
+
+    def __init__(self, schema_data):
+        self.answers = {}
+
+        if isinstance(schema_data, dict):
+            answer_dcts = schema_data.get('answers') or {}
+        else:
+            answer_dcts = {}
+
+        for answer_id, answer_dct in answer_dcts.items():
+            if answer_dct.get('type') in SKIPPED_TYPES:
+                continue
+
+            try:
+                answer_id = int(answer_id)
+            except ValueError, e:
+                continue
+
+            self.answers[answer_id] = (answer_dct.get('type'), get_options(answer_dct), AnswerScoring(unicode(answer_id), answer_dct))
+
+
+    def get_facts(self, response_data):
+        """ Yields a dict of the fact columns of every answered value of the
+        responses.  Checked checkbox options are a fact each.
+
+        The scores of the facts of a question add up to its computed score before
+        it is capped at the maximum.
+        """
+        if not isinstance(response_data, list):
+            return
+
+        for row, response in enumerate(response_data):
+            for field_id, field_value in response.items():
+                if not field_value:
+                    continue
+
+                answer_id = get_key_answer_id(field_id)
+                if answer_id not in self.answers:
+                    continue
+
+                answer_type, options, scoring = self.answers[answer_id]
+                fact = {'row': row, 'answer_id': answer_id, 'answer_type': answer_type}
+
+                if answer_type == 'checkbox':
+                    values = [v for v in (field_value if isinstance(field_value, list) else [field_value]) if v]
+
+                    # without option scores the answer scores as a whole, on its first option
+                    if scoring.option_scores is None:
+                        scores = [scoring.score(field_value)] + [ZERO] * (len(values) - 1)
+                    else:
+                        scores = [scoring.option_scores.get(value, ZERO) for value in values]
+
+                    for value, score in zip(values, scores):
+                        yield dict(fact, option = value[:OPTION_MAX_LENGTH], option_code = self.get_option_code(options, value),
+                            value = None, score = score.quantize(THREEPLACES))
+
+                elif answer_type in CHOICE_TYPES:
+                    value, other = field_value, None
+                    if isinstance(field_value, (list, tuple)):
+                        value = field_value[0] if field_value else None
+                        other = field_value[1] if len(field_value) > 1 else None
+
+                    option_code = OTHER_CODE if other else self.get_option_code(options, value)
+
+                    yield dict(fact, option = value[:OPTION_MAX_LENGTH] if value else None, option_code = option_code,
+                        value = other or None, score = scoring.score(field_value).quantize(THREEPLACES))
+
+                else:
+                    if isinstance(field_value, (list, tuple)):
+                        value = ', '.join(unicode(v) for v in field_value if v)
+                    else:
+                        value = unicode(field_value)
+
+                    yield dict(fact, option = None, option_code = None,
+                        value = value, score = scoring.score(field_value).quantize(THREEPLACES))
+
+
+    def get_option_code(self, options, value):
+        if not value:
+            return None
+        if value in options:
+            return options.index(value) + 1
+        return OTHER_CODE
+
+
+
+_plans = LRUCache(ANSWER_FACT_PLAN_CACHE_SIZE)
+
+def get_answer_fact_plan(schema_data, key=None):
+    """ Returns the cached answer fact plan for a questionset schema, keyed like
+    the scoring plans by the content hash of the schema.
+    """
+
+    if key is None:
+        key = get_schema_version(schema_data)
+
+    return _plans.get_or_create(key, lambda: AnswerFactPlan(schema_data))
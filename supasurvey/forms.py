@@ -6,6 +6,7 @@ from decimal import *
 from django.forms.formsets import BaseFormSet, formset_factory
 
 from supasurvey.models import SurveyResponse
+from supasurvey.utils import LRUCache
 from supasurvey.fields import ChooseYesNoField, ChooseOneField, ChooseOneOpenField
 from supasurvey.fields import ChooseMultipleField, ChooseOneForEachField
 from supasurvey.fields import CharField, IntegerField, EmailField, TextField, SmallTextField, MultiFileField
@@ -13,6 +14,19 @@ from supasurvey.widgets import PlainTextWidget, PlainTextAreaWidget, PlainTextCh
 
 
 
+class FieldSpec(object):
+    """ Everything needed to instantiate the form field of one answer. """
+
+    __slots__ = ('key', 'type', 'cls', 'kwargs')
+
+    def __init__(self, key, type, cls, kwargs):
+        self.key = key
+        self.type = type
+        self.cls = cls
+        self.kwargs = kwargs
+
+
+
 class VerifierForm(forms.Form):
     notes = forms.CharField(
         widget=forms.Textarea,
@@ -64,10 +78,18 @@ class VerifierForm(forms.Form):
 
 
 
+FORMSET_CACHE_SIZE = 256
+
+
+
 class SupaSurveyFormSet(BaseFormSet):
+    # precompiled by get_formset_class
+    field_specs = None
+
     def __init__(self, *args, **kwargs):
         self.schema = kwargs.pop('schema', False)
         self.edit = kwargs.pop('edit', False)
+        self.uploaded_files = kwargs.pop('uploaded_files', None)
 
         super(SupaSurveyFormSet, self).__init__(*args, **kwargs)
 
@@ -78,7 +100,8 @@ class SupaSurveyFormSet(BaseFormSet):
     def add_fields(self, form, index):
         super(SupaSurveyFormSet, self).add_fields(form, index)
 
-        form.build(self.schema, self.edit)
+        form.uploaded_files = self.uploaded_files
+        form.build(self.schema, self.edit, self.field_specs)
 
 
 
@@ -99,6 +122,7 @@ class SupaSurveyForm(forms.Form):
 
     def __init__(self, *args, **kwargs):
         self._filesfields = []
+        self.uploaded_files = None
 
         super(SupaSurveyForm, self).__init__(*args, **kwargs)
 
@@ -108,13 +132,15 @@ class SupaSurveyForm(forms.Form):
         return True
 
 
-    def _get_choices(self, answer_copy):
+    @classmethod
+    def _get_choices(cls, answer_copy):
         answer_options_str = answer_copy.get('options', '')
 
         return answer_options_str.split('|')
 
 
-    def _get_kwargs_for_type(self, answer_type, answer_copy):
+    @classmethod
+    def _get_kwargs_for_type(cls, answer_type, answer_copy):
         kwargs = {
             'label': answer_copy.get('label', None),
             'initial': answer_copy.get('initial', None),
@@ -122,7 +148,7 @@ class SupaSurveyForm(forms.Form):
         }
 
         if answer_type in ['radio', 'radio-open', 'checkbox']:
-            kwargs['choices'] = self._get_choices(answer_copy)
+            kwargs['choices'] = cls._get_choices(answer_copy)
 
         if answer_type == 'file-multiple':
             kwargs['uploaded'] = []
@@ -132,10 +158,40 @@ class SupaSurveyForm(forms.Form):
         return kwargs
 
 
+    @classmethod
+    def compile_field_specs(cls, schema):
+        """ Parses the answers of a questionset schema into field specs once, so
+        forms only have to instantiate their fields.
+        """
+        questionset_id = int(schema.get('id'))
+        field_specs = []
+
+        for answer_id, answer in schema.get('answers').items():
+            answer_type = answer.get('type')
+            answer_key = 'questionset_%s__answer_%s' % (questionset_id, answer_id)
+            answer_cls = cls.FIELDMAP.get(answer_type, None)
+            kwargs = cls._get_kwargs_for_type(answer_type, answer) if answer_cls else None
+
+            field_specs.append(FieldSpec(answer_key, answer_type, answer_cls, kwargs))
+
+        return tuple(field_specs)
+
+
     def add_field(self, answer_key, answer_type, answer_copy):
         answer_cls = self.FIELDMAP.get(answer_type, None)
+        kwargs = self._get_kwargs_for_type(answer_type, answer_copy) if answer_cls else None
+
+        self.add_field_from_spec(FieldSpec(answer_key, answer_type, answer_cls, kwargs))
+
+
+    def add_field_from_spec(self, field_spec):
+        answer_key = field_spec.key
+        answer_type = field_spec.type
+        answer_cls = field_spec.cls
+
         if answer_cls:
-            kwargs = self._get_kwargs_for_type(answer_type, answer_copy)
+            # the spec is shared by every form built from the same schema
+            kwargs = dict(field_spec.kwargs)
 
             if answer_type == 'file-multiple':
                 self._filesfields.append(answer_key)
@@ -176,7 +232,9 @@ class SupaSurveyForm(forms.Form):
                 else:
                     field.widget = PlainTextWidget()
 
-                if hasattr(field, 'files'):
+                if answer_type == 'file-multiple' and self.uploaded_files is not None:
+                    field.widget.files = self.get_uploaded_files(kwargs['uploaded'])
+                elif hasattr(field, 'files'):
                     field.widget.files = field.files
 
 
@@ -184,18 +242,36 @@ class SupaSurveyForm(forms.Form):
             print 'no field class for %s' % answer_key
 
 
-    def build(self, schema, edit):
+    def get_uploaded_files(self, uploaded):
+        """ (id, UploadedFile) pairs for the given ids, from the files the formset
+        was given, so displaying them needs no queries.
+        """
+        files = []
+        for file_id in uploaded:
+            try:
+                uploaded_file = self.uploaded_files.get(int(file_id), None)
+            except (TypeError, ValueError), e:
+                uploaded_file = None
+
+            if uploaded_file is not None:
+                files.append((uploaded_file.id, uploaded_file))
+
+        return files
+
+
+    def build(self, schema, edit, field_specs=None):
         self._schema = schema
         self.edit = edit
 
         self.id = int(self._schema.get('id'))
         self.repeater = self._schema.get('repeater', False)
         self.answers = self._schema.get('answers')
-        for answer_id, answer in self.answers.items():
-            answer_copy = copy.deepcopy(answer)
-            answer_type = answer_copy.pop('type')
-            answer_key = 'questionset_%s__answer_%s' % (self.id, answer_id)
-            self.add_field(answer_key, answer_type, answer_copy)
+
+        if field_specs is None:
+            field_specs = self.compile_field_specs(schema)
+
+        for field_spec in field_specs:
+            self.add_field_from_spec(field_spec)
 
 
     def has_files(self):
@@ -207,6 +283,24 @@ class SupaSurveyForm(forms.Form):
 
 
 
+_formsets = LRUCache(FORMSET_CACHE_SIZE)
+
+def get_formset_class(schema_key, schema, extra):
+    """ Returns the formset class for a questionset schema, with the field specs
+    of its answers precompiled.  Classes are kept in a bounded LRU keyed by
+    (schema_key, extra).
+    """
+    def create_formset_class():
+        FormSet = formset_factory(SupaSurveyForm,
+                extra=extra,
+                formset=SupaSurveyFormSet)
+        FormSet.field_specs = SupaSurveyForm.compile_field_specs(schema)
+        return FormSet
+
+    return _formsets.get_or_create((schema_key, extra), create_formset_class)
+
+
+
 class SurveyResponseForm(autocomplete_light.ModelForm):
     class Meta:
         model = SurveyResponse
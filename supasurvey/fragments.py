@@ -0,0 +1,108 @@
+import hashlib, uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+FRAGMENT_KEY_PREFIX = 'supasurvey'
+
+
+
+def get_fragment_cache():
+    """ The cache rendered question fragments are kept in, named by the
+    SUPASURVEY_FRAGMENT_CACHE setting.  Fragments are not cached without it.
+    """
+    alias = getattr(settings, 'SUPASURVEY_FRAGMENT_CACHE', None)
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def get_token_key(question_response_id):
+    return '%s:question:%s' % (FRAGMENT_KEY_PREFIX, question_response_id)
+
+
+def get_fragment_key(question_response, token, schema_key, edit_mode):
+    updated_at = question_response.updated_at.isoformat() if question_response.updated_at else ''
+    schema_hash = hashlib.sha1(repr(schema_key)).hexdigest()
+
+    return '%s:fragment:%s:%s:%s:%s:%s' % (FRAGMENT_KEY_PREFIX, question_response.id, token, updated_at, schema_hash, edit_mode)
+
+
+def invalidate_question_fragments(question_response_id):
+    """ Drops every cached fragment of a question response by dropping its token. """
+    cache = get_fragment_cache()
+    if cache is not None and question_response_id:
+        cache.delete(get_token_key(question_response_id))
+
+
+def invalidate_question_fragments_many(question_response_ids):
+    """ Drops the tokens of question responses written with a bulk update,
+    which does not save them one by one.
+    """
+    cache = get_fragment_cache()
+    if cache is not None and question_response_ids:
+        cache.delete_many([get_token_key(question_response_id) for question_response_id in question_response_ids])
+
+
+
+class FragmentCache(object):
+    """ Rendered question fragments of one section.
+
+    A fragment is keyed by its question response id and updated_at, the schema
+    version and the edit mode, and by a per question token which saving the
+    question or its uploaded files drops.  Tokens and fragments are read with
+    one get_many each.
+    """
+
+    def __init__(self, cache, edit_mode):
+        self.cache = cache
+        self.edit_mode = edit_mode
+        self.timeout = getattr(settings, 'SUPASURVEY_FRAGMENT_TIMEOUT', DEFAULT_TIMEOUT)
+        self.keys = {}
+
+
+    @classmethod
+    def for_section(cls, edit_mode):
+        cache = get_fragment_cache()
+        if cache is None:
+            return None
+        return cls(cache, edit_mode)
+
+
+    def get_tokens(self, question_responses):
+        token_keys = dict((question_response.id, get_token_key(question_response.id)) for question_response in question_responses)
+        tokens = self.cache.get_many(token_keys.values())
+
+        missing = {}
+        for token_key in token_keys.values():
+            if token_key not in tokens:
+                tokens[token_key] = missing[token_key] = uuid.uuid4().hex
+
+        if missing:
+            self.cache.set_many(missing, self.timeout)
+
+        return dict((question_response_id, tokens[token_key]) for question_response_id, token_key in token_keys.items())
+
+
+    def get_many(self, items):
+        """ The cached fragments of (question_response, schema_key) pairs, keyed
+        by question response id.
+        """
+        tokens = self.get_tokens([question_response for question_response, schema_key in items])
+
+        for question_response, schema_key in items:
+            self.keys[question_response.id] = get_fragment_key(question_response, tokens[question_response.id], schema_key, self.edit_mode)
+
+        fragments = self.cache.get_many(self.keys.values())
+
+        return dict((question_response_id, fragments[key]) for question_response_id, key in self.keys.items() if key in fragments)
+
+
+    def set_many(self, fragments):
+        """ Stores fragments keyed by question response id, for the questions
+        previously looked up with get_many.
+        """
+        if fragments:
+            self.cache.set_many(dict((self.keys[question_response_id], fragment) for question_response_id, fragment in fragments.items()), self.timeout)
@@ -0,0 +1,93 @@
+import json, collections
+
+from jsonfield import JSONField
+from jsonfield.subclassing import SubfieldBase
+
+
+
+def load_json(value):
+    """ values_list returns the stored JSON of a JSONField undecoded. """
+    if isinstance(value, basestring):
+        return json.loads(value, object_pairs_hook=collections.OrderedDict) if value else None
+    return value
+
+
+
+class StoredJSON(object):
+    """ The JSON of a loaded row, kept as it came from the database until the
+    field is first read.
+    """
+
+    __slots__ = ('json',)
+
+    def __init__(self, json):
+        self.json = json
+
+
+    def __repr__(self):
+        return '<StoredJSON: %s bytes>' % len(self.json)
+
+
+
+class LazyJSONDescriptor(object):
+    def __init__(self, field):
+        self.field = field
+
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            raise AttributeError('Can only be accessed via an instance.')
+
+        value = obj.__dict__[self.field.name]
+        if isinstance(value, StoredJSON):
+            value = obj.__dict__[self.field.name] = self.field.decode(value.json)
+
+        return value
+
+
+    def __set__(self, obj, value):
+        # like JSONField.pre_init, only the strings of rows loaded from the
+        # database are JSON, anything assigned later is kept as it is
+        if isinstance(value, basestring) and obj._state.adding and getattr(obj, 'pk', None) is not None:
+            value = StoredJSON(value)
+
+        obj.__dict__[self.field.name] = value
+
+
+
+class LazyJSONFieldBase(SubfieldBase):
+    """ Leaves contribute_to_class alone, so the field can set its own descriptor. """
+
+    def __new__(cls, name, bases, attrs):
+        return type.__new__(cls, name, bases, attrs)
+
+
+
+class LazyJSONField(JSONField):
+    """ A JSONField that decodes the JSON of a loaded row on first access instead
+    of when the row is loaded, so rows read only for other columns never pay
+    for it.  Saving a row whose field was never read writes the stored JSON back
+    as it is.
+    """
+
+    __metaclass__ = LazyJSONFieldBase
+
+    def contribute_to_class(self, cls, name):
+        super(LazyJSONField, self).contribute_to_class(cls, name)
+        setattr(cls, self.name, LazyJSONDescriptor(self))
+
+
+    def decode(self, value):
+        if not value:
+            return None
+        return json.loads(value, **self.load_kwargs)
+
+
+    def pre_save(self, model_instance, add):
+        return model_instance.__dict__.get(self.attname)
+
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, StoredJSON):
+            return value.json
+        return super(LazyJSONField, self).get_db_prep_value(value, connection, prepared)
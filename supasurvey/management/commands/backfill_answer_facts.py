@@ -0,0 +1,52 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supasurvey.models import Survey, QuestionResponse, AnswerFact, AnswerCounter
+
+
+BACKFILL_CHUNK_SIZE = 1000
+
+
+
+class Command(BaseCommand):
+    args = '<survey_id>'
+    help = 'Rebuilds the answer facts of every question response of a survey from its stored responses, then its answer counters.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--year', type='int', default=None,
+            help='Only rebuild the answer facts of the reports of this year.'),
+        make_option('--chunk-size', type='int', default=BACKFILL_CHUNK_SIZE, dest='chunk_size',
+            help='Number of question responses rebuilt at a time.'),
+    )
+
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: backfill_answer_facts %s' % self.args)
+
+        try:
+            survey = Survey.objects.get(id=args[0])
+        except (Survey.DoesNotExist, ValueError), e:
+            raise CommandError('Survey %s does not exist.' % args[0])
+
+        verbosity = int(options.get('verbosity', 1))
+        chunk_size = max(1, options.get('chunk_size'))
+
+        queryset = QuestionResponse.objects.filter(survey_response__survey=survey)
+        if options.get('year') is not None:
+            queryset = queryset.filter(survey_response__year=options.get('year'))
+
+        question_response_ids = list(queryset.order_by('id').values_list('id', flat=True))
+
+        facts = 0
+        for start in range(0, len(question_response_ids), chunk_size):
+            facts += AnswerFact.objects.rebuild(question_response_ids[start:start + chunk_size])
+
+            if verbosity >= 2:
+                self.stdout.write('Rebuilt %s/%s questions.' % (min(start + chunk_size, len(question_response_ids)), len(question_response_ids)))
+
+        counters = AnswerCounter.objects.rebuild(survey, options.get('year'))
+
+        if verbosity >= 1:
+            self.stdout.write('Rebuilt %s answer facts of %s questions, and %s answer counters.' % (facts, len(question_response_ids), len(counters)))
@@ -0,0 +1,46 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supasurvey.dedupe import dedupe_question_responses
+from supasurvey.models import Survey, QuestionResponse
+
+
+
+class Command(BaseCommand):
+    args = '[<survey_id>]'
+    help = 'Deletes duplicate question responses of the same question of a report, keeping one of each, and rebuilds the totals of the affected reports.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', default=False, dest='dry_run',
+            help='Report the duplicates without deleting them.'),
+    )
+
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError('Usage: dedupe_question_responses %s' % self.args)
+
+        queryset = QuestionResponse.objects.all()
+
+        if args:
+            try:
+                survey = Survey.objects.get(id=args[0])
+            except (Survey.DoesNotExist, ValueError), e:
+                raise CommandError('Survey %s does not exist.' % args[0])
+
+            queryset = queryset.filter(survey_response__survey=survey)
+
+        dry_run = options.get('dry_run')
+        result = dedupe_question_responses(queryset, dry_run=dry_run)
+
+        if int(options.get('verbosity', 1)) >= 2:
+            for question_response_id in result.deleted:
+                self.stdout.write('Question response %s is a duplicate.' % question_response_id)
+
+        if dry_run:
+            self.stdout.write('Dry run, %s duplicate question responses of %s questions in %s reports would be deleted.' % (
+                len(result.deleted), result.questions, len(result.survey_response_ids)))
+        elif int(options.get('verbosity', 1)) >= 1:
+            self.stdout.write('Deleted %s duplicate question responses of %s questions in %s reports.' % (
+                len(result.deleted), result.questions, len(result.survey_response_ids)))
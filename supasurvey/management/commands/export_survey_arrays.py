@@ -0,0 +1,42 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from supasurvey.columnar import COLUMNAR_CHUNK_SIZE, ColumnarExport
+from supasurvey.models import Survey
+
+
+
+class Command(BaseCommand):
+    args = '<survey_id> <output>'
+    help = 'Exports the answers of every report of a survey as typed numpy arrays, to <output>.npz with a <output>.json column manifest.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--year', type='int', default=None,
+            help='Only export the reports of this year.'),
+        make_option('--chunk-size', type='int', default=COLUMNAR_CHUNK_SIZE, dest='chunk_size',
+            help='Number of reports whose question responses are read at a time.'),
+    )
+
+
+    def handle(self, *args, **options):
+        if len(args) != 2:
+            raise CommandError('Usage: export_survey_arrays %s' % self.args)
+
+        try:
+            survey = Survey.objects.get(id=args[0])
+        except (Survey.DoesNotExist, ValueError), e:
+            raise CommandError('Survey %s does not exist.' % args[0])
+
+        output = args[1]
+        if output.endswith('.npz'):
+            output = output[:-len('.npz')]
+
+        export = ColumnarExport(survey, year=options.get('year'), chunk_size=max(1, options.get('chunk_size')))
+
+        with open(output + '.npz', 'wb') as fileobj:
+            with open(output + '.json', 'w') as manifest_fileobj:
+                manifest = export.write(fileobj, manifest_fileobj)
+
+        if int(options.get('verbosity', 1)) >= 1:
+            self.stdout.write('Exported %s reports to %s.npz and %s.json.' % (manifest['rows'], output, output))
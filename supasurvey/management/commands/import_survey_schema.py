@@ -0,0 +1,39 @@
+import os
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from supasurvey.models import Survey
+from supasurvey.utils import get_schema_source_path, import_schema_file
+
+
+
+class Command(BaseCommand):
+    args = '<survey_id>'
+    help = 'Imports the schema file of PROJECT_ROOT/bin into a survey, when it differs from the stored schema.'
+
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: import_survey_schema %s' % self.args)
+
+        try:
+            survey = Survey.objects.get(id=args[0])
+        except (Survey.DoesNotExist, ValueError), e:
+            raise CommandError('Survey %s does not exist.' % args[0])
+
+        source_pth = get_schema_source_path()
+        if not os.path.exists(source_pth):
+            raise CommandError('Schema file %s does not exist.' % source_pth)
+
+        try:
+            imported = import_schema_file(survey, force=True)
+        except ValidationError, e:
+            raise CommandError('Schema file %s is not valid: %s' % (source_pth, '; '.join(e.messages)))
+
+        verbosity = int(options.get('verbosity', 1))
+        if verbosity >= 1:
+            if imported:
+                self.stdout.write('Imported schema version %s into survey %s.' % (survey.version, survey.id))
+            else:
+                self.stdout.write('Survey %s already has the schema of %s.' % (survey.id, source_pth))
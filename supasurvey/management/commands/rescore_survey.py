@@ -0,0 +1,131 @@
+import os, json, multiprocessing
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from supasurvey.models import Survey, SurveyResponse, AnswerCounter
+from supasurvey.rescoring import RESCORE_CHUNK_SIZE, RescoreResult, rescore_reports
+
+
+SHARD_SIZE = 200
+
+
+
+def close_connections():
+    """ Workers must not share the connections of the parent process, so each
+    opens its own on first use.
+    """
+    for connection in connections.all():
+        connection.close()
+
+
+def rescore_shard(args):
+    survey_response_ids, chunk_size, dry_run = args
+    return rescore_reports(survey_response_ids, chunk_size, dry_run)
+
+
+
+class Command(BaseCommand):
+    args = '<survey_id>'
+    help = 'Rescores every report of a survey in bulk, split into shards of reports over a pool of processes.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--processes', type='int', default=multiprocessing.cpu_count(),
+            help='Number of worker processes.'),
+        make_option('--shard-size', type='int', default=SHARD_SIZE, dest='shard_size',
+            help='Number of reports rescored by each unit of work.'),
+        make_option('--chunk-size', type='int', default=RESCORE_CHUNK_SIZE, dest='chunk_size',
+            help='Number of question responses read at a time.'),
+        make_option('--checkpoint', default=None,
+            help='File recording the rescored reports, to resume an interrupted run.'),
+        make_option('--dry-run', action='store_true', default=False, dest='dry_run',
+            help='Report the scores that would change without writing them.'),
+    )
+
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: rescore_survey %s' % self.args)
+
+        try:
+            survey = Survey.objects.get(id=args[0])
+        except (Survey.DoesNotExist, ValueError), e:
+            raise CommandError('Survey %s does not exist.' % args[0])
+
+        verbosity = int(options.get('verbosity', 1))
+        dry_run = options.get('dry_run')
+        checkpoint = options.get('checkpoint')
+        processes = max(1, options.get('processes'))
+
+        completed, changed = self.read_checkpoint(checkpoint, survey)
+        survey_response_ids = [survey_response_id for survey_response_id in SurveyResponse.objects.filter(survey=survey).order_by('id').values_list('id', flat=True) if survey_response_id not in completed]
+
+        shard_size = max(1, options.get('shard_size'))
+        shards = [(survey_response_ids[start:start + shard_size], options.get('chunk_size'), dry_run) for start in range(0, len(survey_response_ids), shard_size)]
+
+        if completed:
+            self.stdout.write('Resuming, %s reports already rescored.' % len(completed))
+
+        total = RescoreResult()
+
+        if processes > 1 and len(shards) > 1:
+            close_connections()
+            pool = multiprocessing.Pool(processes, initializer=close_connections)
+            results = pool.imap_unordered(rescore_shard, shards)
+        else:
+            pool = None
+            results = (rescore_shard(shard) for shard in shards)
+
+        try:
+            for result in results:
+                total.update(result)
+
+                if not dry_run:
+                    changed = changed or result.changed > 0
+                    completed.update(result.survey_response_ids)
+                    self.write_checkpoint(checkpoint, survey, completed, changed)
+
+                if verbosity >= 2:
+                    for question_response_id, column, stored, value in result.changes:
+                        self.stdout.write('Question response %s %s: %s -> %s' % (question_response_id, column, stored, value))
+
+                if verbosity >= 1:
+                    self.stdout.write('Rescored %s/%s reports, %s questions, %s changed.' % (
+                        len(total.survey_response_ids), len(survey_response_ids), total.questions, total.changed))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if dry_run:
+            self.stdout.write('Dry run, %s of %s questions would change.' % (total.changed, total.questions))
+        elif changed:
+            # the completion counters follow the rescored questions, including
+            # those an interrupted run changed before it was resumed
+            AnswerCounter.objects.rebuild(survey)
+
+
+    def read_checkpoint(self, checkpoint, survey):
+        if not checkpoint or not os.path.exists(checkpoint):
+            return set(), False
+
+        with open(checkpoint) as f:
+            data = json.load(f)
+
+        if data.get('survey') != survey.id:
+            raise CommandError('Checkpoint %s belongs to survey %s.' % (checkpoint, data.get('survey')))
+
+        return set(data.get('completed', [])), data.get('changed', False)
+
+
+    def write_checkpoint(self, checkpoint, survey, completed, changed):
+        if not checkpoint:
+            return
+
+        # written aside and renamed, so an interrupted write never loses progress
+        with open(checkpoint + '.tmp', 'w') as f:
+            json.dump({'survey': survey.id, 'completed': sorted(completed), 'changed': changed}, f)
+
+        os.rename(checkpoint + '.tmp', checkpoint)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import jsonfield.fields
+import datetime
+import supasurvey.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionResponse',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('number', models.IntegerField(verbose_name=b'question number')),
+                ('survey_section', models.IntegerField(blank=True, max_length=255, null=True, verbose_name=b'section', choices=[(1, b'1'), (2, b'2'), (3, b'3'), (4, b'4'), (5, b'5'), (6, b'6'), (7, b'7'), (8, b'8')])),
+                ('schema_data', jsonfield.fields.JSONField(null=True, verbose_name=b'schema data', blank=True)),
+                ('response_data', jsonfield.fields.JSONField(null=True, verbose_name=b'response data', blank=True)),
+                ('verifier_notes', jsonfield.fields.JSONField(verbose_name=b'verifier notes', null=True, editable=False, blank=True)),
+                ('completion', models.CharField(max_length=255, null=True, verbose_name=b'completion', blank=True)),
+                ('fields_total', models.CharField(max_length=255, null=True, verbose_name=b'fields total', blank=True)),
+                ('fields_complete', models.CharField(max_length=255, null=True, verbose_name=b'fields complete', blank=True)),
+                ('completed', models.CharField(max_length=255, null=True, verbose_name=b'completed', blank=True)),
+                ('max_score', models.CharField(max_length=255, null=True, verbose_name=b'max score', blank=True)),
+                ('verified_score', models.CharField(max_length=255, null=True, verbose_name=b'verified score', blank=True)),
+                ('computed_score', models.CharField(max_length=255, null=True, verbose_name=b'computed score', blank=True)),
+                ('created_at', models.DateTimeField(default=datetime.datetime.now, null=True, verbose_name=b'created', blank=True)),
+                ('updated_at', models.DateTimeField(null=True, verbose_name=b'updated', blank=True)),
+            ],
+            options={
+                'ordering': ['survey_section', 'number'],
+                'verbose_name': 'Question Response',
+                'verbose_name_plural': 'Question Responses',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='Survey',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('title', models.CharField(max_length=100, verbose_name=b'title')),
+                ('description', models.TextField(null=True, verbose_name=b'description', blank=True)),
+                ('data', jsonfield.fields.JSONField(verbose_name=b'data', editable=False)),
+                ('created_at', models.DateTimeField(default=datetime.datetime.now, null=True, verbose_name=b'created', blank=True)),
+                ('updated_at', models.DateTimeField(null=True, verbose_name=b'updated', blank=True)),
+                ('version', models.CharField(verbose_name=b'version', max_length=100, null=True, editable=False, blank=True)),
+            ],
+            options={
+                'verbose_name': 'Survey',
+                'verbose_name_plural': 'Surveys',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='SurveyNotifier',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=499, verbose_name=b'Name')),
+                ('email', models.EmailField(max_length=75, verbose_name=b'Email')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='SurveyResponse',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('year', models.IntegerField(blank=True, null=True, verbose_name=b'year', choices=[(2010, 2010), (2011, 2011), (2012, 2012), (2013, 2013), (2014, 2014), (2015, 2015), (2016, 2016), (2017, 2017), (2018, 2018), (2019, 2019), (2020, 2020), (2021, 2021), (2022, 2022), (2023, 2023), (2024, 2024), (2025, 2025), (2026, 2026), (2027, 2027)])),
+                ('status', models.CharField(blank=True, max_length=255, null=True, verbose_name=b'state', choices=[(b'draft', b'Draft'), (b'ready', b'Submitted'), (b'reviewed', b'Reviewed'), (b'verified', b'Verified'), (b'jury', b'Jury'), (b'completed', b'Completed')])),
+                ('completion', models.CharField(max_length=255, null=True, verbose_name=b'completion', blank=True)),
+                ('max_score', models.CharField(max_length=255, null=True, verbose_name=b'max score', blank=True)),
+                ('verified_score', models.CharField(max_length=255, null=True, verbose_name=b'verified score', blank=True)),
+                ('computed_score', models.CharField(max_length=255, null=True, verbose_name=b'computed score', blank=True)),
+                ('created_at', models.DateTimeField(default=datetime.datetime.now, null=True, verbose_name=b'created', blank=True)),
+                ('updated_at', models.DateTimeField(null=True, verbose_name=b'updated', blank=True)),
+                ('submitted', models.BooleanField(default=False, verbose_name=b'submitted')),
+                ('reviewed', models.BooleanField(default=False, verbose_name=b'reviewed')),
+                ('verified', models.BooleanField(default=False, verbose_name=b'verified')),
+                ('completed', models.BooleanField(default=False, verbose_name=b'completed')),
+                ('deleted', models.BooleanField(default=False, verbose_name=b'deleted')),
+                ('survey', models.ForeignKey(related_name='submissions', verbose_name=b'survey', to='supasurvey.Survey')),
+            ],
+            options={
+                'verbose_name': 'Report',
+                'verbose_name_plural': 'Reports',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='UploadedFile',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('upload', models.FileField(max_length=400, upload_to=supasurvey.models.upload_to)),
+                ('created_at', models.DateTimeField(default=datetime.datetime.now, null=True, verbose_name=b'created', blank=True)),
+                ('updated_at', models.DateTimeField(null=True, verbose_name=b'updated', blank=True)),
+                ('question_response', models.ForeignKey(related_name='uploaded_files', verbose_name=b'question_responses', to='supasurvey.QuestionResponse')),
+            ],
+            options={
+                'verbose_name': 'Uploaded File',
+                'verbose_name_plural': 'Uploaded Files',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='survey',
+            name='notifiers',
+            field=models.ManyToManyField(to='supasurvey.SurveyNotifier', null=True, verbose_name=b'notifiers', blank=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='questionresponse',
+            name='survey_response',
+            field=models.ForeignKey(related_name='question_responses', verbose_name=b'Survey Response', to='supasurvey.SurveyResponse'),
+            preserve_default=True,
+        ),
+    ]
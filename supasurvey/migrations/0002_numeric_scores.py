@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import collections
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import models, migrations
+
+
+SURVEY_RESPONSE_FIELDS = ('completion', 'max_score', 'verified_score', 'computed_score')
+QUESTION_RESPONSE_FIELDS = ('completion', 'fields_total', 'fields_complete', 'max_score', 'verified_score', 'computed_score')
+
+UPDATE_BATCH_SIZE = 500
+
+VERBOSE_NAMES = {
+    'completion': 'completion',
+    'fields_total': 'fields total',
+    'fields_complete': 'fields complete',
+    'max_score': 'max score',
+    'verified_score': 'verified score',
+    'computed_score': 'computed score',
+}
+
+
+def to_decimal(value):
+    """ The 'N/A' completion sentinel and blanks become NULL. """
+    if value is None:
+        return None
+
+    try:
+        return Decimal(value.strip()).quantize(Decimal(10) ** -3)
+    except (InvalidOperation, AttributeError), e:
+        return None
+
+
+def to_string(value):
+    if value is None:
+        return None
+    return '%s' % value
+
+
+def copy_columns(queryset, fieldnames, source, target, convert):
+    """ Rows with the same converted values are updated together, and rows
+    with nothing to copy are left alone, the new columns start out NULL.
+    """
+    rows = collections.defaultdict(list)
+
+    for row in queryset.values_list('id', *[source % name for name in fieldnames]).iterator():
+        values = tuple(convert(value) for value in row[1:])
+        if any(value is not None for value in values):
+            rows[values].append(row[0])
+
+    for values, ids in rows.items():
+        for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+            queryset.filter(id__in=ids[start:start + UPDATE_BATCH_SIZE]).update(
+                **dict((target % name, value) for name, value in zip(fieldnames, values)))
+
+
+def scores_to_numeric(apps, schema_editor):
+    SurveyResponse = apps.get_model('supasurvey', 'SurveyResponse')
+    QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+
+    copy_columns(SurveyResponse._default_manager.all(), SURVEY_RESPONSE_FIELDS, '%s', '%s_numeric', to_decimal)
+    copy_columns(QuestionResponse._default_manager.all(), QUESTION_RESPONSE_FIELDS, '%s', '%s_numeric', to_decimal)
+
+
+def scores_to_string(apps, schema_editor):
+    SurveyResponse = apps.get_model('supasurvey', 'SurveyResponse')
+    QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+
+    copy_columns(SurveyResponse._default_manager.all(), SURVEY_RESPONSE_FIELDS, '%s_numeric', '%s', to_string)
+    copy_columns(QuestionResponse._default_manager.all(), QUESTION_RESPONSE_FIELDS, '%s_numeric', '%s', to_string)
+
+
+def decimal_field(name):
+    return models.DecimalField(VERBOSE_NAMES[name], max_digits=12, decimal_places=3, null=True, blank=True)
+
+
+def char_field(name):
+    return models.CharField(VERBOSE_NAMES[name], max_length=255, null=True, blank=True)
+
+
+def convert_operations():
+    """ Character columns cannot be cast in place on every backend, so the
+    numeric values are copied into new columns which then replace the old ones.
+    """
+    add, remove, rename = [], [], []
+
+    for model_name, fieldnames in (('surveyresponse', SURVEY_RESPONSE_FIELDS), ('questionresponse', QUESTION_RESPONSE_FIELDS)):
+        for name in fieldnames:
+            add.append(migrations.AddField(model_name=model_name, name='%s_numeric' % name, field=decimal_field(name), preserve_default=True))
+            remove.append(migrations.RemoveField(model_name=model_name, name=name))
+            rename.append(migrations.RenameField(model_name=model_name, old_name='%s_numeric' % name, new_name=name))
+
+    return add + [migrations.RunPython(scores_to_numeric, scores_to_string)] + remove + rename
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0001_initial'),
+    ]
+
+    operations = convert_operations()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0002_numeric_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SectionSummary',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('survey_section', models.IntegerField(verbose_name=b'section', choices=[(1, b'1'), (2, b'2'), (3, b'3'), (4, b'4'), (5, b'5'), (6, b'6'), (7, b'7'), (8, b'8')])),
+                ('fields_total', models.DecimalField(default=0, verbose_name=b'fields total', max_digits=12, decimal_places=3)),
+                ('fields_complete', models.DecimalField(default=0, verbose_name=b'fields complete', max_digits=12, decimal_places=3)),
+                ('max_score', models.DecimalField(default=0, verbose_name=b'max score', max_digits=12, decimal_places=3)),
+                ('verified_score', models.DecimalField(default=0, verbose_name=b'verified score', max_digits=12, decimal_places=3)),
+                ('computed_score', models.DecimalField(default=0, verbose_name=b'computed score', max_digits=12, decimal_places=3)),
+                ('survey_response', models.ForeignKey(related_name='section_summaries', verbose_name=b'Survey Response', to='supasurvey.SurveyResponse')),
+            ],
+            options={
+                'ordering': ['survey_section'],
+                'verbose_name': 'Section Summary',
+                'verbose_name_plural': 'Section Summaries',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sectionsummary',
+            unique_together=set([('survey_response', 'survey_section')]),
+        ),
+    ]
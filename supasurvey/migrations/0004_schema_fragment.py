@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import collections
+
+from django.db import models, migrations
+import django.db.models.deletion
+import jsonfield.fields
+
+from supasurvey.jsonfields import load_json
+
+
+UPDATE_BATCH_SIZE = 500
+
+
+def schemas_to_fragments(apps, schema_editor):
+    """ Every distinct questionset schema is stored once, and the question
+    responses holding a copy of it refer to that fragment instead.
+    """
+    from supasurvey.utils import get_schema_version
+
+    QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+    SchemaFragment = apps.get_model('supasurvey', 'SchemaFragment')
+
+    schemas = collections.OrderedDict()
+    for question_response_id, schema_json in QuestionResponse._default_manager.values_list('id', 'schema_data').iterator():
+        if schema_json is None:
+            continue
+
+        data = load_json(schema_json)
+        schema_hash = get_schema_version(data)
+        schemas.setdefault(schema_hash, (data, []))[1].append(question_response_id)
+
+    for schema_hash, (data, question_response_ids) in schemas.items():
+        SchemaFragment._default_manager.create(hash=schema_hash, data=data)
+
+        for start in range(0, len(question_response_ids), UPDATE_BATCH_SIZE):
+            batch = question_response_ids[start:start + UPDATE_BATCH_SIZE]
+            QuestionResponse._default_manager.filter(id__in=batch).update(schema=schema_hash)
+
+
+def fragments_to_schemas(apps, schema_editor):
+    QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+    SchemaFragment = apps.get_model('supasurvey', 'SchemaFragment')
+
+    for schema_hash, schema_json in SchemaFragment._default_manager.values_list('hash', 'data').iterator():
+        QuestionResponse._default_manager.filter(schema=schema_hash).update(schema_data=load_json(schema_json))
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0003_section_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchemaFragment',
+            fields=[
+                ('hash', models.CharField(max_length=40, serialize=False, verbose_name=b'hash', primary_key=True)),
+                ('data', jsonfield.fields.JSONField(null=True, verbose_name=b'data', blank=True)),
+            ],
+            options={
+                'verbose_name': 'Schema Fragment',
+                'verbose_name_plural': 'Schema Fragments',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AddField(
+            model_name='questionresponse',
+            name='schema',
+            field=models.ForeignKey(related_name='question_responses', on_delete=django.db.models.deletion.PROTECT, verbose_name=b'schema', blank=True, to='supasurvey.SchemaFragment', null=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(schemas_to_fragments, fragments_to_schemas),
+        migrations.RemoveField(
+            model_name='questionresponse',
+            name='schema_data',
+        ),
+    ]
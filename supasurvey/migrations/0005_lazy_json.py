@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import supasurvey.jsonfields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0004_schema_fragment'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='questionresponse',
+            name='response_data',
+            field=supasurvey.jsonfields.LazyJSONField(null=True, verbose_name=b'response data', blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='questionresponse',
+            name='verifier_notes',
+            field=supasurvey.jsonfields.LazyJSONField(verbose_name=b'verifier notes', null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+    ]
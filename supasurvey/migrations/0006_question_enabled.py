@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import collections
+
+from django.db import models, migrations
+
+from supasurvey.jsonfields import load_json
+
+
+UPDATE_BATCH_SIZE = 500
+
+
+def disable_questions(apps, schema_editor):
+    """ Disables the questions whose dependencies are not met.  Their stored
+    scores are left alone, run the rescore_survey command to bring the scores
+    and totals in line.
+    """
+    from supasurvey.dependencies import DependencyGraph, get_question_key
+
+    Survey = apps.get_model('supasurvey', 'Survey')
+    QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+
+    for survey_id, schema_json in Survey._default_manager.values_list('id', 'data').iterator():
+        dependency_graph = DependencyGraph(load_json(schema_json))
+        if not dependency_graph.requirements:
+            continue
+
+        sources = set(dependency_graph.sources)
+        questions = QuestionResponse._default_manager.filter(survey_response__survey=survey_id).order_by('survey_response')
+
+        reports = collections.OrderedDict()
+        for row in questions.values_list('id', 'survey_response', 'survey_section', 'number').iterator():
+            reports.setdefault(row[1], []).append(row)
+
+        disabled_ids = []
+        for survey_response_id, rows in reports.items():
+            source_ids = [row[0] for row in rows if get_question_key(row[2], row[3]) in sources]
+            stored = dict(QuestionResponse._default_manager.filter(id__in=source_ids).values_list('id', 'response_data'))
+
+            responses = dict((get_question_key(row[2], row[3]), load_json(stored.get(row[0], None))) for row in rows if row[0] in stored)
+            disabled = dependency_graph.get_disabled(responses)
+
+            disabled_ids.extend(row[0] for row in rows if get_question_key(row[2], row[3]) in disabled)
+
+        for start in range(0, len(disabled_ids), UPDATE_BATCH_SIZE):
+            QuestionResponse._default_manager.filter(id__in=disabled_ids[start:start + UPDATE_BATCH_SIZE]).update(enabled=False)
+
+
+def enable_questions(apps, schema_editor):
+    # the column is dropped with the field
+    pass
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0005_lazy_json'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionresponse',
+            name='enabled',
+            field=models.BooleanField(default=True, verbose_name=b'enabled', editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunPython(disable_questions, enable_questions),
+    ]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0006_question_enabled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerFact',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('survey_section', models.IntegerField(verbose_name=b'section', choices=[(1, b'1'), (2, b'2'), (3, b'3'), (4, b'4'), (5, b'5'), (6, b'6'), (7, b'7'), (8, b'8')])),
+                ('number', models.IntegerField(verbose_name=b'question number')),
+                ('row', models.IntegerField(default=0, verbose_name=b'row')),
+                ('answer_id', models.IntegerField(verbose_name=b'answer')),
+                ('answer_type', models.CharField(max_length=50, null=True, verbose_name=b'answer type', blank=True)),
+                ('option', models.CharField(db_index=True, max_length=255, null=True, verbose_name=b'option', blank=True)),
+                ('option_code', models.IntegerField(null=True, verbose_name=b'option code', blank=True)),
+                ('value', models.TextField(null=True, verbose_name=b'value', blank=True)),
+                ('score', models.DecimalField(decimal_places=3, max_digits=12, blank=True, null=True, verbose_name=b'score', db_index=True)),
+                ('question_response', models.ForeignKey(related_name='answer_facts', verbose_name=b'Question Response', to='supasurvey.QuestionResponse')),
+                ('survey_response', models.ForeignKey(related_name='answer_facts', verbose_name=b'Survey Response', to='supasurvey.SurveyResponse')),
+            ],
+            options={
+                'ordering': ['survey_section', 'number', 'row', 'answer_id'],
+                'verbose_name': 'Answer Fact',
+                'verbose_name_plural': 'Answer Facts',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='answerfact',
+            index_together=set([('survey_section', 'number', 'answer_id', 'option'), ('survey_section', 'number', 'answer_id', 'score')]),
+        ),
+    ]
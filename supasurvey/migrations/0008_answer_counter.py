@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0007_answer_fact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerCounter',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('year', models.IntegerField(blank=True, null=True, verbose_name=b'year', choices=[(2010, 2010), (2011, 2011), (2012, 2012), (2013, 2013), (2014, 2014), (2015, 2015), (2016, 2016), (2017, 2017), (2018, 2018), (2019, 2019), (2020, 2020), (2021, 2021), (2022, 2022), (2023, 2023), (2024, 2024), (2025, 2025), (2026, 2026), (2027, 2027)])),
+                ('kind', models.CharField(max_length=20, verbose_name=b'kind', choices=[(b'option', b'Option'), (b'completion', b'Completion')])),
+                ('survey_section', models.IntegerField(verbose_name=b'section', choices=[(1, b'1'), (2, b'2'), (3, b'3'), (4, b'4'), (5, b'5'), (6, b'6'), (7, b'7'), (8, b'8')])),
+                ('number', models.IntegerField(verbose_name=b'question number')),
+                ('answer_id', models.IntegerField(default=0, verbose_name=b'answer')),
+                ('option', models.CharField(default=b'', max_length=255, verbose_name=b'option', blank=True)),
+                ('bucket', models.IntegerField(default=0, verbose_name=b'completion bucket')),
+                ('count', models.IntegerField(default=0, verbose_name=b'count')),
+                ('score_sum', models.DecimalField(default=0, verbose_name=b'score sum', max_digits=14, decimal_places=3)),
+                ('survey', models.ForeignKey(related_name='answer_counters', verbose_name=b'survey', to='supasurvey.Survey')),
+            ],
+            options={
+                'ordering': ['survey_section', 'number', 'kind', 'answer_id', 'bucket'],
+                'verbose_name': 'Answer Counter',
+                'verbose_name_plural': 'Answer Counters',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='answercounter',
+            unique_together=set([('survey', 'year', 'kind', 'survey_section', 'number', 'answer_id', 'option', 'bucket')]),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def check_duplicates(apps, schema_editor):
+    """ The unique constraint can not be added while a question has several
+    responses in a report.  They are removed, and the totals they counted
+    twice rebuilt, with the dedupe_question_responses command.
+    """
+    QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+
+    duplicates = QuestionResponse._default_manager.order_by().values('survey_response', 'survey_section', 'number').annotate(
+        responses=models.Count('id')).filter(responses__gt=1).count()
+
+    if duplicates:
+        raise RuntimeError('%s questions have duplicate question responses, run the dedupe_question_responses command before migrating.' % duplicates)
+
+
+def skip_check(apps, schema_editor):
+    # nothing to undo
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('supasurvey', '0008_answer_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, skip_check),
+        migrations.AlterUniqueTogether(
+            name='questionresponse',
+            unique_together=set([('survey_response', 'survey_section', 'number')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='questionresponse',
+            index_together=set([('survey_section', 'number')]),
+        ),
+    ]
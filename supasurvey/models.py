@@ -1,16 +1,24 @@
-import os, json, collections, copy
+import os, json, collections, copy, threading
 
 from datetime import datetime, date
 from decimal import Decimal, InvalidOperation, DivisionByZero
 
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.query import prefetch_related_objects
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.conf import settings
 from django.utils.html import mark_safe
 from django.core.files.storage import FileSystemStorage
 
 from jsonfield import JSONField
 
+from supasurvey.jsonfields import LazyJSONField
+
+from supasurvey.dependencies import get_question_key, get_submitted_responses
+from supasurvey.fragments import invalidate_question_fragments
+from supasurvey.utils import LRUCache
+
 YEAR_CHOICES = tuple([(y, y) for y in range(2010, date.today().year + 2,)])
 
 NOPLACES = Decimal(0)
@@ -30,6 +38,13 @@ SURVEY_SECTION_CHOICES = (
 )
 
 
+# The question response columns that are totalled per section and per report.
+SCORE_COLUMNS = ('fields_total', 'fields_complete', 'max_score', 'verified_score', 'computed_score')
+
+# The totals stored on the report itself.
+REPORT_COLUMNS = ('completion', 'max_score', 'verified_score', 'computed_score')
+
+
 SURVEY_RESPONSE_CHOICES = (
     ('draft', 'Draft'),
     ('ready', 'Submitted'),
@@ -76,13 +91,42 @@ class Survey(models.Model):
 
 
     def save(self, *args, **kwargs):
+        from supasurvey.utils import get_schema_version
+
         self.updated_at = datetime.today()
         if not self.id:
             self.created_at = datetime.today()
 
+        if self.data:
+            version = get_schema_version(self.data)
+            if version != self.version:
+                self.validate_dependencies()
+            self.version = version
+        else:
+            self.version = None
+
         return super(Survey, self).save(*args, **kwargs)
 
 
+    def validate_dependencies(self):
+        """ Raises ValidationError when the question dependencies of the schema
+        can not be parsed or form a cycle.
+        """
+        from django.core.exceptions import ValidationError
+        from supasurvey.dependencies import validate_dependencies
+
+        try:
+            validate_dependencies(self.data)
+        except ValueError, e:
+            raise ValidationError(unicode(e), code='invalid')
+
+
+    def get_schema_handler(self):
+        from supasurvey.utils import get_schema_handler
+
+        return get_schema_handler(self)
+
+
 
 class SurveyNotifier(models.Model):
     """ This person is notified when a new survey response is submitted. """
@@ -98,7 +142,21 @@ class SurveyNotifier(models.Model):
 
 
 
-class SurveyResponseManager(models.Manager):
+class SurveyResponseQuerySet(models.QuerySet):
+    def score_distribution(self, **kwargs):
+        """ The histogram, mean and percentiles of the computed and verified
+        scores and the completion of these reports, and each report's
+        percentile rank in them, computed with numpy.  With sections=True
+        the same for every section, from the section summaries, and bins sets
+        the number of histogram bins.
+        """
+        from supasurvey.distribution import get_queryset_distribution
+
+        return get_queryset_distribution(self, **kwargs)
+
+
+
+class SurveyResponseManager(models.Manager.from_queryset(SurveyResponseQuerySet)):
     def get_queryset(self):
         return super(SurveyResponseManager, self).get_queryset().filter(deleted=False)
 
@@ -124,10 +182,10 @@ class SurveyResponse(models.Model):
     year = models.IntegerField('year', choices=YEAR_CHOICES, null=True, blank=True)
     status = models.CharField('state', choices=SURVEY_RESPONSE_CHOICES, max_length=255, null=True, blank=True)
 
-    completion = models.CharField('completion', max_length=255, null=True, blank=True)
-    max_score = models.CharField('max score', max_length=255, null=True, blank=True)
-    verified_score = models.CharField('verified score', max_length=255, null=True, blank=True)
-    computed_score = models.CharField('computed score', max_length=255, null=True, blank=True)
+    completion = models.DecimalField('completion', max_digits=12, decimal_places=3, null=True, blank=True)
+    max_score = models.DecimalField('max score', max_digits=12, decimal_places=3, null=True, blank=True)
+    verified_score = models.DecimalField('verified score', max_digits=12, decimal_places=3, null=True, blank=True)
+    computed_score = models.DecimalField('computed score', max_digits=12, decimal_places=3, null=True, blank=True)
 
     created_at = models.DateTimeField('created', null=True, blank=True, default=datetime.now)
     updated_at = models.DateTimeField('updated', null=True, blank=True)
@@ -203,6 +261,22 @@ class SurveyResponse(models.Model):
         return True
 
 
+    def can_patch(self, user):
+        """ Whether user may autosave answers of this report.  Only superusers
+        may, unless the SUPASURVEY_CAN_PATCH setting names a callable, or its
+        dotted path, taking the user and the report.
+        """
+        can_patch = getattr(settings, 'SUPASURVEY_CAN_PATCH', None)
+        if can_patch is None:
+            return user.is_superuser
+
+        if isinstance(can_patch, basestring):
+            from django.utils.module_loading import import_string
+            can_patch = import_string(can_patch)
+
+        return bool(can_patch(user, self))
+
+
     @property
     def can_delete(self):
         if self.submitted:
@@ -239,77 +313,58 @@ class SurveyResponse(models.Model):
         except AttributeError:
             from supasurvey.utils import get_schema_handler
 
-            self._schema_handler = get_schema_handler(self)
+            self._schema_handler = get_schema_handler(self.survey_id)
             return self._schema_handler
 
 
-    def get_completion_for_section(self, section_id):
-        question_responses = self.question_responses.filter(survey_section=section_id)
-        num = len(question_responses)
+    def rebuild_section_summaries(self):
+        """ Sums the score columns of every question response per section with one
+        grouped aggregate query, and stores the result as the section summaries.
+        """
+        return SectionSummary.objects.rebuild([self.id])[self.id]
 
-        try:
-            total = sum([Decimal(question_response.fields_total) for question_response in question_responses])
-            complete = sum([Decimal(question_response.fields_complete) for question_response in question_responses])
-        except TypeError, e:
-            total = Decimal(0)
-            complete = Decimal(0)
 
-        try:
-            percentage = (Decimal(complete) / Decimal(total)) * 100
-        except InvalidOperation, e:
-            percentage = Decimal(0)
-        except DivisionByZero, e:
-            percentage = Decimal(0)
+    def get_section_totals(self, refresh=False):
+        """ The score totals of every section.
 
-        return percentage
+        They are read from the section summaries, which question responses keep
+        up to date as they are saved, and kept on the instance until refreshed.
+        Refreshing rebuilds the summaries from the question responses.
+        """
+        if not refresh and hasattr(self, '_section_totals'):
+            return self._section_totals
 
+        totals = collections.defaultdict(get_empty_totals)
+        summaries = [] if refresh else self.section_summaries.values('survey_section', *SCORE_COLUMNS)
 
-    def get_max_score_for_section(self, section_id):
-        question_responses = self.question_responses.filter(survey_section=section_id)
-        num = len(question_responses)
+        for row in summaries:
+            totals[row['survey_section']] = dict((column, row[column]) for column in SCORE_COLUMNS)
 
-        try:
-            total = sum([Decimal(question_response.max_score) for question_response in question_responses])
-        except TypeError, e:
-            total = Decimal(0)
+        if not totals:
+            totals.update(self.rebuild_section_summaries())
 
-        return total
+        self._section_totals = totals
+        return totals
 
 
-    def get_verified_score_for_section(self, section_id):
-        question_responses = self.question_responses.filter(survey_section=section_id)
-        num = len(question_responses)
+    def get_completion_for_section(self, section_id):
+        return get_completion_for_totals(self.get_section_totals()[int(section_id)])
 
-        try:
-            total = sum([Decimal(question_response.verified_score) for question_response in question_responses])
-        except TypeError, e:
-            total = Decimal(0)
 
-        return total
+    def get_max_score_for_section(self, section_id):
+        return self.get_section_totals()[int(section_id)]['max_score']
 
 
-    def get_computed_score_for_section(self, section_id):
-        question_responses = self.question_responses.filter(survey_section=section_id)
-        num = len(question_responses)
+    def get_verified_score_for_section(self, section_id):
+        return self.get_section_totals()[int(section_id)]['verified_score']
 
-        try:
-            total = sum([Decimal(question_response.computed_score) for question_response in question_responses])
-        except TypeError, e:
-            total = Decimal(0)
 
-        return total
+    def get_computed_score_for_section(self, section_id):
+        return self.get_section_totals()[int(section_id)]['computed_score']
 
 
     def get_completion(self):
-        percentage = Decimal(0)
-        total = Decimal(0)
-
-        for section_id, section_key in SURVEY_SECTION_CHOICES:
-            total += self.get_completion_for_section(section_id)
-
-        percentage = (total / Decimal(len(SURVEY_SECTION_CHOICES)))
-
-        return percentage.quantize(NOPLACES)
+        return get_completion_for_sections(self.get_section_totals())
 
 
     def get_max_score(self):
@@ -339,6 +394,160 @@ class SurveyResponse(models.Model):
         return total.quantize(THREEPLACES)
 
 
+    def get_question_responses_for_section(self, section_id, questionsets):
+        """ The question responses of a section keyed by number, loaded with one
+        query.  Questions the report does not have yet are scored in python and
+        created with a single bulk insert.
+        """
+        section_id = int(section_id)
+        question_responses = {}
+
+        # the questions loaded through this report, kept in step when others enable them
+        loaded = self.__dict__.setdefault('_loaded_questions', {})
+
+        def collect(queryset):
+            # one query fetches the uploaded files of every question in the section
+            for question_response in queryset.prefetch_related('uploaded_files'):
+                question_response.survey_response = self
+                for uploaded_file in question_response.uploaded_files.all():
+                    uploaded_file.report_id = self.id
+
+                question_responses.setdefault(question_response.number, question_response)
+                loaded[question_response.id] = question_response
+
+        collect(self.question_responses.filter(survey_section = section_id))
+
+        missing = []
+        disabled = None
+        dependency_graph = self.get_dependency_graph()
+
+        for questionset_id, questionset_schema in questionsets.items():
+            if int(questionset_id) in question_responses:
+                continue
+
+            question_key = get_question_key(section_id, questionset_id)
+            if disabled is None and question_key in dependency_graph.requirements:
+                disabled = self.get_disabled_questions()
+
+            question_response = QuestionResponse(
+                number = int(questionset_id),
+                survey_response = self,
+                survey_section = section_id,
+                schema_data = questionset_schema,
+                response_data = [],
+                enabled = question_key not in (disabled or ()),
+                created_at = datetime.today(),
+                updated_at = datetime.today()
+            )
+            question_response.resolve_schema()
+            question_response.calculate_scores()
+            missing.append(question_response)
+
+        if missing:
+            try:
+                with transaction.atomic():
+                    QuestionResponse.objects.bulk_create(missing)
+            except IntegrityError, e:
+                # another request created some of these questions since they were
+                # read, use theirs and create only the rest
+                collect(self.question_responses.filter(survey_section = section_id, number__in = [q.number for q in missing]))
+                missing = [question_response for question_response in missing if question_response.number not in question_responses]
+
+                if missing:
+                    QuestionResponse.objects.bulk_create(missing)
+
+        if missing:
+            delta = get_empty_totals()
+            for question_response in missing:
+                for column, value in question_response.get_totals().items():
+                    delta[column] += value
+
+            completion = SectionSummary.objects.apply_delta(self.id, section_id, delta)
+            if completion is None:
+                self.rebuild_totals()
+            else:
+                self.add_totals_delta(delta, completion)
+
+            # bulk_create does not set primary keys, read back only the ids rather
+            # than loading the questions just written again
+            ids = dict(self.question_responses.filter(survey_section = section_id, number__in = [q.number for q in missing]).values_list('number', 'id'))
+
+            for question_response in missing:
+                question_response.id = ids[question_response.number]
+                question_response._state.adding = False
+                question_response._state.db = self._state.db
+                question_response._totals_snapshot = question_response.get_totals()
+                question_response.snapshot_data()
+
+            prefetch_related_objects(missing, ['uploaded_files'])
+            for question_response in missing:
+                question_responses.setdefault(question_response.number, question_response)
+                loaded[question_response.id] = question_response
+
+        return question_responses
+
+
+    def get_dependency_graph(self):
+        return self.get_schema_handler().get_dependency_graph()
+
+
+    def get_disabled_questions(self, responses=None):
+        """ The keys of the questions whose requirements are not met, evaluated
+        against the stored responses of the questions others depend on, with
+        any given responses taking their place.
+        """
+        dependency_graph = self.get_dependency_graph()
+        if not dependency_graph.requirements:
+            return set()
+
+        sources = set(dependency_graph.sources)
+        decode = QuestionResponse._meta.get_field('response_data').decode
+
+        stored = {}
+        rows = self.question_responses.filter(survey_section__in = set(source.split('-', 1)[0] for source in sources))
+        for survey_section, number, response_data in rows.values_list('survey_section', 'number', 'response_data'):
+            question_key = get_question_key(survey_section, number)
+            if question_key in sources:
+                stored[question_key] = decode(response_data) if isinstance(response_data, basestring) else response_data
+
+        stored.update(responses or {})
+
+        return dependency_graph.get_disabled(stored)
+
+
+    def update_enabled_questions(self):
+        """ Enables and disables the questions whose requirements changed, and
+        saves them so their scores and the report totals follow.
+        """
+        dependency_graph = self.get_dependency_graph()
+        if not dependency_graph.requirements:
+            return []
+
+        disabled = self.get_disabled_questions()
+
+        changed = []
+        for question_response_id, survey_section, number, enabled in self.question_responses.values_list('id', 'survey_section', 'number', 'enabled'):
+            question_key = get_question_key(survey_section, number)
+            if question_key in dependency_graph.requirements and enabled == (question_key in disabled):
+                changed.append(question_response_id)
+
+        # questions already loaded are updated in place, so saving them later
+        # does not write back what they were enabled as
+        loaded = self.__dict__.get('_loaded_questions', {})
+        question_responses = [loaded[question_response_id] for question_response_id in changed if question_response_id in loaded]
+
+        fetch = [question_response_id for question_response_id in changed if question_response_id not in loaded]
+        if fetch:
+            question_responses.extend(QuestionResponse.objects.filter(id__in = fetch))
+
+        for question_response in question_responses:
+            question_response.survey_response = self
+            question_response.enabled = not question_response.enabled
+            question_response.save()
+
+        return question_responses
+
+
     def get_formsets(self, **kwargs):
         section_id = kwargs.get('section_id')
         section_schema = kwargs.get('section_schema')
@@ -346,48 +555,139 @@ class SurveyResponse(models.Model):
         verifier_edit = kwargs.get('verifier_edit', False)
         data = kwargs.get('data', None)
         files = kwargs.get('files', None)
+        bind_submitted_only = kwargs.get('bind_submitted_only', False)
 
-        questionsets = self.get_schema_handler().get_questionsets(section_id)
+        schema_handler = self.get_schema_handler()
+        questionsets = schema_handler.get_questionsets(section_id, deep=False)
+        question_responses = self.get_question_responses_for_section(section_id, questionsets)
         formsets = collections.OrderedDict()
 
+        # the prefixes of every form in the submitted data
+        submitted_prefixes = None
+        if data is not None and bind_submitted_only:
+            submitted_prefixes = set(key.rsplit('-', 1)[0] for key in data.keys())
+
+        # questions are enabled by the answers submitted with them, disabled
+        # ones are not bound so they are not validated
+        disabled = set(get_question_key(section_id, question_response.number) for question_response in question_responses.values() if not question_response.enabled)
+        if data is not None and schema_handler.get_dependency_graph().requirements:
+            disabled = self.get_disabled_questions(get_submitted_responses(data, section_id, questionsets.keys()))
+
         for questionset_id, questionset_schema in questionsets.items():
             prefix = 'fs_%s' % questionset_id
+            verifier_prefix = 'q-%s_verifier' % questionset_schema.get('id')
+            question_response = question_responses[int(questionset_id)]
 
-            question_response, created = QuestionResponse.objects.get_or_create(
-                number = int(questionset_id),
-                survey_response = self,
-                survey_section = int(section_id)
-            )
+            # questionset ids are only unique within a section
+            schema_key = None
+            if getattr(schema_handler, 'version', None):
+                schema_key = (schema_handler.version, int(section_id), questionset_id)
+
+            formset_data, formset_files, verifier_data = data, files, data
+            enabled = get_question_key(section_id, questionset_id) not in disabled
+
+            # formsets whose management form was not sent stay unbound
+            if submitted_prefixes is not None:
+                if '%s-TOTAL_FORMS' % prefix not in data:
+                    formset_data, formset_files = None, None
+                if verifier_prefix not in submitted_prefixes:
+                    verifier_data = None
+
+            if not enabled:
+                formset_data, formset_files = None, None
 
             formsets[questionset_id] = question_response.create_formset(
                 questionset_schema = questionset_schema,
+                schema_key = schema_key,
                 response_edit = response_edit,
                 verifier_edit = verifier_edit,
                 prefix = prefix,
-                data = data,
-                files = files
+                data = formset_data,
+                files = formset_files,
+                verifier_data = verifier_data,
+                enabled = enabled
             )
 
         return formsets
 
 
+    def get_display_questions(self, **kwargs):
+        """ The read-only questions of a section, keyed like get_formsets.
+        Rendered questions are cached when SUPASURVEY_FRAGMENT_CACHE is set.
+        """
+        from supasurvey.fragments import FragmentCache
+
+        section_id = kwargs.get('section_id')
+        verifier_edit = kwargs.get('verifier_edit', False)
+        data = kwargs.get('data', None)
+
+        schema_handler = self.get_schema_handler()
+        questionsets = schema_handler.get_questionsets(section_id, deep=False)
+        question_responses = self.get_question_responses_for_section(section_id, questionsets)
+        questions = collections.OrderedDict()
+
+        schema_keys = collections.OrderedDict()
+        for questionset_id in questionsets.keys():
+            schema_key = None
+            if getattr(schema_handler, 'version', None):
+                schema_key = (schema_handler.version, int(section_id), questionset_id)
+            schema_keys[questionset_id] = schema_key
+
+        fragment_cache = FragmentCache.for_section('verify' if verifier_edit else 'review')
+        fragments, rendered = {}, {}
+
+        if fragment_cache is not None:
+            fragments = fragment_cache.get_many([(question_responses[int(questionset_id)], schema_key) for questionset_id, schema_key in schema_keys.items()])
+
+        for questionset_id, questionset_schema in questionsets.items():
+            question_response = question_responses[int(questionset_id)]
+            fragment = fragments.get(question_response.id, None)
+
+            questions[questionset_id] = question = question_response.create_display(
+                questionset_schema = questionset_schema,
+                schema_key = schema_keys[questionset_id],
+                verifier_edit = verifier_edit,
+                prefix = 'fs_%s' % questionset_id,
+                data = data,
+                fragment = fragment
+            )
+
+            if fragment is None:
+                rendered[question_response.id] = question.fragment
+
+        if fragment_cache is not None:
+            fragment_cache.set_many(rendered)
+
+        return questions
+
+
     def get_section_context(self, *args, **kwargs):
         section_id = kwargs.get('section_id')
         response_edit = kwargs.get('response_edit', False)
         verifier_edit = kwargs.get('verifier_edit', False)
         data = kwargs.get('data', None)
         files = kwargs.get('files', None)
+        bind_submitted_only = kwargs.get('bind_submitted_only', False)
 
-        section_schema = self.get_schema_handler().get_section_schema(section_id)
+        section_schema = self.get_schema_handler().get_section_schema(section_id) or {}
 
-        section_formsets = self.get_formsets(
-            section_id = section_id,
-            section_schema = section_schema,
-            response_edit = response_edit,
-            verifier_edit = verifier_edit,
-            data = data,
-            files = files
-        )
+        if response_edit:
+            section_formsets = self.get_formsets(
+                section_id = section_id,
+                section_schema = section_schema,
+                response_edit = response_edit,
+                verifier_edit = verifier_edit,
+                data = data,
+                files = files,
+                bind_submitted_only = bind_submitted_only
+            )
+        else:
+            # review pages only print the stored responses
+            section_formsets = self.get_display_questions(
+                section_id = section_id,
+                verifier_edit = verifier_edit,
+                data = data
+            )
 
 
         section_files = []
@@ -402,33 +702,97 @@ class SurveyResponse(models.Model):
             'title': section_schema.get('title'),
             'completion': self.get_completion_for_section(section_id).quantize(NOPLACES),
             'formsets': section_formsets,
-            'files': section_files
+            'bound_formsets': [formset for formset in section_formsets.values() if getattr(formset, 'is_bound', False)],
+            'files': section_files,
+            'dependencies': self.get_dependency_graph().as_json()
         }
 
         return ctx
 
 
     def create_questions(self):
+        """ Creates every question of the schema with one bulk insert, and counts
+        the totals once they all exist.
+        """
+        # nothing is answered yet, so every question with requirements starts disabled
+        disabled = self.get_dependency_graph().get_disabled({})
+        question_responses = []
+
         for section_id, section_key in SURVEY_SECTION_CHOICES:
             questionsets = self.get_schema_handler().get_questionsets(section_id)
 
             for questionset_id, questionset_schema in questionsets.items():
-                QuestionResponse.objects.create(
+                question_response = QuestionResponse(
                     number = int(questionset_id),
                     survey_response = self,
                     survey_section = int(section_id),
-                    schema_data = questionset_schema
+                    schema_data = questionset_schema,
+                    response_data = [],
+                    enabled = get_question_key(section_id, questionset_id) not in disabled,
+                    created_at = datetime.today(),
+                    updated_at = datetime.today()
                 )
+                question_response.calculate_scores()
+                question_responses.append(question_response)
+
+        # the fragments of every schema are stored at once
+        SchemaFragment.objects.store_many([question_response.schema_data for question_response in question_responses])
+
+        for question_response in question_responses:
+            question_response.resolve_schema(stored=True)
+
+        if question_responses:
+            QuestionResponse.objects.bulk_create(question_responses)
+
+        self.rebuild_totals()
 
 
     def calculate_scores(self):
-        self.completion = self.get_completion()
-        self.max_score = self.get_max_score()
-        self.verified_score = self.get_verified_score()
-        self.computed_score = self.get_computed_score()
+        totals = get_report_totals(self.get_section_totals(refresh=True))
 
-        if Decimal(self.computed_score) > Decimal(self.max_score):
-            self.computed_score = self.max_score
+        for column, value in totals.items():
+            setattr(self, column, value)
+
+
+    def rebuild_totals(self):
+        """ Recounts the totals from every question response and stores only the
+        totals, so other fields of a stale instance are not written back.
+        """
+        self.calculate_scores()
+
+        SurveyResponse._base_manager.filter(id = self.id).update(**dict((column, getattr(self, column)) for column in REPORT_COLUMNS))
+        self.invalidate_score_distribution()
+
+
+    def add_totals_delta(self, delta, completion):
+        """ Mirrors on this instance a change already applied to the database. """
+        for column in ('max_score', 'verified_score', 'computed_score'):
+            if column in delta:
+                setattr(self, column, Decimal(getattr(self, column) or 0) + delta[column])
+
+        self.completion = completion
+        self.__dict__.pop('_section_totals', None)
+        self.invalidate_score_distribution()
+
+
+    def invalidate_score_distribution(self):
+        from supasurvey.distribution import invalidate_score_distribution
+
+        invalidate_score_distribution(self.survey_id, self.year)
+
+
+    def get_score_distribution(self, sections=False):
+        """ The cached score distribution of the reports of this survey and year. """
+        from supasurvey.distribution import get_score_distribution
+
+        return get_score_distribution(self.survey, self.year, sections = sections)
+
+
+    def get_score_ranks(self):
+        """ This report's percentile rank among the reports of its survey and
+        year, for each distribution column.
+        """
+        return self.get_score_distribution()['ranks'].get(self.id, {})
 
 
     def save(self, *args, **kwargs):
@@ -436,13 +800,29 @@ class SurveyResponse(models.Model):
         if not self.id:
             self.created_at = datetime.today()
 
-        super(SurveyResponse, self).save(*args, **kwargs)
+        # the survey counters follow the report to its new year, and only
+        # count it while it is not deleted
+        with transaction.atomic():
+            stored = None
+            if self.id:
+                stored = SurveyResponse._base_manager.select_for_update().filter(id = self.id).values_list(
+                    'survey', 'year', 'deleted').first()
+
+            super(SurveyResponse, self).save(*args, **kwargs)
+
+            counted = (self.survey_id, self.year, self.deleted)
+            if stored is not None and stored != counted:
+                AnswerCounter.objects.move_report(self.id, stored, counted)
+
+        self.invalidate_score_distribution()
+        if stored is not None and stored[:2] != counted[:2]:
+            from supasurvey.distribution import invalidate_score_distribution
+            invalidate_score_distribution(stored[0], stored[1])
 
 
     def post_create(self):
+        # the totals are stored as the questions are created
         self.create_questions()
-        self.calculate_scores()
-        self.save()
 
 
 
@@ -457,33 +837,97 @@ class QuestionResponse(models.Model):
     survey_response = models.ForeignKey('supasurvey.SurveyResponse', verbose_name='Survey Response', related_name='question_responses')
     survey_section = models.IntegerField('section', choices=SURVEY_SECTION_CHOICES, max_length=255, null=True, blank=True)
 
-    schema_data = JSONField('schema data', load_kwargs={'object_pairs_hook': collections.OrderedDict}, null=True, blank=True)
-    response_data = JSONField('response data', load_kwargs={'object_pairs_hook': collections.OrderedDict}, null=True, blank=True)
-    verifier_notes = JSONField('verifier notes', load_kwargs={'object_pairs_hook': collections.OrderedDict}, editable=False, null=True, blank=True)
+    schema = models.ForeignKey('supasurvey.SchemaFragment', verbose_name='schema', related_name='question_responses', null=True, blank=True, on_delete=models.PROTECT)
+    response_data = LazyJSONField('response data', load_kwargs={'object_pairs_hook': collections.OrderedDict}, null=True, blank=True)
+    verifier_notes = LazyJSONField('verifier notes', load_kwargs={'object_pairs_hook': collections.OrderedDict}, editable=False, null=True, blank=True)
 
-    completion = models.CharField('completion', max_length=255, null=True, blank=True)
-    fields_total = models.CharField('fields total', max_length=255, null=True, blank=True)
-    fields_complete = models.CharField('fields complete', max_length=255, null=True, blank=True)
+    completion = models.DecimalField('completion', max_digits=12, decimal_places=3, null=True, blank=True)
+    fields_total = models.DecimalField('fields total', max_digits=12, decimal_places=3, null=True, blank=True)
+    fields_complete = models.DecimalField('fields complete', max_digits=12, decimal_places=3, null=True, blank=True)
     completed = models.CharField('completed', max_length=255, null=True, blank=True)
 
-    max_score = models.CharField('max score', max_length=255, null=True, blank=True)
-    verified_score = models.CharField('verified score', max_length=255, null=True, blank=True)
-    computed_score = models.CharField('computed score', max_length=255, null=True, blank=True)
+    max_score = models.DecimalField('max score', max_digits=12, decimal_places=3, null=True, blank=True)
+    verified_score = models.DecimalField('verified score', max_digits=12, decimal_places=3, null=True, blank=True)
+    computed_score = models.DecimalField('computed score', max_digits=12, decimal_places=3, null=True, blank=True)
+
+    # false while the requirements of the question's dependencies are not met
+    enabled = models.BooleanField('enabled', default=True, editable=False)
 
     created_at = models.DateTimeField('created', null=True, blank=True, default=datetime.now)
     updated_at = models.DateTimeField('updated', null=True, blank=True)
 
 
+    # apply the change in this question's scores to the report totals on save
+    update_totals = True
+
+
     class Meta:
         verbose_name = 'Question Response'
         verbose_name_plural = 'Question Responses'
         ordering = ['survey_section', 'number']
+        # a report has one response per question, and the unique index also
+        # serves the lookups of a section of a report in order
+        unique_together = ('survey_response', 'survey_section', 'number')
+        index_together = [('survey_section', 'number')]
+
+
+    def __init__(self, *args, **kwargs):
+        super(QuestionResponse, self).__init__(*args, **kwargs)
+
+        self._totals_snapshot = self.get_totals()
+        self.snapshot_data()
 
 
     def __unicode__(self):
         return '%s-%s-%s' % (self.survey_response, self.survey_section, self.number)
 
 
+    def _get_schema_data(self):
+        if '_schema_data' in self.__dict__:
+            return self._schema_data
+        if self.schema_id is None:
+            return None
+        return SchemaFragment.objects.get_cached(self.schema_id)
+
+
+    def _set_schema_data(self, data):
+        from supasurvey.utils import get_schema_version
+
+        self._schema_data = data
+        self._schema_hash = get_schema_version(data)
+
+
+    # The questionset schema, stored once per distinct schema as a fragment and
+    # shared by every question using it.  Assign a new schema to change it,
+    # since the decoded schema is shared too.
+    schema_data = property(_get_schema_data, _set_schema_data)
+
+
+    def get_schema_hash(self):
+        if '_schema_data' in self.__dict__:
+            return self._schema_hash
+        if self.schema_id is None:
+            from supasurvey.utils import get_schema_version
+            return get_schema_version(None)
+        return self.schema_id
+
+
+    def resolve_schema(self, stored=False):
+        """ Points the question at the fragment of an assigned schema, creating the
+        fragment when the schema is new.  Pass stored=True when the fragment is
+        known to exist already.
+        """
+        if '_schema_data' in self.__dict__:
+            if stored:
+                self.schema_id = self._schema_hash
+            else:
+                self.schema_id = SchemaFragment.objects.get_for_data(self._schema_data)
+            self.__dict__.pop(self._meta.get_field('schema').get_cache_name(), None)
+
+            del self._schema_data
+            del self._schema_hash
+
+
     def post_create(self):
         if not self.schema_data:
             self.schema_data = {}
@@ -495,225 +939,263 @@ class QuestionResponse(models.Model):
 
 
     def save(self, *args, **kwargs):
+        # rescore=False when the scores were already brought up to date
+        rescore = kwargs.pop('rescore', True)
+
         self.updated_at = datetime.today()
-        if not self.id:
+        self.resolve_schema()
+
+        created = not self.id
+        if created:
             self.created_at = datetime.today()
-        else:
+        elif rescore and self.needs_scoring():
             self.calculate_scores()
 
-        return super(QuestionResponse, self).save(*args, **kwargs)
+        fingerprints = self.get_data_fingerprints()
+        response_changed = fingerprints.get('response_data') != self._data_fingerprints.get('response_data')
 
+        # the answer facts follow the responses, the schema and whether the
+        # question is enabled, and can only be built when the responses are loaded
+        if 'response_data' not in fingerprints:
+            facts_changed = False
+        elif created:
+            facts_changed = bool(self.response_data)
+        else:
+            facts_changed = fingerprints != self._data_fingerprints
 
-    def calculate_scores(self):
-        self.completion = self.calculate_completion()
-        self.max_score = self.calculate_maxscore()
-        self.fields_total = self.calculate_fields_total()
-        self.fields_complete = self.calculate_fields_complete()
-        self.computed_score = self.calculate_computed_score()
+        # the row, its facts and the totals it counts in change together
+        with transaction.atomic():
+            stored = None
+            if not created:
+                stored = self.get_stored_totals()
 
-        if Decimal(self.computed_score) > Decimal(self.max_score):
-            self.computed_score = self.max_score
+            super(QuestionResponse, self).save(*args, **kwargs)
 
+            if facts_changed:
+                AnswerFact.objects.sync(self, replace = not created and self.had_facts(), old_totals = stored)
 
-    def calculate_fields_complete(self):
-        total_fields = Decimal(0)
-        response_data = self.response_data
-        schema_data = self.schema_data
+            self.snapshot_data()
+            self.apply_totals_delta(stored)
 
-        # assert isinstance(schema_data, dict), '%s is not a dict' % schema_data
-        # assert isinstance(response_data, list), '%s is not a list' % response_data
+        invalidate_question_fragments(self.id)
 
-        if not isinstance(schema_data, dict):
-            return Decimal(0)
+        # questions depending on this one follow its answers
+        if response_changed and self.update_totals:
+            if self.survey_response.get_dependency_graph().has_dependents(self.get_question_key()):
+                self.survey_response.update_enabled_questions()
 
-        if not isinstance(response_data, list):
-            return Decimal(0)
 
-        answers = schema_data.get('answers', {})
-        scored = [int(x.get('id')) for x in answers.values() if x.get('type') != 'file-multiple']
+    def get_question_key(self):
+        return get_question_key(self.survey_section, self.number)
 
-        try:
-            completed = []
-            for response in response_data:
-                fields_completed = []
 
-                for field_id, field_value in response.items():
-                    answer_id = field_id.split('_')[-1]
-                    if field_value and int(answer_id) in scored:
-                        fields_completed.append(field_id)
+    def snapshot_data(self):
+        self._data_fingerprints = self.get_data_fingerprints()
 
-                completed.append(len(fields_completed))
 
-            return Decimal(max(completed))
-        except ValueError, e:
-            print 'calculate_fields_complete', e
-            return Decimal(0)
+    def get_data_fingerprints(self):
+        """ The schema fragment, whether the question is enabled and a content
+        hash of the responses, skipping any that were deferred.
+        """
+        from supasurvey.utils import get_data_fingerprint
 
+        fingerprints = {}
+        if 'schema_id' in self.__dict__:
+            fingerprints['schema'] = self.__dict__['schema_id']
+        if 'enabled' in self.__dict__:
+            fingerprints['enabled'] = self.__dict__['enabled']
+        if 'response_data' in self.__dict__:
+            fingerprints['response_data'] = get_data_fingerprint(self.__dict__['response_data'])
 
-    def calculate_fields_total(self):
-        total_fields = Decimal(0)
-        response_data = self.response_data
-        schema_data = self.schema_data
+        return fingerprints
 
-        # assert isinstance(schema_data, dict), '%s is not a dict' % schema_data
-        # assert isinstance(response_data, list), '%s is not a list' % response_data
 
-        if not isinstance(schema_data, dict):
-            return Decimal(0)
+    def had_facts(self):
+        """ Whether the question may have answer facts stored, going by how it
+        was loaded.  Only enabled questions with responses have any.
+        """
+        from supasurvey.utils import get_data_fingerprint
 
-        if not isinstance(response_data, list):
-            return Decimal(0)
+        if not self._data_fingerprints.get('enabled', True):
+            return False
+        return self._data_fingerprints.get('response_data') not in (get_data_fingerprint(None), get_data_fingerprint([]))
 
-        answers = schema_data.get('answers', {})
-        scored = [int(x.get('id')) for x in answers.values() if x.get('type') != 'file-multiple']
 
-        return Decimal(len(scored))
+    def needs_scoring(self):
+        """ Scores only change when the schema, the responses or whether the
+        question is enabled change since it was loaded, or when they were never
+        calculated.
+        """
+        if self.max_score is None or '_schema_data' in self.__dict__:
+            return True
+        return self.get_data_fingerprints() != self._data_fingerprints
 
 
-    def is_scoring(self):
-        if self.max_score:
-            return Decimal(self.max_score) > Decimal(0)
-        return False
+    def get_totals(self):
+        """ The current score columns, skipping any that were deferred.  The
+        verified score of a disabled question is kept, but not counted.
+        """
+        totals = {}
 
+        for column in SCORE_COLUMNS:
+            if column in self.__dict__:
+                totals[column] = Decimal(self.__dict__[column] or 0)
 
-    def get_max_score(self):
-        if self.max_score:
-            return Decimal(self.max_score)
-        return Decimal(0)
+        if 'verified_score' in totals and not self.__dict__.get('enabled', True):
+            totals['verified_score'] = Decimal(0)
 
+        return totals
 
-    def calculate_completion(self):
-        percentage = Decimal(0)
 
-        fields_complete = self.calculate_fields_complete()
-        fields_total = self.calculate_fields_total()
+    def get_stored_totals(self):
+        """ The score columns of the stored row, as get_totals counts them,
+        locked until the end of the transaction so concurrent saves apply their
+        changes one after another.
+        """
+        row = QuestionResponse.objects.select_for_update().filter(id = self.id).values_list('enabled', *SCORE_COLUMNS).first()
+        if row is None:
+            return None
 
-        try:
-            percentage = (fields_complete / fields_total) * 100
-        except InvalidOperation, e:
-            percentage = Decimal(0)
-        except DivisionByZero, e:
-            percentage = Decimal(0)
+        totals = dict((column, Decimal(value or 0)) for column, value in zip(SCORE_COLUMNS, row[1:]))
+        if not row[0]:
+            totals['verified_score'] = Decimal(0)
+        return totals
 
-        if int(fields_total) == 0:
-            return 'N/A'
-        return '%s' % percentage.quantize(THREEPLACES)
 
+    def get_counted_totals(self, totals):
+        """ The completion and score of the given score columns, as the survey
+        counters count them, or None when some were deferred.
+        """
+        if len(totals) != len(SCORE_COLUMNS):
+            return None
+
+        return {
+            'completion': self.calculate_completion(totals['fields_complete'], totals['fields_total']),
+            'computed_score': totals['computed_score'],
+        }
+
+
+    def apply_totals_delta(self, stored=None):
+        """ Applies the change in this question's score columns to its section
+        summary and report, with atomic F() updates.  The change is taken from
+        the stored columns when given, and otherwise from those it was loaded with.
+        """
+        totals = self.get_totals()
+        snapshot = self._totals_snapshot if stored is None else stored
+        self._totals_snapshot = totals
+
+        if not self.update_totals:
+            return
+
+        completion = None
+        if len(snapshot) == len(SCORE_COLUMNS) and len(totals) == len(SCORE_COLUMNS):
+            delta = dict((column, totals[column] - snapshot[column]) for column in SCORE_COLUMNS)
+            delta = dict((column, value) for column, value in delta.items() if value)
+
+            if not delta:
+                return
+
+            completion = SectionSummary.objects.apply_delta(self.survey_response_id, self.survey_section, delta)
 
-    def get_correct_score(self, correct, field_type, field_value, min_score, max_score):
-        if isinstance(field_value, list):
-            v = field_value[0]
-        elif isinstance(field_value, tuple):
-            v = field_value[0]
+        # keep an already loaded report in step with the database
+        survey_response = self.__dict__.get(self._meta.get_field('survey_response').get_cache_name(), None)
+
+        if completion is None:
+            if survey_response is None:
+                survey_response = SurveyResponse._base_manager.get(id = self.survey_response_id)
+            survey_response.rebuild_totals()
+        elif survey_response is not None:
+            survey_response.add_totals_delta(delta, completion)
         else:
-            v = field_value
+            from supasurvey.distribution import invalidate_score_distribution
 
-        if v.lower() == correct.lower():
-            return max_score
-        return min_score
+            invalidate_score_distribution(*SurveyResponse._base_manager.filter(id = self.survey_response_id).values_list('survey', 'year').get())
 
 
-    def get_choice_score(self, scoring, field_type, field_options, field_value, min_score, max_score):
-        scores = scoring.split('|')
-        options = field_options.split('|')
-        _score = Decimal(0)
+    def calculate_scores(self):
+        # disabled questions count towards neither the scores nor the completion
+        if not self.enabled:
+            self.fields_total = self.fields_complete = Decimal(0)
+            self.max_score = self.computed_score = Decimal(0)
+            self.completion = None
+            return
 
-        if field_type == 'radio':
-            if isinstance(field_value, tuple) and (len(field_value) == 2):
-                value = field_value[0]
-            elif isinstance(field_value, list) and (len(field_value) == 2):
-                value = field_value[0]
-            else:
-                value = field_value
+        self.fields_total = self.calculate_fields_total()
+        self.fields_complete = self.calculate_fields_complete()
+        self.completion = self.calculate_completion(self.fields_complete, self.fields_total)
+        self.max_score = self.calculate_maxscore()
+        self.computed_score = self.calculate_computed_score()
 
-            if isinstance(value, str):
-                value = unicode(value)
+        if self.computed_score > self.max_score:
+            self.computed_score = self.max_score
 
-            if value in options:
-                index = options.index(value)
-                _score = Decimal(scores[index])
 
-        elif field_type == 'radio-open':
-            if isinstance(field_value, tuple) and (len(field_value) == 2):
-                value = field_value[0]
-            elif isinstance(field_value, list) and (len(field_value) == 2):
-                value = field_value[0]
-            else:
-                value = field_value
+    def get_scoring_plan(self):
+        """ The compiled scoring plan for this question's schema, shared by every
+        response using the same questionset schema.
+        """
+        schema_hash = self.get_schema_hash()
 
-            if value in options:
-                index = options.index(value)
-                _score = Decimal(scores[index])
+        if getattr(self, '_scoring_plan_hash', None) != schema_hash:
+            from supasurvey.scoring import get_scoring_plan
 
-        elif field_type == 'radio-yes-no':
-            if isinstance(field_value, tuple) and (len(field_value) == 2):
-                value = field_value[0]
-            elif isinstance(field_value, list) and (len(field_value) == 2):
-                value = field_value[0]
-            else:
-                value = field_value
+            self._scoring_plan = get_scoring_plan(self.schema_data, key=schema_hash)
+            self._scoring_plan_hash = schema_hash
 
-            if value in options:
-                index = options.index(value)
-                _score = Decimal(scores[index])
+        return self._scoring_plan
 
-        elif field_type == 'checkbox':
-            assert isinstance(field_value, list), '%s is not list' % type(field_value)
-            for value in field_value:
-                if value in options:
-                    index = options.index(value)
-                    _score += Decimal(scores[index])
 
-        return _score
+    def calculate_fields_complete(self):
+        return self.get_scoring_plan().get_fields_complete(self.response_data)
 
 
-    def get_score(self, field_id, field_value):
-        schema_data = self.schema_data
-        answer_id = field_id.split('_')[-1]
-        answers = schema_data.get('answers')
-        answer_dct = answers.get(answer_id)
+    def calculate_fields_total(self):
+        return self.get_scoring_plan().get_fields_total(self.response_data)
 
-        field_options = answer_dct.get('options', False)
-        field_type = answer_dct.get('type')
-        field_correct = answer_dct.get('correct', False)
-        field_scoring = answer_dct.get('scoring', False)
-        min_score = Decimal(answer_dct.get('minscore', '0'))
-        max_score = Decimal(answer_dct.get('maxscore', '0'))
 
-        _score = min_score
+    def is_scoring(self):
+        if self.max_score:
+            return Decimal(self.max_score) > Decimal(0)
+        return False
 
-        if field_scoring and field_options:
-            _score = self.get_choice_score(field_scoring, field_type, field_options, field_value, min_score, max_score)
-        elif field_correct:
-            _score = self.get_correct_score(field_correct, field_type, field_value, min_score, max_score)
 
-        return _score
+    def get_max_score(self):
+        if self.max_score:
+            return Decimal(self.max_score)
+        return Decimal(0)
 
 
-    def calculate_computed_score(self):
-        total_score = Decimal(0)
+    def calculate_completion(self, fields_complete=None, fields_total=None):
+        percentage = Decimal(0)
 
-        response_data = self.response_data
+        if fields_complete is None:
+            fields_complete = self.calculate_fields_complete()
+        if fields_total is None:
+            fields_total = self.calculate_fields_total()
 
-        for response in response_data:
-            for field_id, field_value in response.items():
-                if field_value:
-                    score = self.get_score(field_id, field_value)
-                    total_score += Decimal(score)
+        try:
+            percentage = (fields_complete / fields_total) * 100
+        except InvalidOperation, e:
+            percentage = Decimal(0)
+        except DivisionByZero, e:
+            percentage = Decimal(0)
 
-        return total_score.quantize(THREEPLACES)
+        # completion does not apply to questions without answerable fields
+        if int(fields_total) == 0:
+            return None
+        return percentage.quantize(THREEPLACES)
 
 
-    def calculate_maxscore(self):
-        total_maxscore = Decimal(0)
+    def get_score(self, field_id, field_value):
+        return self.get_scoring_plan().get_score(field_id, field_value)
+
+
+    def calculate_computed_score(self):
+        return self.get_scoring_plan().get_computed_score(self.response_data)
 
-        answers = self.schema_data.get('answers')
-        for answer_id, answer_dct in answers.items():
-            maxscore = answer_dct.get('maxscore', None)
-            if maxscore:
-                total_maxscore += Decimal(maxscore)
 
-        return total_maxscore.quantize(THREEPLACES)
+    def calculate_maxscore(self):
+        return self.get_scoring_plan().max_score
 
 
     def get_storage(self):
@@ -775,6 +1257,13 @@ class QuestionResponse(models.Model):
         return list(original_set)
 
 
+    def get_uploaded_files(self):
+        """ This question's uploaded files keyed by id, from the prefetched files when
+        the section was loaded with get_question_responses_for_section.
+        """
+        return dict((uploaded_file.id, uploaded_file) for uploaded_file in self.uploaded_files.all())
+
+
     def get_verifier_initial(self):
         dct = {}
 
@@ -791,63 +1280,229 @@ class QuestionResponse(models.Model):
 
 
     def create_formset(self, **kwargs):
-        from supasurvey.forms import SupaSurveyForm, SupaSurveyFormSet, VerifierForm
-        from django.forms.formsets import formset_factory
+        from supasurvey.forms import VerifierForm, get_formset_class
 
         questionset_schema = kwargs.get('questionset_schema')
+        schema_key = kwargs.get('schema_key', None)
         prefix = kwargs.get('prefix')
         response_edit = kwargs.get('response_edit', False)
         verifier_edit = kwargs.get('verifier_edit', False)
         data = kwargs.get('data', None)
         files = kwargs.get('files', None)
+        verifier_data = kwargs.get('verifier_data', data)
+        enabled = kwargs.get('enabled', None)
 
         response_initial = self.response_data or None
         verifier_initial = self.get_verifier_initial()
 
         qss = questionset_schema
-        is_repeater = qss.get('repeater', False)
-        repeater_label = qss.get('repeater_label', None)
         extra = 0 if response_initial else 1
 
-        FormSet = formset_factory(SupaSurveyForm,
-                extra=extra,
-                formset=SupaSurveyFormSet)
+        if schema_key is None:
+            from supasurvey.utils import get_schema_version
+            schema_key = get_schema_version(qss)
 
+        FormSet = get_formset_class(schema_key, qss, extra)
 
         formset = FormSet(data, files,
                 initial = response_initial,
                 prefix = prefix,
                 edit = response_edit,
-                schema = qss)
+                schema = qss,
+                uploaded_files = self.get_uploaded_files())
 
-        question_id = qss.get('id')
-        question_title = qss.get('title', None)
-        question_description = qss.get('description', None)
-        question_dependencies = qss.get('dependencies', None)
-        verifier_prefix = 'q-%s_verifier' % question_id
+        verifier_prefix = 'q-%s_verifier' % qss.get('id')
         max_score = self.get_max_score()
 
         verifier_form = VerifierForm(
                 edit = verifier_edit,
                 max_score = max_score,
-                data = data,
+                data = verifier_data,
                 initial = verifier_initial,
                 prefix = verifier_prefix)
 
+        formset.meta = self.get_question_meta(qss, prefix, verifier_form, enabled)
+
+        return formset
+
+
+    def create_display(self, **kwargs):
+        """ The read-only counterpart of create_formset.  Renders the stored
+        responses straight from the response data and the schema, without
+        building any forms, unless the verifier form is editable.  A fragment
+        rendered earlier by render_display can be passed in to skip rendering.
+        """
+        from supasurvey.display import DisplayQuestion
+
+        questionset_schema = kwargs.get('questionset_schema')
+        schema_key = kwargs.get('schema_key', None)
+        prefix = kwargs.get('prefix')
+        verifier_edit = kwargs.get('verifier_edit', False)
+        data = kwargs.get('data', None)
+        fragment = kwargs.get('fragment', None)
+
+        qss = questionset_schema
+
+        if fragment is None:
+            fragment = self.render_display(qss, schema_key, verifier_edit)
+
+        forms, verifier_form = fragment
 
-        formset.meta = {
+        if verifier_form is None:
+            from supasurvey.forms import VerifierForm
+
+            verifier_form = VerifierForm(
+                    edit = verifier_edit,
+                    max_score = self.get_max_score(),
+                    data = data,
+                    initial = self.get_verifier_initial(),
+                    prefix = 'q-%s_verifier' % qss.get('id'))
+
+        question = DisplayQuestion(forms, self.get_question_meta(qss, prefix, verifier_form))
+        question.fragment = fragment
+
+        return question
+
+
+    def render_display(self, questionset_schema, schema_key=None, verifier_edit=False):
+        """ The display rows of the stored responses and, unless the verifier
+        form is editable, the verifier notes and score.
+        """
+        from supasurvey.display import get_display_specs, render_rows, render_verifier
+
+        qss = questionset_schema
+
+        if schema_key is None:
+            from supasurvey.utils import get_schema_version
+            schema_key = get_schema_version(qss)
+
+        forms = render_rows(get_display_specs(schema_key, qss), self.response_data,
+                uploaded_files = self.get_uploaded_files(),
+                id = int(qss.get('id')),
+                repeater = qss.get('repeater', False))
+
+        verifier_form = None
+        if not verifier_edit:
+            verifier_form = render_verifier(self.verifier_notes or None, self.verified_score or None, self.get_max_score() > 0)
+
+        return (forms, verifier_form)
+
+
+    def get_question_meta(self, questionset_schema, prefix, verifier_form, enabled=None):
+        qss = questionset_schema
+
+        return {
             'verifier_form': verifier_form,
-            'id': question_id,
-            'title': question_title,
-            'description': question_description,
-            'dependencies': question_dependencies,
-            'repeater': is_repeater,
-            'repeater_label': repeater_label,
+            'id': qss.get('id'),
+            'title': qss.get('title', None),
+            'description': qss.get('description', None),
+            'dependencies': qss.get('dependencies', None),
+            'enabled': self.enabled if enabled is None else enabled,
+            'repeater': qss.get('repeater', False),
+            'repeater_label': qss.get('repeater_label', None),
             'prefix': prefix,
             'question_response': self
         }
 
-        return formset
+
+    def get_field_spec(self, field_key):
+        """ The field spec of one answer of this question, compiled with its
+        formset class.
+        """
+        from supasurvey.forms import get_formset_class
+
+        qss = self.schema_data or {}
+        FormSet = get_formset_class(self.get_schema_hash(), qss, 0)
+
+        for field_spec in FormSet.field_specs:
+            if field_spec.key == field_key:
+                return field_spec
+
+        return None
+
+
+    def patch_answer(self, field_key, value, row=0):
+        """ Validates and stores the response to a single answer, such as
+        questionset_3__answer_2, of one repeater row.
+
+        Only that field is cleaned, with its own field class, and only its score
+        is recalculated.  The change is applied to the section and report totals,
+        which are returned with the question totals.  Raises ValidationError
+        when the question is disabled, the answer does not exist or the value
+        does not validate.
+        """
+        from django.core.exceptions import ValidationError
+
+        # the form drops the data of disabled questions as well
+        if not self.enabled:
+            raise ValidationError('Question is disabled.', code='invalid')
+
+        field_spec = self.get_field_spec(field_key) if self.schema_data else None
+        if field_spec is None or field_spec.cls is None:
+            raise ValidationError('Unknown answer %s.' % field_key, code='invalid')
+
+        if field_spec.type == 'file-multiple':
+            raise ValidationError('Files can not be patched.', code='invalid')
+
+        field = field_spec.cls(**dict(field_spec.kwargs))
+        cleaned = field.clean(value)
+
+        response_data = self.response_data if isinstance(self.response_data, list) else []
+
+        try:
+            row = int(row)
+        except (TypeError, ValueError), e:
+            raise ValidationError('Invalid row.', code='invalid')
+
+        if row < 0 or row > len(response_data):
+            raise ValidationError('Invalid row.', code='invalid')
+
+        if row > 0 and not self.schema_data.get('repeater', False):
+            raise ValidationError('Only repeaters have more than one row.', code='invalid')
+
+        if row == len(response_data):
+            response_data.append(collections.OrderedDict())
+
+        plan = self.get_scoring_plan()
+        previous = response_data[row].get(field_key, None)
+        delta = (plan.get_score(field_key, cleaned) if cleaned else 0) - (plan.get_score(field_key, previous) if previous else 0)
+
+        response_data[row][field_key] = cleaned
+        self.response_data = response_data
+
+        if self.max_score is None or not self.enabled:
+            self.calculate_scores()
+        else:
+            self.fields_total = plan.get_fields_total(response_data)
+            self.fields_complete = plan.get_fields_complete(response_data)
+            self.completion = self.calculate_completion(self.fields_complete, self.fields_total)
+
+            # a capped score does not say how far over the maximum it was
+            if self.computed_score is not None and self.computed_score < self.max_score:
+                self.computed_score = (self.computed_score + delta).quantize(THREEPLACES)
+            else:
+                self.computed_score = plan.get_computed_score(response_data)
+
+            if self.computed_score > self.max_score:
+                self.computed_score = self.max_score
+
+        # the report is loaded first so the totals delta is mirrored on it
+        survey_response = self.survey_response
+        self.save(rescore=False)
+
+        return {
+            'question': dict((column, getattr(self, column)) for column in ('completion', 'fields_total', 'fields_complete', 'max_score', 'computed_score')),
+            'report': dict((column, getattr(survey_response, column)) for column in ('completion', 'max_score', 'verified_score', 'computed_score')),
+        }
+
+
+    @models.permalink
+    def get_patch_url(self):
+        return ('supasurvey-answer-patch', None, {
+            'id': self.survey_response_id,
+            'section_id': self.survey_section,
+            'number': self.number
+        })
 
 
     def process_response_data(self, data):
@@ -866,12 +1521,620 @@ class QuestionResponse(models.Model):
 
 
 
-class UploadedFile(models.Model):
-    def upload_to(instance, name):
-        report_id = instance.question_response.survey_response.id
-        return settings.REPORT_ROOT + '/%s/%s' % (report_id, name)
+SCHEMA_FRAGMENT_CACHE_SIZE = 512
+
+_schema_fragments = LRUCache(SCHEMA_FRAGMENT_CACHE_SIZE)
+_schema_fragments_stored = set()
+_schema_fragments_lock = threading.Lock()
+
+
+
+class SchemaFragmentManager(models.Manager):
+    def get_cached(self, schema_hash):
+        """ The decoded schema of a fragment, decoded once per process while it
+        stays in the LRU.  Fragments never change, so they need no invalidation.
+        """
+        data = _schema_fragments.get(schema_hash)
+        if data is None:
+            data = self.get(hash = schema_hash).data
+            self.remember(schema_hash, data)
+
+        return data
+
+
+    def remember(self, schema_hash, data):
+        _schema_fragments.set(schema_hash, data)
+
+
+    def get_for_data(self, data):
+        """ The hash of the fragment holding a schema, created when it is new. """
+        from supasurvey.utils import get_schema_version
+
+        schema_hash = get_schema_version(data)
+
+        with _schema_fragments_lock:
+            stored = schema_hash in _schema_fragments_stored
+
+        if not stored:
+            # a stored fragment holds the same schema, so its data is not read back
+            self.only('hash').get_or_create(hash = schema_hash, defaults = {'data': data})
+
+            # the cached schema is shared, so it must not be the caller's
+            self.remember(schema_hash, copy.deepcopy(data))
+
+            # a fragment created in a transaction is gone if it rolls back
+            if not transaction.get_connection(self.db).in_atomic_block:
+                with _schema_fragments_lock:
+                    _schema_fragments_stored.add(schema_hash)
+
+        return schema_hash
+
+
+    def store_many(self, data_list):
+        """ Stores the fragments of many schemas, with one query reading which
+        exist already and one insert for the rest.
+        """
+        from supasurvey.utils import get_schema_version
+
+        schemas = dict((get_schema_version(data), data) for data in data_list)
+
+        with _schema_fragments_lock:
+            missing = dict((schema_hash, data) for schema_hash, data in schemas.items() if schema_hash not in _schema_fragments_stored)
+
+        if not missing:
+            return
+
+        existing = set(self.filter(hash__in = missing.keys()).values_list('hash', flat = True))
+        created = [SchemaFragment(hash = schema_hash, data = data) for schema_hash, data in missing.items() if schema_hash not in existing]
+
+        if created:
+            try:
+                with transaction.atomic():
+                    self.bulk_create(created)
+            except IntegrityError:
+                # another request stored some of them since they were read
+                for fragment in created:
+                    self.only('hash').get_or_create(hash = fragment.hash, defaults = {'data': fragment.data})
+
+        for schema_hash, data in missing.items():
+            self.remember(schema_hash, copy.deepcopy(data))
+
+        # a fragment created in a transaction is gone if it rolls back
+        if not transaction.get_connection(self.db).in_atomic_block:
+            with _schema_fragments_lock:
+                _schema_fragments_stored.update(missing.keys())
+
+
+
+class SchemaFragment(models.Model):
+    """ A questionset schema, stored once and keyed by the hash of its content.
+    Question responses of every report using the same schema refer to it.
+    """
+    objects = SchemaFragmentManager()
+    hash = models.CharField('hash', max_length=40, primary_key=True)
+    data = JSONField('data', load_kwargs={'object_pairs_hook': collections.OrderedDict}, null=True, blank=True)
+
+
+    class Meta:
+        verbose_name = 'Schema Fragment'
+        verbose_name_plural = 'Schema Fragments'
+
+
+    def __unicode__(self):
+        return '%s' % self.hash
+
+
+
+class SectionSummaryManager(models.Manager):
+    def rebuild(self, survey_response_ids):
+        """ Sums the score columns of the question responses of the given reports
+        per report and section with one grouped aggregate query, and replaces
+        their section summaries with the result.
+
+        Returns the section totals of every report, keyed by report id.
+        """
+        totals = {}
+        for survey_response_id in survey_response_ids:
+            totals[survey_response_id] = dict((section_id, get_empty_totals()) for section_id, section_key in SURVEY_SECTION_CHOICES)
+
+        aggregates = dict(('%s_sum' % column, models.Sum(column)) for column in SCORE_COLUMNS)
+        rows = QuestionResponse.objects.filter(survey_response__in = survey_response_ids).order_by().values(
+            'survey_response', 'survey_section', 'enabled').annotate(**aggregates)
+
+        for row in rows:
+            section_totals = totals[row['survey_response']].setdefault(row['survey_section'], get_empty_totals())
+
+            for column in SCORE_COLUMNS:
+                value = row['%s_sum' % column]
+
+                # disabled questions keep their verified score, but it is not counted
+                if value is None or (column == 'verified_score' and not row['enabled']):
+                    continue
+                section_totals[column] += Decimal(value)
+
+        summaries = []
+        for survey_response_id, report_totals in totals.items():
+            for section_id, section_totals in report_totals.items():
+                if section_id is not None:
+                    summaries.append(SectionSummary(survey_response_id = survey_response_id, survey_section = section_id, **section_totals))
+
+        with transaction.atomic():
+            self.filter(survey_response__in = survey_response_ids).delete()
+            self.bulk_create(summaries)
+
+        return totals
 
 
+    def rebuild_reports(self, survey_response_ids):
+        """ Rebuilds the section summaries and the stored totals of the given
+        reports, for when their question responses were scored in bulk.
+        """
+        from supasurvey.distribution import invalidate_score_distribution
+
+        totals = self.rebuild(survey_response_ids)
+
+        with transaction.atomic():
+            for survey_response_id, report_totals in totals.items():
+                SurveyResponse._base_manager.filter(id = survey_response_id).update(**get_report_totals(report_totals))
+
+        for survey_id, year in SurveyResponse._base_manager.filter(id__in = survey_response_ids).order_by().values_list('survey', 'year').distinct():
+            invalidate_score_distribution(survey_id, year)
+
+        return totals
+
+
+    def apply_delta(self, survey_response_id, survey_section, delta):
+        """ Adds the change in a section's score columns to its summary and to its
+        report with atomic F() updates, and recalculates the report completion
+        from the section summaries.
+
+        Returns the new report completion, or None when the report has no section
+        summaries yet and its totals have to be rebuilt.
+        """
+        with transaction.atomic():
+            summaries = self.filter(survey_response_id = survey_response_id)
+
+            updated = summaries.filter(survey_section = survey_section).update(
+                **dict((column, F(column) + value) for column, value in delta.items()))
+
+            if not updated:
+                return None
+
+            section_totals = dict((row['survey_section'], row) for row in summaries.values('survey_section', 'fields_total', 'fields_complete'))
+            completion = get_completion_for_sections(section_totals)
+
+            report_delta = dict((column, F(column) + value) for column, value in delta.items() if column in ('max_score', 'verified_score', 'computed_score'))
+            SurveyResponse._base_manager.filter(id = survey_response_id).update(completion = completion, **report_delta)
+
+        return completion
+
+
+
+class SectionSummary(models.Model):
+    """ Running score totals of one section of a report.
+
+    Question responses apply the change in their own scores to their section
+    summary as they are saved, so report totals never have to be recalculated
+    from every question.
+    """
+    objects = SectionSummaryManager()
+    survey_response = models.ForeignKey('supasurvey.SurveyResponse', verbose_name='Survey Response', related_name='section_summaries')
+    survey_section = models.IntegerField('section', choices=SURVEY_SECTION_CHOICES)
+
+    fields_total = models.DecimalField('fields total', max_digits=12, decimal_places=3, default=0)
+    fields_complete = models.DecimalField('fields complete', max_digits=12, decimal_places=3, default=0)
+    max_score = models.DecimalField('max score', max_digits=12, decimal_places=3, default=0)
+    verified_score = models.DecimalField('verified score', max_digits=12, decimal_places=3, default=0)
+    computed_score = models.DecimalField('computed score', max_digits=12, decimal_places=3, default=0)
+
+
+    class Meta:
+        verbose_name = 'Section Summary'
+        verbose_name_plural = 'Section Summaries'
+        unique_together = ('survey_response', 'survey_section')
+        ordering = ['survey_section']
+
+
+    def __unicode__(self):
+        return '%s-%s' % (self.survey_response, self.survey_section)
+
+
+
+class AnswerFactManager(models.Manager):
+    def get_facts(self, question_response_id, survey_response_id, survey_section, number, schema_data, response_data, schema_hash=None):
+        """ The answer facts of one question's responses, unsaved. """
+        from supasurvey.facts import get_answer_fact_plan
+
+        plan = get_answer_fact_plan(schema_data, key=schema_hash)
+
+        return [AnswerFact(question_response_id = question_response_id, survey_response_id = survey_response_id,
+            survey_section = survey_section, number = number, **fact) for fact in plan.get_facts(response_data)]
+
+
+    def sync(self, question_response, replace=True, old_totals=None):
+        """ Replaces the facts of a question with those of its current responses,
+        or only adds them with replace=False for a question that has none yet.
+        Disabled questions have none, their answers do not apply.
+        """
+        facts = []
+        if question_response.enabled:
+            facts = self.get_facts(question_response.id, question_response.survey_response_id,
+                question_response.survey_section, question_response.number, question_response.schema_data,
+                question_response.response_data, question_response.get_schema_hash())
+
+        old_facts = []
+
+        # the survey counters change with the facts, or not at all
+        with transaction.atomic():
+            if replace:
+                stored = self.filter(question_response_id = question_response.id)
+                old_facts = list(stored.values_list('answer_id', 'option', 'score'))
+                stored.delete()
+            if facts:
+                self.bulk_create(facts)
+
+            AnswerCounter.objects.apply_question(question_response, old_facts,
+                [(fact.answer_id, fact.option, fact.score) for fact in facts], old_totals)
+
+        return facts
+
+
+    def rebuild(self, question_response_ids):
+        """ Replaces the facts of the given questions, read with one values_list
+        query and written with one bulk insert.
+
+        Returns the number of facts written.
+        """
+        from supasurvey.jsonfields import load_json
+
+        rows = QuestionResponse.objects.filter(id__in = question_response_ids, enabled = True).order_by().values_list(
+            'id', 'survey_response', 'survey_section', 'number', 'schema', 'response_data')
+
+        facts = []
+        for question_response_id, survey_response_id, survey_section, number, schema_hash, response_data in rows.iterator():
+            schema_data = SchemaFragment.objects.get_cached(schema_hash) if schema_hash else None
+            facts.extend(self.get_facts(question_response_id, survey_response_id, survey_section, number,
+                schema_data, load_json(response_data), schema_hash))
+
+        with transaction.atomic():
+            self.filter(question_response__in = question_response_ids).delete()
+            self.bulk_create(facts)
+
+        return len(facts)
+
+
+
+class AnswerFact(models.Model):
+    """ One answered value of a question response, normalised out of its
+    response data so answers can be filtered and counted across reports in SQL.
+
+    There is a fact for every answer of every repeater row, and one for every
+    checked option of checkbox answers.  Saving a question response replaces its
+    facts whenever its responses change.
+    """
+    objects = AnswerFactManager()
+    question_response = models.ForeignKey('supasurvey.QuestionResponse', verbose_name='Question Response', related_name='answer_facts')
+    survey_response = models.ForeignKey('supasurvey.SurveyResponse', verbose_name='Survey Response', related_name='answer_facts')
+    survey_section = models.IntegerField('section', choices=SURVEY_SECTION_CHOICES)
+    number = models.IntegerField('question number')
+    row = models.IntegerField('row', default=0)
+    answer_id = models.IntegerField('answer')
+    answer_type = models.CharField('answer type', max_length=50, null=True, blank=True)
+
+    # the chosen option, and its position in the options counting from 1, or
+    # -1 when it is none of them
+    option = models.CharField('option', max_length=255, null=True, blank=True, db_index=True)
+    option_code = models.IntegerField('option code', null=True, blank=True)
+
+    # the answer to text and number answers, and the other text of radio-open answers
+    value = models.TextField('value', null=True, blank=True)
+    score = models.DecimalField('score', max_digits=12, decimal_places=3, null=True, blank=True, db_index=True)
+
+
+    class Meta:
+        verbose_name = 'Answer Fact'
+        verbose_name_plural = 'Answer Facts'
+        ordering = ['survey_section', 'number', 'row', 'answer_id']
+        index_together = [
+            ('survey_section', 'number', 'answer_id', 'option'),
+            ('survey_section', 'number', 'answer_id', 'score'),
+        ]
+
+
+    def __unicode__(self):
+        return '%s-%s-%s-%s' % (self.survey_response_id, self.survey_section, self.number, self.answer_id)
+
+
+
+# answered questions are counted in completion buckets of this many percent
+COMPLETION_BUCKET_SIZE = 10
+
+ANSWER_COUNTER_KINDS = (
+    ('option', 'Option'),
+    ('completion', 'Completion'),
+)
+
+
+def get_completion_bucket(completion):
+    if completion is None:
+        return None
+    return min(int(completion) // COMPLETION_BUCKET_SIZE * COMPLETION_BUCKET_SIZE, 100)
+
+
+
+class AnswerCounterManager(models.Manager):
+    def get_question_delta(self, old_facts, new_facts, old_totals, new_totals):
+        """ The change in the counters of one question between its old and new
+        answer facts, given as (answer_id, option, score) rows, and its old and
+        new score totals.
+
+        Options count the questions that chose them, once however many repeater
+        rows did, and sum the scores of their facts.  Questions that have facts
+        are counted in the bucket of their completion, with their score.
+
+        Returns (count, score_sum) changes keyed by (kind, answer_id, option, bucket).
+        """
+        delta = collections.defaultdict(lambda: [0, Decimal(0)])
+
+        for sign, facts, totals in ((-1, old_facts, old_totals), (1, new_facts, new_totals)):
+            options = set()
+            for answer_id, option, score in facts:
+                if option is None:
+                    continue
+                key = ('option', answer_id, option, 0)
+                if key not in options:
+                    options.add(key)
+                    delta[key][0] += sign
+                delta[key][1] += sign * (score or 0)
+
+            if facts and totals is not None:
+                bucket = get_completion_bucket(totals['completion'])
+                if bucket is not None:
+                    key = ('completion', 0, '', bucket)
+                    delta[key][0] += sign
+                    delta[key][1] += sign * totals['computed_score']
+
+        return dict((key, tuple(value)) for key, value in delta.items() if value[0] or value[1])
+
+
+    def apply_question(self, question_response, old_facts, new_facts, old_totals=None):
+        """ Applies the change in the answers of a question, from its stored
+        totals when given and otherwise those it was loaded with.  Deleted
+        reports are not counted.
+        """
+        if old_totals is None:
+            old_totals = question_response._totals_snapshot
+        old_totals = question_response.get_counted_totals(old_totals)
+        new_totals = question_response.get_counted_totals(question_response.get_totals())
+
+        delta = self.get_question_delta(old_facts, new_facts, old_totals, new_totals)
+        if delta:
+            # counted under the stored year of the report, locked against a
+            # concurrent change of it
+            survey_id, year, deleted = SurveyResponse._base_manager.select_for_update().filter(
+                id = question_response.survey_response_id).values_list('survey', 'year', 'deleted').get()
+
+            if not deleted:
+                self.apply_delta(survey_id, year, question_response.survey_section, question_response.number, delta)
+
+        return delta
+
+
+    def get_fact_deltas(self, facts, sign=1):
+        """ The counters of the questions of the given answer facts, as changes
+        adding them, or removing them with sign=-1, keyed by (survey_section,
+        number).  Totals are read from the stored questions, like rebuild does.
+        """
+        question_facts = collections.defaultdict(list)
+        for question_response_id, answer_id, option, score in facts.order_by().values_list('question_response', 'answer_id', 'option', 'score'):
+            question_facts[question_response_id].append((answer_id, option, score))
+
+        deltas = {}
+        if not question_facts:
+            return deltas
+
+        questions = QuestionResponse.objects.filter(id__in = question_facts.keys()).order_by().values_list(
+            'id', 'survey_section', 'number', 'completion', 'computed_score')
+
+        for question_response_id, survey_section, number, completion, computed_score in questions:
+            totals = {'completion': completion, 'computed_score': Decimal(computed_score or 0)}
+            if sign > 0:
+                delta = self.get_question_delta([], question_facts[question_response_id], None, totals)
+            else:
+                delta = self.get_question_delta(question_facts[question_response_id], [], totals, None)
+
+            if delta:
+                deltas[(survey_section, number)] = delta
+
+        return deltas
+
+
+    def move_report(self, survey_response_id, old, new):
+        """ Moves the counts of a report from its old (survey, year, deleted)
+        to its new one, when it changed year or was deleted or restored.
+        """
+        facts = AnswerFact.objects.filter(survey_response_id = survey_response_id)
+
+        for sign, (survey_id, year, deleted) in ((-1, old), (1, new)):
+            if deleted:
+                continue
+            for (survey_section, number), delta in self.get_fact_deltas(facts, sign).items():
+                self.apply_delta(survey_id, year, survey_section, number, delta)
+
+
+    def remove_question(self, question_response):
+        """ Removes the counts of a question that is about to be deleted. """
+        stored = SurveyResponse._base_manager.filter(id = question_response.survey_response_id).values_list(
+            'survey', 'year', 'deleted').first()
+        if stored is None or stored[2]:
+            return
+
+        facts = AnswerFact.objects.filter(question_response_id = question_response.id)
+        for (survey_section, number), delta in self.get_fact_deltas(facts, -1).items():
+            self.apply_delta(stored[0], stored[1], survey_section, number, delta)
+
+
+    def apply_delta(self, survey_id, year, survey_section, number, delta):
+        """ Adds the change in the counters of a question with atomic F()
+        updates, creating the counters it is the first to reach.
+        """
+        with transaction.atomic():
+            for (kind, answer_id, option, bucket), (count, score_sum) in delta.items():
+                counters = self.filter(survey_id = survey_id, year = year, kind = kind, survey_section = survey_section,
+                    number = number, answer_id = answer_id, option = option, bucket = bucket)
+
+                if counters.update(count = F('count') + count, score_sum = F('score_sum') + score_sum):
+                    continue
+
+                try:
+                    with transaction.atomic():
+                        self.create(survey_id = survey_id, year = year, kind = kind, survey_section = survey_section,
+                            number = number, answer_id = answer_id, option = option, bucket = bucket,
+                            count = count, score_sum = score_sum)
+                except IntegrityError, e:
+                    # created by a concurrent save since the update
+                    counters.update(count = F('count') + count, score_sum = F('score_sum') + score_sum)
+
+
+    def rebuild(self, survey, year=None):
+        """ Replaces the counters of a survey, or of one year of it, with counts
+        of its answer facts, for when facts or scores were written in bulk.
+        Deleted reports are not counted.
+        """
+        facts = AnswerFact.objects.filter(survey_response__survey = survey, survey_response__deleted = False)
+        if year is not None:
+            facts = facts.filter(survey_response__year = year)
+
+        counters = []
+
+        rows = facts.filter(option__isnull = False).order_by().values(
+            'survey_response__year', 'survey_section', 'number', 'answer_id', 'option').annotate(
+            questions = models.Count('question_response', distinct = True), score_sum = models.Sum('score'))
+
+        for row in rows:
+            counters.append(AnswerCounter(survey = survey, year = row['survey_response__year'], kind = 'option',
+                survey_section = row['survey_section'], number = row['number'], answer_id = row['answer_id'],
+                option = row['option'], count = row['questions'], score_sum = row['score_sum'] or 0))
+
+        completion = {}
+        questions = QuestionResponse.objects.filter(id__in = facts.values('question_response')).order_by().values_list(
+            'survey_response__year', 'survey_section', 'number', 'completion', 'computed_score')
+
+        for question_year, survey_section, number, question_completion, computed_score in questions.iterator():
+            bucket = get_completion_bucket(question_completion)
+            if bucket is not None:
+                counter = completion.setdefault((question_year, survey_section, number, bucket), [0, Decimal(0)])
+                counter[0] += 1
+                counter[1] += Decimal(computed_score or 0)
+
+        for (question_year, survey_section, number, bucket), (count, score_sum) in completion.items():
+            counters.append(AnswerCounter(survey = survey, year = question_year, kind = 'completion',
+                survey_section = survey_section, number = number, bucket = bucket, count = count, score_sum = score_sum))
+
+        with transaction.atomic():
+            stale = self.filter(survey = survey)
+            if year is not None:
+                stale = stale.filter(year = year)
+            stale.delete()
+            self.bulk_create(counters)
+
+        return counters
+
+
+
+class AnswerCounter(models.Model):
+    """ A running count of the answers to one question of a survey in a year.
+
+    Option counters count the questions that chose an option, completion
+    counters the answered questions in a completion bucket, and both sum their
+    scores.  Saving a question response applies the change in its answers, so
+    survey statistics read a few counters rather than every response.
+    """
+    objects = AnswerCounterManager()
+    survey = models.ForeignKey('supasurvey.Survey', verbose_name='survey', related_name='answer_counters')
+    year = models.IntegerField('year', choices=YEAR_CHOICES, null=True, blank=True)
+    kind = models.CharField('kind', choices=ANSWER_COUNTER_KINDS, max_length=20)
+    survey_section = models.IntegerField('section', choices=SURVEY_SECTION_CHOICES)
+    number = models.IntegerField('question number')
+    answer_id = models.IntegerField('answer', default=0)
+    option = models.CharField('option', max_length=255, default='', blank=True)
+    bucket = models.IntegerField('completion bucket', default=0)
+
+    count = models.IntegerField('count', default=0)
+    score_sum = models.DecimalField('score sum', max_digits=14, decimal_places=3, default=0)
+
+
+    class Meta:
+        verbose_name = 'Answer Counter'
+        verbose_name_plural = 'Answer Counters'
+        unique_together = ('survey', 'year', 'kind', 'survey_section', 'number', 'answer_id', 'option', 'bucket')
+        ordering = ['survey_section', 'number', 'kind', 'answer_id', 'bucket']
+
+
+    def __unicode__(self):
+        return '%s-%s-%s-%s-%s' % (self.survey_id, self.year, self.kind, self.survey_section, self.number)
+
+
+
+def get_empty_totals():
+    return dict((column, Decimal(0)) for column in SCORE_COLUMNS)
+
+
+
+def get_completion_for_totals(section_totals):
+    total = Decimal(section_totals['fields_total'])
+    complete = Decimal(section_totals['fields_complete'])
+
+    try:
+        percentage = (complete / total) * 100
+    except InvalidOperation, e:
+        percentage = Decimal(0)
+    except DivisionByZero, e:
+        percentage = Decimal(0)
+
+    return percentage
+
+
+
+def get_report_totals(totals):
+    """ The stored totals of a report, from the totals of its sections. """
+    report_totals = {'completion': get_completion_for_sections(totals)}
+
+    for column in ('max_score', 'verified_score', 'computed_score'):
+        total = Decimal(0)
+        for section_id, section_key in SURVEY_SECTION_CHOICES:
+            if section_id in totals:
+                total += Decimal(totals[section_id][column])
+        report_totals[column] = total.quantize(THREEPLACES)
+
+    if report_totals['computed_score'] > report_totals['max_score']:
+        report_totals['computed_score'] = report_totals['max_score']
+
+    return report_totals
+
+
+
+def get_completion_for_sections(totals):
+    """ Report completion is the average completion of every section. """
+    total = Decimal(0)
+
+    for section_id, section_key in SURVEY_SECTION_CHOICES:
+        if section_id in totals:
+            total += get_completion_for_totals(totals[section_id])
+
+    percentage = (total / Decimal(len(SURVEY_SECTION_CHOICES)))
+
+    return percentage.quantize(NOPLACES)
+
+
+
+def upload_to(instance, name):
+    report_id = instance.report_id
+    return settings.REPORT_ROOT + '/%s/%s' % (report_id, name)
+
+
+
+class UploadedFile(models.Model):
     upload = models.FileField(upload_to=upload_to, max_length=400)
     question_response = models.ForeignKey('QuestionResponse', verbose_name='question_responses', related_name='uploaded_files')
     created_at = models.DateTimeField('created', null=True, blank=True, default=datetime.now)
@@ -895,12 +2158,28 @@ class UploadedFile(models.Model):
         if not self.id:
             self.created_at = datetime.today()
 
-        return super(UploadedFile, self).save(*args, **kwargs)
+        super(UploadedFile, self).save(*args, **kwargs)
+        invalidate_question_fragments(self.question_response_id)
+
+
+    @property
+    def report_id(self):
+        """ Set directly when the files of a report are prefetched, otherwise looked
+        up through the question response.
+        """
+        try:
+            return self._report_id
+        except AttributeError:
+            return self.question_response.survey_response_id
+
+
+    @report_id.setter
+    def report_id(self, value):
+        self._report_id = value
 
 
     def get_absolute_url(self):
-        report_id = self.question_response.survey_response.id
-        return settings.REPORT_URL + '%s/%s' % (report_id, self.basename)
+        return settings.REPORT_URL + '%s/%s' % (self.report_id, self.basename)
 
 
 def post_survey_create(sender, instance, created, *args, **kwargs):
@@ -913,5 +2192,16 @@ def post_question_create(sender, instance, created, *args, **kwargs):
         instance.post_create()
 
 
+def pre_question_delete(sender, instance, *args, **kwargs):
+    # the answer facts are deleted before the question
+    AnswerCounter.objects.remove_question(instance)
+
+
+def post_file_delete(sender, instance, *args, **kwargs):
+    invalidate_question_fragments(instance.question_response_id)
+
+
 post_save.connect(post_survey_create, sender=SurveyResponse)
 post_save.connect(post_question_create, sender=QuestionResponse)
+pre_delete.connect(pre_question_delete, sender=QuestionResponse)
+post_delete.connect(post_file_delete, sender=UploadedFile)
@@ -0,0 +1,405 @@
+from decimal import Decimal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from supasurvey.fragments import invalidate_question_fragments_many
+from supasurvey.jsonfields import load_json
+from supasurvey.models import QuestionResponse, SchemaFragment, SectionSummary, AnswerFact, AnswerCounter, Survey
+from supasurvey.scoring import CHOICE_TYPES, ScoringPlan
+from supasurvey.utils import get_schema_handler, get_schema_version
+
+
+RESCORE_CHUNK_SIZE = 2000
+
+# reports whose totals are rebuilt with each grouped aggregate query
+REBUILD_BATCH_SIZE = 500
+
+# scores are counted in thousandths, the precision of the score columns
+POINTS = 1000
+
+RESCORED_COLUMNS = ('fields_total', 'fields_complete', 'completion', 'max_score', 'computed_score')
+
+# the columns read for every question response, the rescored ones from index 5
+READ_COLUMNS = ('id', 'survey_response', 'schema', 'response_data', 'enabled') + RESCORED_COLUMNS + (
+    'survey_response__survey', 'survey_section', 'number')
+
+# the code of every answer value that scores nothing
+NO_POINTS = 0
+
+
+
+def to_points(value):
+    """ Exact thousandths of a score, or None when it has more decimal places. """
+    points = Decimal(value) * POINTS
+    if points != points.to_integral_value():
+        return None
+    return int(points)
+
+
+def from_points(points):
+    return Decimal(int(points)).scaleb(-3)
+
+
+def to_decimal(value):
+    if value is None:
+        return None
+    return Decimal(str(value))
+
+
+class CodeBook(object):
+    """ The points of every scoring answer value, looked up by integer code. """
+
+    def __init__(self):
+        self.points = [0]
+
+
+    def add(self, points):
+        self.points.append(points)
+        return len(self.points) - 1
+
+
+    def as_array(self):
+        return numpy.array(self.points, dtype=numpy.int64)
+
+
+
+class AnswerEncoder(object):
+    """ Turns the stored value of one answer into the codes of the points it
+    scores, following AnswerScoring.score.
+    """
+
+    __slots__ = ('type', 'option_codes', 'correct', 'correct_code', 'incorrect_code')
+
+    def __init__(self, answer, codebook):
+        self.type = answer.type
+        self.option_codes = None
+        self.correct = answer.correct
+
+        if answer.option_scores is not None:
+            self.option_codes = dict((option, codebook.add(to_points(score))) for option, score in answer.option_scores.items())
+        else:
+            self.correct_code = codebook.add(to_points(answer.max_score))
+            self.incorrect_code = codebook.add(to_points(answer.min_score))
+
+
+    def encode(self, field_value):
+        option_codes = self.option_codes
+
+        if option_codes is not None:
+            if self.type in CHOICE_TYPES:
+                if isinstance(field_value, (list, tuple)) and (len(field_value) == 2):
+                    field_value = field_value[0]
+                if isinstance(field_value, basestring):
+                    return [option_codes.get(field_value, NO_POINTS)]
+
+            elif self.type == 'checkbox' and isinstance(field_value, list):
+                return [option_codes.get(value, NO_POINTS) for value in field_value if isinstance(value, basestring)]
+
+            return []
+
+        if self.correct:
+            value = field_value[0] if isinstance(field_value, (list, tuple)) else field_value
+            if isinstance(value, basestring) and value.lower() == self.correct:
+                return [self.correct_code]
+
+        return [self.incorrect_code]
+
+
+
+class PlanEncoder(object):
+    """ A scoring plan with its answers encoded against a code book.
+
+    Plans whose scores are not whole thousandths can not be counted exactly in
+    integers, and are scored with the plan itself instead.
+    """
+
+    def __init__(self, plan, codebook):
+        self.plan = plan
+        self.fields_total = int(plan.fields_total)
+        self.max_points = to_points(plan.max_score)
+        self.answers = None
+
+        points = [answer.min_score for answer in plan.answers.values()] + [answer.max_score for answer in plan.answers.values()]
+        for answer in plan.answers.values():
+            if answer.option_scores:
+                points.extend(answer.option_scores.values())
+
+        if all(to_points(score) is not None for score in points):
+            self.answers = dict((answer_id, AnswerEncoder(answer, codebook)) for answer_id, answer in plan.answers.items())
+
+
+
+class RescoreResult(object):
+    """ What a rescoring run found and changed. """
+
+    def __init__(self):
+        self.questions = 0
+        self.changed = 0
+        self.survey_response_ids = set()
+        self.changes = []
+
+
+    def update(self, other):
+        self.questions += other.questions
+        self.changed += other.changed
+        self.survey_response_ids.update(other.survey_response_ids)
+        self.changes.extend(other.changes)
+
+
+
+class Rescorer(object):
+    """ Rescores question responses in bulk.
+
+    Question responses are read in chunks with values_list, and every answer
+    value is encoded as the integer code of the points it scores against the
+    compiled scoring plan of the current schema of its question in the survey,
+    so changed scoring rules apply.  Scores, completion and max score of the
+    whole chunk are then calculated as numpy array operations in thousandths,
+    so they match QuestionResponse.calculate_scores exactly.  Only the changed
+    rows are written, pointed at the fragment of the current schema, and the
+    totals of their reports and the survey counters are rebuilt in bulk.
+
+    Run with dry_run to only collect the changes, as
+    (question response id, column, stored value, new value).  The workers of
+    the rescore_survey command pass rebuild_counters=False, and the command
+    rebuilds the counters once.
+    """
+
+    def __init__(self, chunk_size=RESCORE_CHUNK_SIZE, dry_run=False, rebuild_counters=True):
+        if numpy is None:
+            raise ImproperlyConfigured('Rescoring in bulk requires numpy.')
+
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.rebuild_counters = rebuild_counters
+        self.codebook = CodeBook()
+        self.encoders = {}
+        self.schemas = {}
+
+
+    def get_schema(self, survey_id, survey_section, number, schema_id):
+        """ The hash and data of the current schema of a question, or of the
+        fragment it stores when the survey no longer has the question.
+        """
+        key = (survey_id, survey_section, number)
+        schema = self.schemas.get(key, None)
+
+        if schema is None:
+            questionsets = get_schema_handler(survey_id).get_questionsets(survey_section, deep=False) or {}
+            schema_data = questionsets.get(unicode(number), None)
+            if schema_data is not None:
+                schema = self.schemas[key] = (get_schema_version(schema_data), schema_data)
+
+        if schema is None:
+            return schema_id, SchemaFragment.objects.get_cached(schema_id) if schema_id is not None else None
+        return schema
+
+
+    def get_encoder(self, schema_hash, schema_data):
+        """ The plan encoder of a schema, so schemas shared by many questions
+        are compiled once.
+        """
+        encoder = self.encoders.get(schema_hash, None)
+        if encoder is None:
+            encoder = self.encoders[schema_hash] = PlanEncoder(ScoringPlan(schema_data), self.codebook)
+
+        return encoder
+
+
+    def rescore(self, queryset, callback=None):
+        """ Rescores the question responses in queryset, calling callback with the
+        result of every chunk.
+        """
+        result = RescoreResult()
+        queryset = queryset.order_by('id')
+        last_id = 0
+
+        while True:
+            rows = list(queryset.filter(id__gt = last_id).values_list(*READ_COLUMNS)[:self.chunk_size].iterator())
+            if not rows:
+                break
+
+            last_id = rows[-1][0]
+            chunk_result = self.rescore_rows(rows)
+            result.update(chunk_result)
+
+            if callback is not None:
+                callback(chunk_result)
+
+        if not self.dry_run:
+            survey_response_ids = sorted(result.survey_response_ids)
+            for start in range(0, len(survey_response_ids), REBUILD_BATCH_SIZE):
+                SectionSummary.objects.rebuild_reports(survey_response_ids[start:start + REBUILD_BATCH_SIZE])
+
+            # the completion counters follow the rescored questions
+            if result.changed and self.rebuild_counters:
+                for survey in Survey.objects.filter(submissions__in = survey_response_ids).distinct():
+                    AnswerCounter.objects.rebuild(survey)
+
+        return result
+
+
+    def rescore_rows(self, rows):
+        count = len(rows)
+
+        fields_total = numpy.zeros(count, dtype=numpy.int64)
+        max_points = numpy.zeros(count, dtype=numpy.int64)
+        exact = numpy.ones(count, dtype=bool)
+        fallback_points = numpy.zeros(count, dtype=numpy.int64)
+
+        codes, code_questions = [], []
+        row_counts, row_questions = [], []
+        schemas = []
+
+        for index, row in enumerate(rows):
+            schema_hash, schema_data = self.get_schema(row[10], row[11], row[12], row[2])
+            schemas.append((schema_hash, schema_data))
+
+            # disabled questions score nothing and have no completion
+            if not row[4]:
+                continue
+
+            encoder = self.get_encoder(schema_hash, schema_data)
+            response_data = load_json(row[3])
+
+            max_points[index] = encoder.max_points
+            if not isinstance(response_data, list):
+                continue
+
+            fields_total[index] = encoder.fields_total
+
+            if encoder.answers is None:
+                exact[index] = False
+                fallback_points[index] = to_points(encoder.plan.get_computed_score(response_data))
+
+            scored_answers = encoder.plan.scored_answers
+            answers = encoder.answers
+
+            for response in response_data:
+                completed = 0
+                for field_id, field_value in response.items():
+                    if not field_value:
+                        continue
+
+                    answer_id = field_id.split('_')[-1]
+                    if answer_id in scored_answers:
+                        completed += 1
+
+                    if answers is not None:
+                        answer = answers.get(answer_id, None)
+                        if answer is not None:
+                            answer_codes = answer.encode(field_value)
+                            codes.extend(answer_codes)
+                            code_questions.extend([index] * len(answer_codes))
+
+                row_counts.append(completed)
+                row_questions.append(index)
+
+        points = self.codebook.as_array()
+
+        computed_points = numpy.bincount(numpy.array(code_questions, dtype=numpy.int64),
+                weights = points[numpy.array(codes, dtype=numpy.int64)], minlength = count)
+        computed_points = numpy.rint(computed_points).astype(numpy.int64)
+        computed_points = numpy.where(exact, computed_points, fallback_points)
+        computed_points = numpy.minimum(computed_points, max_points)
+
+        fields_complete = numpy.zeros(count, dtype=numpy.int64)
+        if row_questions:
+            numpy.maximum.at(fields_complete, numpy.array(row_questions, dtype=numpy.int64), numpy.array(row_counts, dtype=numpy.int64))
+
+        # completion in thousandths of a percent, rounded half to even like Decimal.quantize
+        numerator = fields_complete * 100 * POINTS
+        denominator = numpy.where(fields_total > 0, fields_total, 1)
+        completion, remainder = numpy.divmod(numerator, denominator)
+        completion += (2 * remainder > denominator) | ((2 * remainder == denominator) & (completion % 2 == 1))
+
+        return self.write(rows, schemas, {
+            'fields_total': fields_total * POINTS,
+            'fields_complete': fields_complete * POINTS,
+            'completion': numpy.where(fields_total > 0, completion, -1),
+            'max_score': max_points,
+            'computed_score': computed_points,
+        })
+
+
+    def write(self, rows, schemas, scores):
+        """ Writes the rows whose scores or schema changed.  Django 1.7 has no
+        bulk update, so each changed row is updated on its own, in one
+        transaction per chunk.  The answer facts of the rows pointed at another
+        schema are rebuilt, as their scores follow the schema.
+        """
+        result = RescoreResult()
+        result.questions = len(rows)
+        updates = []
+        repointed = []
+
+        for index, row in enumerate(rows):
+            values = {}
+
+            schema_hash, schema_data = schemas[index]
+            if schema_hash != row[2]:
+                values['schema'] = schema_hash
+                if self.dry_run:
+                    result.changes.append((row[0], 'schema', row[2], schema_hash))
+
+            for offset, column in enumerate(RESCORED_COLUMNS):
+                points = scores[column][index]
+                value = None if points < 0 else from_points(points)
+                stored = row[5 + offset]
+
+                if to_decimal(stored) != value:
+                    values[column] = value
+                    if self.dry_run:
+                        result.changes.append((row[0], column, stored, value))
+
+            if values:
+                updates.append((index, values))
+                result.survey_response_ids.add(row[1])
+
+        result.changed = len(updates)
+
+        if updates and not self.dry_run:
+            with transaction.atomic():
+                for index, values in updates:
+                    question_response_id = rows[index][0]
+                    if 'schema' in values:
+                        # stores the fragment of a schema no question used yet
+                        values['schema'] = SchemaFragment.objects.get_for_data(schemas[index][1])
+                        repointed.append(question_response_id)
+                    QuestionResponse.objects.filter(id = question_response_id).update(**values)
+
+                if repointed:
+                    AnswerFact.objects.rebuild(repointed)
+
+            # rendered fragments show the scores
+            invalidate_question_fragments_many([rows[index][0] for index, values in updates])
+
+        return result
+
+
+
+def rescore_survey(survey, **kwargs):
+    """ Rescores every question response of a survey in bulk. """
+    callback = kwargs.pop('callback', None)
+    queryset = QuestionResponse.objects.filter(survey_response__survey = survey)
+
+    return Rescorer(**kwargs).rescore(queryset, callback)
+
+
+
+def rescore_reports(survey_response_ids, chunk_size=RESCORE_CHUNK_SIZE, dry_run=False):
+    """ Rescores every question response of the given reports in bulk.  Used as
+    the unit of work of the rescore_survey command, in a worker process, so the
+    survey counters are left for the command to rebuild once.
+    """
+    queryset = QuestionResponse.objects.filter(survey_response__in = survey_response_ids)
+    result = Rescorer(chunk_size=chunk_size, dry_run=dry_run, rebuild_counters=False).rescore(queryset)
+    result.survey_response_ids = set(survey_response_ids)
+
+    return result
@@ -0,0 +1,191 @@
+import logging
+
+from decimal import Decimal, InvalidOperation
+
+from supasurvey.utils import LRUCache, get_schema_version
+
+logger = logging.getLogger(__name__)
+
+THREEPLACES = Decimal(10) ** -3
+ZERO = Decimal(0)
+
+SCORING_PLAN_CACHE_SIZE = 512
+
+CHOICE_TYPES = ('radio', 'radio-open', 'radio-yes-no')
+
+
+
+class AnswerScoring(object):
+    """ The scoring rules of a single answer, parsed once. """
+
+    __slots__ = ('id', 'type', 'min_score', 'max_score', 'correct', 'option_scores')
+
+    def __init__(self, answer_id, answer_dct):
+        self.id = answer_id
+        self.type = answer_dct.get('type')
+        self.min_score = Decimal(answer_dct.get('minscore', '0'))
+        self.max_score = Decimal(answer_dct.get('maxscore', '0'))
+        self.correct = answer_dct.get('correct', False)
+        self.option_scores = None
+
+        field_options = answer_dct.get('options', False)
+        field_scoring = answer_dct.get('scoring', False)
+
+        if field_scoring and field_options:
+            self.option_scores = {}
+            for option, score in zip(field_options.split('|'), field_scoring.split('|')):
+                # the first matching option wins, as with list.index
+                if option in self.option_scores:
+                    continue
+
+                try:
+                    self.option_scores[option] = Decimal(score)
+                except InvalidOperation, e:
+                    # a malformed score only costs its own option
+                    logger.warning('Ignoring invalid score %r of option %r of answer %s', score, option, answer_id)
+                    self.option_scores[option] = ZERO
+
+        if self.correct:
+            self.correct = self.correct.lower()
+
+
+    def get_choice_score(self, field_value):
+        option_scores = self.option_scores
+
+        if self.type in CHOICE_TYPES:
+            if isinstance(field_value, (list, tuple)) and (len(field_value) == 2):
+                value = field_value[0]
+            else:
+                value = field_value
+
+            if isinstance(value, basestring):
+                return option_scores.get(value, ZERO)
+
+        elif self.type == 'checkbox':
+            assert isinstance(field_value, list), '%s is not list' % type(field_value)
+            _score = ZERO
+            for value in field_value:
+                if isinstance(value, basestring):
+                    _score += option_scores.get(value, ZERO)
+            return _score
+
+        return ZERO
+
+
+    def get_correct_score(self, field_value):
+        if isinstance(field_value, (list, tuple)):
+            v = field_value[0]
+        else:
+            v = field_value
+
+        if v.lower() == self.correct:
+            return self.max_score
+        return self.min_score
+
+
+    def score(self, field_value):
+        if self.option_scores is not None:
+            return self.get_choice_score(field_value)
+        elif self.correct:
+            return self.get_correct_score(field_value)
+        return self.min_score
+
+
+
+class ScoringPlan(object):
+    """ A questionset schema compiled for scoring.
+
+    Holds the parsed scoring rules of every answer, the ids of the answers that
+    count towards completion and the maximum score, so scoring a response does
+    not have to walk or re-parse the schema.
+    """
+
+    def __init__(self, schema_data):
+        answers = {}
+        scored_answers = []
+        max_score = ZERO
+
+        if isinstance(schema_data, dict):
+            answer_dcts = schema_data.get('answers') or {}
+        else:
+            answer_dcts = {}
+
+        for answer_id, answer_dct in answer_dcts.items():
+            answer_id = unicode(answer_id)
+            answers[answer_id] = AnswerScoring(answer_id, answer_dct)
+
+            if answer_dct.get('type') != 'file-multiple':
+                scored_answers.append(answer_id)
+
+            maxscore = answer_dct.get('maxscore', None)
+            if maxscore:
+                max_score += Decimal(maxscore)
+
+        self.answers = answers
+        self.scored_answers = frozenset(scored_answers)
+        self.fields_total = Decimal(len(scored_answers))
+        self.max_score = max_score.quantize(THREEPLACES)
+
+
+    def get_answer_id(self, field_id):
+        return field_id.split('_')[-1]
+
+
+    def get_score(self, field_id, field_value):
+        answer = self.answers.get(self.get_answer_id(field_id), None)
+        if answer is None:
+            return ZERO
+        return answer.score(field_value)
+
+
+    def get_computed_score(self, response_data):
+        total_score = ZERO
+
+        if not isinstance(response_data, list):
+            return total_score
+
+        for response in response_data:
+            for field_id, field_value in response.items():
+                if field_value:
+                    total_score += self.get_score(field_id, field_value)
+
+        return total_score.quantize(THREEPLACES)
+
+
+    def get_fields_complete(self, response_data):
+        if not isinstance(response_data, list):
+            return ZERO
+
+        scored_answers = self.scored_answers
+        completed = 0
+
+        for response in response_data:
+            fields_completed = 0
+            for field_id, field_value in response.items():
+                if field_value and self.get_answer_id(field_id) in scored_answers:
+                    fields_completed += 1
+
+            completed = max(completed, fields_completed)
+
+        return Decimal(completed)
+
+
+    def get_fields_total(self, response_data):
+        if not isinstance(response_data, list):
+            return ZERO
+        return self.fields_total
+
+
+
+_plans = LRUCache(SCORING_PLAN_CACHE_SIZE)
+
+def get_scoring_plan(schema_data, key=None):
+    """ Returns the cached scoring plan for a questionset schema.
+    Plans are keyed by the content hash of the schema, unless the caller already
+    knows it, and the least recently used plans are dropped once the cache is full.
+    """
+
+    if key is None:
+        key = get_schema_version(schema_data)
+
+    return _plans.get_or_create(key, lambda: ScoringPlan(schema_data))
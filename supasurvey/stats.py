@@ -0,0 +1,52 @@
+import collections
+
+from decimal import Decimal
+
+from supasurvey.dependencies import get_question_key
+from supasurvey.models import AnswerCounter
+
+
+
+def get_survey_stats(survey, year=None):
+    """ The answer statistics of a survey, or of one year of it, read from its
+    counters with a single query however many reports there are.
+
+    Keyed by question, every entry holds the number of answered questions and
+    their score sum, the answered questions per completion bucket, and the
+    count and score sum of every chosen option per answer id.
+    """
+    counters = AnswerCounter.objects.filter(survey = survey)
+    if year is not None:
+        counters = counters.filter(year = year)
+
+    stats = collections.OrderedDict()
+
+    rows = counters.order_by('survey_section', 'number', 'kind', 'answer_id', 'option', 'bucket').values_list(
+        'survey_section', 'number', 'kind', 'answer_id', 'option', 'bucket', 'count', 'score_sum')
+
+    for survey_section, number, kind, answer_id, option, bucket, count, score_sum in rows:
+        question = stats.get(get_question_key(survey_section, number), None)
+        if question is None:
+            question = stats[get_question_key(survey_section, number)] = {
+                'answered': 0,
+                'score_sum': Decimal(0),
+                'completion': collections.OrderedDict(),
+                'answers': collections.OrderedDict(),
+            }
+
+        score_sum = Decimal(score_sum or 0)
+
+        if kind == 'completion':
+            completion = question['completion'].setdefault(bucket, {'count': 0, 'score_sum': Decimal(0)})
+            completion['count'] += count
+            completion['score_sum'] += score_sum
+
+            question['answered'] += count
+            question['score_sum'] += score_sum
+        else:
+            answer = question['answers'].setdefault(answer_id, collections.OrderedDict())
+            option_stats = answer.setdefault(option, {'count': 0, 'score_sum': Decimal(0)})
+            option_stats['count'] += count
+            option_stats['score_sum'] += score_sum
+
+    return stats
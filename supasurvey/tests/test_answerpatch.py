@@ -0,0 +1,118 @@
+import json
+
+from decimal import *
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from supasurvey.forms import get_formset_class
+from supasurvey.models import SurveyResponse, QuestionResponse
+from supasurvey.tests.test_surveyresponse import create_survey
+from supasurvey.views import answer_patch
+
+
+
+def owner_can_patch(user, survey_response):
+    # the test reports belong to the owner
+    return user.username == 'owner'
+
+
+
+class AnswerPatchTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+        self.survey_response.question_responses.get(survey_section=2, number=1).patch_answer('questionset_1__answer_1', 'Yes')
+        self.question_response = QuestionResponse.objects.get(survey_response=self.survey_response, survey_section=2, number=2)
+
+
+    def test_patch_scores_answer(self):
+        totals = self.question_response.patch_answer('questionset_2__answer_4', ['Smell', 'Teeth'])
+
+        self.assertEqual(self.question_response.response_data, [{'questionset_2__answer_4': ['Smell', 'Teeth']}])
+        self.assertEqual(totals['question']['computed_score'], Decimal('2.000'))
+        self.assertEqual(totals['question']['fields_complete'], 1)
+        self.assertEqual(totals['report']['computed_score'], Decimal('3.000'))
+
+        totals = self.question_response.patch_answer('questionset_2__answer_4', ['Smell'])
+        self.assertEqual(totals['question']['computed_score'], Decimal('1.000'))
+
+        question_response = QuestionResponse.objects.get(pk=self.question_response.pk)
+        self.assertEqual(question_response.computed_score, Decimal('1.000'))
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_response.pk).computed_score, Decimal('2.000'))
+
+        question_response.calculate_scores()
+        self.assertEqual(question_response.computed_score, Decimal('1.000'))
+
+
+    def test_patch_repeater_rows(self):
+        self.question_response.patch_answer('questionset_2__answer_1', 'Fewer baths')
+        self.question_response.patch_answer('questionset_2__answer_1', 'More walks', row=1)
+
+        self.assertEqual([row['questionset_2__answer_1'] for row in self.question_response.response_data], ['Fewer baths', 'More walks'])
+        self.assertRaises(ValidationError, self.question_response.patch_answer, 'questionset_2__answer_1', 'Treats', row=5)
+
+
+    def test_patch_single_row(self):
+        question_response = self.survey_response.question_responses.get(survey_section=2, number=1)
+
+        self.assertRaises(ValidationError, question_response.patch_answer, 'questionset_1__answer_1', 'No', row=1)
+        self.assertEqual(QuestionResponse.objects.get(pk=question_response.pk).response_data, [{'questionset_1__answer_1': 'Yes'}])
+
+
+    def test_invalid_patch(self):
+        self.assertRaises(ValidationError, self.question_response.patch_answer, 'questionset_2__answer_9', 'Yes')
+        self.assertRaises(ValidationError, self.question_response.patch_answer, 'questionset_2__answer_4', ['Wings'])
+        self.assertEqual(self.question_response.response_data, [])
+
+
+    def test_disabled_question_rejected(self):
+        self.survey_response.question_responses.get(survey_section=2, number=1).patch_answer('questionset_1__answer_1', 'No')
+
+        question_response = QuestionResponse.objects.get(pk=self.question_response.pk)
+        self.assertFalse(question_response.enabled)
+
+        self.assertRaises(ValidationError, question_response.patch_answer, 'questionset_2__answer_4', ['Smell', 'Teeth'])
+        self.assertEqual(QuestionResponse.objects.get(pk=self.question_response.pk).response_data, [])
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_response.pk).computed_score, 0)
+
+
+    def patch(self, user, patch):
+        request = RequestFactory().post('/', json.dumps(patch), content_type='application/json')
+        request.user = user
+        return answer_patch(request, id=self.survey_response.id, section_id=2, number=2)
+
+
+    @override_settings(SUPASURVEY_CAN_PATCH='supasurvey.tests.test_answerpatch.owner_can_patch')
+    def test_view(self):
+        owner = User.objects.create_user('owner', 'owner@example.com', 'woof')
+
+        response = self.patch(owner, {'questionset_2__answer_4': ['Coat']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['question']['computed_score'], '1.000')
+
+        response = self.patch(owner, {'questionset_2__answer_4': ['Wings']})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.patch(owner, {'questionset_2__answer_4': ['Coat'], 'row': 3})
+        self.assertEqual(response.status_code, 400)
+
+
+    @override_settings(SUPASURVEY_CAN_PATCH='supasurvey.tests.test_answerpatch.owner_can_patch')
+    def test_view_denies_other_users(self):
+        user = User.objects.create_user('neighbour', 'neighbour@example.com', 'woof')
+
+        response = self.patch(user, {'questionset_2__answer_4': ['Coat']})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(QuestionResponse.objects.get(pk=self.question_response.pk).response_data, [])
+
+
+    def test_view_denies_by_default(self):
+        user = User.objects.create_user('verifier', 'verifier@example.com', 'woof')
+        self.assertEqual(self.patch(user, {'questionset_2__answer_4': ['Coat']}).status_code, 403)
+
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'woof')
+        self.assertEqual(self.patch(user, {'questionset_2__answer_4': ['Coat']}).status_code, 200)
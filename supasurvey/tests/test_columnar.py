@@ -0,0 +1,96 @@
+import os, json, shutil, tempfile
+
+from StringIO import StringIO
+
+import numpy
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from supasurvey.columnar import ColumnarExport, OTHER_CODE, BITMASK_OPTIONS
+from supasurvey.models import SurveyResponse
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+
+
+
+class ColumnarExportTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(3)]
+        SurveyResponse.objects.create(survey=self.survey, year=2014)
+
+        first, second = self.survey_responses[:2]
+        answer(first, 1, 1, [{'questionset_1__answer_1': 'Rex'}])
+        answer(first, 1, 2, [{'questionset_2__answer_1': 'Sad'}])
+        answer(first, 1, 7, [{'questionset_7__answer_1': ['Other', 'Purple']}])
+        answer(first, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        answer(first, 2, 2, [{'questionset_2__answer_4': ['Smell']}, {'questionset_2__answer_4': ['Teeth', 'Coat']}])
+
+        answer(second, 1, 7, [{'questionset_7__answer_1': ['Blue', '']}])
+        answer(second, 2, 2, [{'questionset_2__answer_4': ['Smell']}])
+
+        self.arrays, self.manifest = ColumnarExport(self.survey, year=2015, chunk_size=2).build()
+
+
+    def column(self, array, name):
+        for meta in self.manifest['arrays'][array]:
+            if meta['name'] == name:
+                return self.arrays[array][:, meta['index']]
+        raise KeyError(name)
+
+
+    def test_dense_columns(self):
+        self.assertEqual(self.manifest['rows'], 3)
+        self.assertEqual(self.arrays['report_id'].tolist(), [survey_response.id for survey_response in self.survey_responses])
+        self.assertEqual(self.arrays['codes'].dtype, numpy.int64)
+        self.assertEqual(self.arrays['numbers'].dtype, numpy.float64)
+
+        self.assertEqual(self.column('codes', '1-2:questionset_2__answer_1').tolist(), [3, 0, 0])
+        self.assertEqual(self.column('codes', '1-7:questionset_7__answer_1').tolist(), [OTHER_CODE, 2, 0])
+        self.assertEqual(self.column('text', '1-7:questionset_7__answer_1:other').tolist(), ['Purple', None, None])
+        self.assertEqual(self.column('text', '1-1:questionset_1__answer_1').tolist(), ['Rex', None, None])
+
+        # the checked options of every repeater row, Smell, Teeth and Coat
+        self.assertEqual(self.column('codes', '2-2:questionset_2__answer_4').tolist(), [1 | 4 | 16, 0, 0])
+
+        self.assertEqual(self.column('numbers', '2-2:computed_score').tolist()[0], 3.0)
+        self.assertEqual(self.column('numbers', 'computed_score').tolist(), [4.0, 0.0, 0.0])
+
+        # disabled questions are missing
+        self.assertTrue(numpy.isnan(self.column('numbers', '2-2:computed_score')[1]))
+
+
+    def test_many_checkbox_options(self):
+        # more options than bits in a code get a flag column per option
+        options = ['Trick %s' % i for i in range(BITMASK_OPTIONS + 2)]
+        self.survey.data['2']['questionsets']['2']['answers']['4']['options'] = '|'.join(options)
+        self.survey.save()
+
+        first = self.survey_responses[0]
+        answer(first, 2, 2, [{'questionset_2__answer_4': ['Trick 0']}, {'questionset_2__answer_4': ['Trick 64', 'Trick 3']}])
+
+        arrays, manifest = ColumnarExport(self.survey, year=2015).build()
+        self.arrays, self.manifest = arrays, manifest
+
+        self.assertEqual(manifest['bitmask_options'], 63)
+        names = [meta['name'] for meta in manifest['arrays']['codes'] if meta['key'] == 'questionset_2__answer_4']
+        self.assertEqual(len(names), len(options))
+
+        self.assertEqual(self.column('codes', '2-2:questionset_2__answer_4:Trick 64').tolist(), [1, 0, 0])
+        self.assertEqual(self.column('codes', '2-2:questionset_2__answer_4:Trick 3').tolist(), [1, 0, 0])
+        self.assertEqual(self.column('codes', '2-2:questionset_2__answer_4:Trick 1').tolist(), [0, 0, 0])
+
+
+    def test_command(self):
+        output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output)
+
+        call_command('export_survey_arrays', self.survey.id, os.path.join(output, 'answers'), year=2015, stdout=StringIO())
+
+        arrays = numpy.load(os.path.join(output, 'answers.npz'), allow_pickle=True)
+        with open(os.path.join(output, 'answers.json')) as f:
+            manifest = json.load(f)
+
+        self.assertEqual(manifest, json.loads(json.dumps(self.manifest)))
+        for name in ('report_id', 'codes', 'numbers', 'text'):
+            numpy.testing.assert_array_equal(arrays[name], self.arrays[name])
@@ -0,0 +1,119 @@
+from datetime import datetime
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+
+from supasurvey.dedupe import get_survivor, get_duplicate_keys, merge_file_answers, dedupe_question_responses
+from supasurvey.models import SurveyResponse, QuestionResponse, UploadedFile
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+
+
+# the last migration without the unique constraint
+BEFORE_UNIQUE = [('supasurvey', '0008_answer_counter')]
+
+
+
+class DedupeTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+
+
+    def test_survivor(self):
+        earlier, later = datetime(2015, 1, 1), datetime(2015, 2, 1)
+
+        # answered before unanswered, then the last saved, then the first created
+        self.assertEqual(get_survivor([(1, '[]', later), (2, '[{"questionset_1__answer_1": "Yes"}]', earlier)]), 2)
+        self.assertEqual(get_survivor([(1, '[{"a": 1}]', earlier), (2, '[{"a": 2}]', later)]), 2)
+        self.assertEqual(get_survivor([(3, None, None), (1, None, None), (2, '[]', None)]), 1)
+
+
+    def test_merge_file_answers(self):
+        schema_data = {'id': '8', 'answers': {'1': {'type': 'file-multiple'}, '2': {'type': 'textfield'}}}
+
+        merged = merge_file_answers(schema_data, [{'questionset_8__answer_1': [1], 'questionset_8__answer_2': 'Rex'}],
+            [[{'questionset_8__answer_1': [2, 1], 'questionset_8__answer_2': 'Max'}], [], None])
+        self.assertEqual(merged, [{'questionset_8__answer_1': [1, 2], 'questionset_8__answer_2': 'Rex'}])
+
+        # only the files are taken from the duplicates
+        self.assertEqual(merge_file_answers(schema_data, None, [[{'questionset_8__answer_1': [3]}]]), [{'questionset_8__answer_1': [3]}])
+        self.assertEqual(merge_file_answers(schema_data, [{'questionset_8__answer_1': [1]}], [[{'questionset_8__answer_2': 'Max'}]]), None)
+
+
+    def test_unique_question(self):
+        question_response = self.survey_response.question_responses.get(survey_section=2, number=2)
+        duplicate = QuestionResponse(number=2, survey_section=2, survey_response=self.survey_response, schema_id=question_response.schema_id)
+
+        self.assertRaises(IntegrityError, QuestionResponse.objects.bulk_create, [duplicate])
+
+
+    def test_command_without_duplicates(self):
+        self.assertEqual(get_duplicate_keys(QuestionResponse.objects.all()), [])
+
+        stdout = StringIO()
+        call_command('dedupe_question_responses', self.survey.id, stdout=stdout)
+        self.assertEqual(stdout.getvalue().strip(), 'Deleted 0 duplicate question responses of 0 questions in 0 reports.')
+
+
+    def test_concurrently_created_questions(self):
+        question_response = self.survey_response.question_responses.get(survey_section=2, number=2)
+        schema_id = question_response.schema_id
+        question_response.delete()
+
+        bulk_create = QuestionResponse.objects.bulk_create
+        created = []
+
+        def racing_bulk_create(objs, *args, **kwargs):
+            # another request creates the question first
+            if not created:
+                created.extend(bulk_create([QuestionResponse(number=2, survey_section=2, survey_response=self.survey_response, schema_id=schema_id, response_data=[])]))
+            return bulk_create(objs, *args, **kwargs)
+
+        QuestionResponse.objects.bulk_create = racing_bulk_create
+        self.addCleanup(delattr, QuestionResponse.objects, 'bulk_create')
+
+        questionsets = self.survey_response.get_schema_handler().get_questionsets(2)
+        question_responses = self.survey_response.get_question_responses_for_section(2, questionsets)
+
+        self.assertEqual(sorted(question_responses.keys()), [1, 2])
+        self.assertEqual(self.survey_response.question_responses.filter(survey_section=2, number=2).count(), 1)
+        self.assertEqual(question_responses[2].id, self.survey_response.question_responses.get(survey_section=2, number=2).id)
+
+
+
+class DedupeFilesTest(TransactionTestCase):
+    def setUp(self):
+        self.migrate(BEFORE_UNIQUE)
+
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+
+    def migrate(self, targets):
+        MigrationExecutor(connection).migrate(targets)
+
+
+    def test_files_of_both_duplicates_kept(self):
+        survey = create_survey()
+        survey_response = SurveyResponse.objects.create(survey=survey, year=2015)
+
+        question_response = survey_response.question_responses.get(survey_section=1, number=8)
+        first = question_response.uploaded_files.create(upload='reports/1/dog.jpg')
+        answer(survey_response, 1, 8, [{'questionset_8__answer_1': [first.id]}])
+
+        duplicate = QuestionResponse.objects.create(number=8, survey_section=1, survey_response=survey_response, schema_id=question_response.schema_id)
+        second = duplicate.uploaded_files.create(upload='reports/1/puppy.jpg')
+        duplicate.response_data = [{'questionset_8__answer_1': [second.id]}]
+        duplicate.save()
+
+        result = dedupe_question_responses(QuestionResponse.objects.filter(survey_response=survey_response))
+        self.assertEqual(result.questions, 1)
+
+        survivor = survey_response.question_responses.get(survey_section=1, number=8)
+        self.assertEqual(sorted(UploadedFile.objects.filter(question_response=survivor).values_list('id', flat=True)), sorted([first.id, second.id]))
+        self.assertEqual(sorted(survivor.response_data[0]['questionset_8__answer_1']), sorted([first.id, second.id]))
@@ -0,0 +1,174 @@
+import json
+
+from collections import OrderedDict
+from decimal import *
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from supasurvey.dependencies import DependencyGraph, get_submitted_responses
+from supasurvey.models import Survey, SurveyResponse, SectionSummary
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+
+
+
+def questionset(dependencies=None):
+    dct = {'answers': {}}
+    if dependencies:
+        dct['dependencies'] = dependencies
+    return dct
+
+
+def schema(*sections):
+    return OrderedDict((section_id, {'questionsets': OrderedDict(questionsets)}) for section_id, questionsets in sections)
+
+
+
+class DependencyGraphTest(TestCase):
+    def setUp(self):
+        self.graph = DependencyGraph(schema(
+            ('1', [('1', questionset('require_2-1_YES')), ('2', questionset())]),
+            ('2', [('1', questionset()), ('2', questionset('require_1-1_Blue, require_2-1_yes'))]),
+        ))
+
+
+    def test_topological_order(self):
+        self.assertEqual(self.graph.order, ['2-1', '1-1', '2-2'])
+        self.assertEqual(sorted(self.graph.sources), ['1-1', '2-1'])
+        self.assertFalse(self.graph.has_dependents('1-2'))
+
+
+    def test_disabled(self):
+        self.assertEqual(self.graph.get_disabled({}), set(['1-1', '2-2']))
+
+        responses = {'2-1': [{'questionset_1__answer_1': 'Yes'}]}
+        self.assertEqual(self.graph.get_disabled(responses), set(['2-2']))
+
+        responses['1-1'] = [{'questionset_1__answer_1': 'Red'}, {'questionset_1__answer_1': ['Blue', '']}]
+        self.assertEqual(self.graph.get_disabled(responses), set())
+
+        # a disabled question disables the questions depending on it
+        responses['2-1'] = [{'questionset_1__answer_1': 'No'}]
+        self.assertEqual(self.graph.get_disabled(responses), set(['1-1', '2-2']))
+
+
+    def test_cycle(self):
+        cycle = schema(('1', [('1', questionset('require_1-2_YES')), ('2', questionset('require_1-1_YES')), ('3', questionset('require_1-1_YES'))]))
+        self.assertRaises(ValueError, DependencyGraph, cycle, strict=True)
+
+        # questions in or depending on the cycle are never disabled
+        graph = DependencyGraph(cycle)
+        self.assertEqual(graph.order, [])
+        self.assertEqual(graph.get_disabled({}), set())
+
+
+    def test_invalid_dependencies(self):
+        invalid = schema(('1', [('1', questionset()), ('2', questionset('if 1-1 is yes, require_1-1_YES'))]))
+        self.assertRaises(ValueError, DependencyGraph, invalid, strict=True)
+
+        graph = DependencyGraph(invalid)
+        self.assertEqual(graph.order, ['1-1', '1-2'])
+        self.assertEqual(graph.get_disabled({}), set(['1-2']))
+
+
+    def test_as_json(self):
+        self.assertEqual(json.loads(self.graph.as_json()), {
+            'order': ['2-1', '1-1', '2-2'],
+            'requirements': {
+                '1-1': [{'question': '2-1', 'value': 'yes'}],
+                '2-2': [{'question': '1-1', 'value': 'blue'}, {'question': '2-1', 'value': 'yes'}],
+            }
+        })
+
+
+    def test_submitted_responses(self):
+        data = {
+            'fs_1-TOTAL_FORMS': '2',
+            'fs_1-0-questionset_1__answer_1': 'Yes',
+            'fs_1-1-questionset_1__answer_1': 'No',
+            'fs_2-0-questionset_2__answer_1': 'Yes',
+        }
+        self.assertEqual(get_submitted_responses(data, 2, ['1', '2']), {
+            '2-1': [{'questionset_1__answer_1': 'Yes'}, {'questionset_1__answer_1': 'No'}]
+        })
+
+
+
+class QuestionDependencyTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+
+
+    def get_question(self, section_id, number):
+        return self.survey_response.question_responses.get(survey_section=section_id, number=number)
+
+
+    def test_answers_enable_questions(self):
+        self.assertFalse(self.get_question(2, 2).enabled)
+        self.assertFalse(self.get_question(3, 2).enabled)
+
+        answer(self.survey_response, 2, 2, [{'questionset_2__answer_4': ['Smell', 'Teeth']}])
+        self.assertEqual(self.get_question(2, 2).computed_score, 0)
+
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        question_response = self.get_question(2, 2)
+        self.assertTrue(question_response.enabled)
+        self.assertEqual(question_response.computed_score, Decimal('2.000'))
+
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+        self.assertEqual(survey_response.computed_score, Decimal('3.000'))
+        self.assertEqual(survey_response.max_score, Decimal('6.000'))
+        self.assertEqual(survey_response.get_completion_for_section(2), 40)
+
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'No'}])
+        question_response = self.get_question(2, 2)
+        self.assertFalse(question_response.enabled)
+        self.assertEqual(question_response.completion, None)
+
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+        self.assertEqual(survey_response.computed_score, 0)
+        self.assertEqual(survey_response.max_score, Decimal('1.000'))
+        self.assertEqual(survey_response.get_completion_for_section(2), 100)
+
+
+    def test_disabled_verified_score_not_counted(self):
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+
+        question_response = self.get_question(2, 2)
+        question_response.verified_score = Decimal('3')
+        question_response.save()
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_response.pk).verified_score, Decimal('3.000'))
+
+        # the verifier's score is kept while the question is disabled
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'No'}])
+        self.assertEqual(self.get_question(2, 2).verified_score, Decimal('3.000'))
+
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+        self.assertEqual(survey_response.verified_score, 0)
+        self.assertEqual(survey_response.get_verified_score_for_section(2), 0)
+        self.assertEqual(SectionSummary.objects.rebuild([survey_response.id])[survey_response.id][2]['verified_score'], 0)
+
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_response.pk).verified_score, Decimal('3.000'))
+
+
+    def test_invalid_dependencies(self):
+        data = self.survey.data
+        data['3']['questionsets']['2']['dependencies'] = 'if 3-1 is yes'
+
+        self.assertRaises(ValidationError, self.survey.save)
+        self.assertNotEqual(Survey.objects.get(pk=self.survey.pk).data['3']['questionsets']['2'].get('dependencies'), 'if 3-1 is yes')
+
+        # schemas stored before they were validated still work
+        Survey.objects.filter(pk=self.survey.pk).update(data=data, version='invalid')
+        survey_response = SurveyResponse.objects.create(survey=Survey.objects.get(pk=self.survey.pk), year=2015)
+
+        self.assertTrue(survey_response.question_responses.get(survey_section=3, number=2).enabled)
+        survey_response.get_section_context(section_id=3, response_edit=False)
+
+
+    def test_section_context(self):
+        ctx = self.survey_response.get_section_context(section_id=3, response_edit=False)
+        self.assertFalse(ctx['formsets']['2'].meta['enabled'])
+        self.assertEqual(json.loads(ctx['dependencies'])['order'], ['2-1', '3-1', '2-2', '3-2'])
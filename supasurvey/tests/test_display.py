@@ -0,0 +1,31 @@
+from django.test import TestCase
+
+from supasurvey.display import render_value, render_verifier
+
+
+
+class RenderValueTest(TestCase):
+    def test_choices(self):
+        self.assertEqual(render_value('radio', ['Happy']), 'Happy')
+        self.assertEqual(render_value('radio-yes-no', 'No'), 'No')
+        self.assertEqual(render_value('radio-open', ['Other', 'Purple']), 'Purple')
+        self.assertEqual(render_value('radio-open', ['Red', '']), 'Red')
+        self.assertEqual(render_value('radio', None), 'None')
+        self.assertEqual(render_value('checkbox', ['Smell', 'Teeth']), 'Smell, Teeth')
+        self.assertEqual(render_value('checkbox', None), '')
+
+
+    def test_text_is_escaped(self):
+        self.assertEqual(render_value('textarea', '<b>Woof</b>'), '<pre>&lt;b&gt;Woof&lt;/b&gt;</pre>')
+        self.assertEqual(render_value('textfield', ''), '<pre>None</pre>')
+        self.assertEqual(render_value('emailfield', 'a&b@example.com'), 'a&amp;b@example.com')
+
+
+    def test_missing_files(self):
+        self.assertEqual(render_value('file-multiple', [12]), '<span class="no-files">No uploaded files.</span>')
+
+
+    def test_verifier(self):
+        form = render_verifier('Checked', None, True)
+        self.assertEqual([unicode(field) for field in form], ['<pre>Checked</pre>', 'None'])
+        self.assertEqual(len(render_verifier(None, None, False)), 1)
@@ -0,0 +1,56 @@
+from django.core.cache import caches
+from django.test import TestCase
+
+from supasurvey.distribution import get_score_distribution
+from supasurvey.models import SurveyResponse
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+
+
+
+class ScoreDistributionTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(4)]
+        SurveyResponse.objects.create(survey=self.survey, year=2014)
+
+        for survey_response in self.survey_responses[:3]:
+            answer(survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        answer(self.survey_responses[0], 2, 2, [{'questionset_2__answer_4': ['Smell', 'Teeth', 'Coat']}])
+
+
+    def test_queryset_distribution(self):
+        distribution = SurveyResponse.objects.filter(survey=self.survey, year=2015).score_distribution(bins=4)
+        stats = distribution['columns']['computed_score']
+
+        self.assertEqual(distribution['reports'], 4)
+        self.assertEqual(stats['mean'], 1.5)
+        self.assertEqual((stats['min'], stats['max']), (0.0, 4.0))
+        self.assertEqual(stats['percentiles'][50], 1.0)
+        self.assertEqual(stats['histogram']['counts'], [1, 2, 0, 1])
+
+        # the share scoring lower plus half of those scoring the same
+        ranks = [distribution['ranks'][survey_response.id]['computed_score'] for survey_response in self.survey_responses]
+        self.assertEqual(ranks, [87.5, 50.0, 50.0, 12.5])
+
+
+    def test_sections(self):
+        distribution = SurveyResponse.objects.filter(survey=self.survey, year=2015).score_distribution(sections=True)
+
+        self.assertEqual(distribution['sections'][2]['columns']['computed_score']['mean'], 1.5)
+        self.assertEqual(distribution['sections'][1]['columns']['computed_score']['max'], 0.0)
+        self.assertEqual(distribution['sections'][2]['ranks'][self.survey_responses[0].id]['computed_score'], 87.5)
+
+
+    def test_cached_until_scores_change(self):
+        distribution = get_score_distribution(self.survey, 2015)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_score_distribution(self.survey, 2015), distribution)
+
+        answer(self.survey_responses[3], 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+
+        survey_response = SurveyResponse.objects.get(pk=self.survey_responses[3].pk)
+        self.assertEqual(survey_response.get_score_ranks()['computed_score'], 37.5)
+        self.assertEqual(get_score_distribution(self.survey, 2015)['columns']['computed_score']['mean'], 1.75)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import csv
+
+from StringIO import StringIO
+
+from django.contrib.admin.sites import AdminSite
+from django.contrib.admin import ModelAdmin
+from django.http import StreamingHttpResponse
+from django.test import TestCase
+
+from supasurvey.admin import export_survey_as_csv
+from supasurvey.export import stream_survey_csv
+from supasurvey.models import SurveyResponse
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(3)]
+
+        survey_response = self.survey_responses[0]
+        answer(survey_response, 1, 1, [{'questionset_1__answer_1': u'Rex ❤', 'questionset_1__answer_3': 'rex@example.com'}])
+        answer(survey_response, 1, 7, [{'questionset_7__answer_1': ['Other', 'Purple']}])
+        answer(survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        answer(survey_response, 2, 2, [{'questionset_2__answer_1': 'Fewer baths'}, {'questionset_2__answer_1': 'More walks'}])
+
+        question_response = survey_response.question_responses.get(survey_section=1, number=8)
+        uploaded_file = question_response.uploaded_files.create(upload='reports/1/dog.jpg')
+        answer(survey_response, 1, 8, [{'questionset_8__answer_1': [uploaded_file.id]}])
+
+        # answers to a disabled question are left out
+        answer(self.survey_responses[1], 2, 2, [{'questionset_2__answer_1': 'Sit'}])
+
+
+    def read(self, lines):
+        return list(csv.DictReader(StringIO(''.join(lines))))
+
+
+    def test_one_row_per_report(self):
+        queryset = SurveyResponse.objects.filter(survey=self.survey)
+        lines = stream_survey_csv(queryset, self.survey.get_schema_handler(), chunk_size=2)
+
+        rows = self.read(lines)
+        self.assertEqual([int(row['id']) for row in rows], [survey_response.id for survey_response in self.survey_responses])
+
+        row = rows[0]
+        self.assertEqual(row['1.1.1 Name'].decode('utf-8'), u'Rex ❤')
+        self.assertEqual(row['1.1.2 Title'], '')
+        self.assertEqual(row['1.7.1 What is the color of your dog?'], 'Other, Purple')
+        self.assertEqual(row['1.8.1 Upload some pictures of your dog.'], 'dog.jpg')
+        self.assertEqual(row['2.2.1 What was the goal?'], 'Fewer baths\nMore walks')
+        self.assertEqual(row['computed_score'], '1.000')
+
+        self.assertEqual(rows[1]['2.2.1 What was the goal?'], '')
+
+
+    def test_queries_per_chunk(self):
+        queryset = SurveyResponse.objects.filter(survey=self.survey)
+        lines = stream_survey_csv(queryset, self.survey.get_schema_handler(), chunk_size=2)
+
+        # the reports, their question responses and uploaded files per chunk, and the empty last chunk
+        with self.assertNumQueries(7):
+            self.assertEqual(len(list(lines)), 4)
+
+
+    def test_admin_action(self):
+        modeladmin = ModelAdmin(SurveyResponse, AdminSite())
+        response = export_survey_as_csv(modeladmin, None, SurveyResponse.objects.all())
+
+        self.assertTrue(isinstance(response, StreamingHttpResponse))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(len(self.read(response.streaming_content)), 3)
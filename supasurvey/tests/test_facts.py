@@ -0,0 +1,93 @@
+from decimal import Decimal
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from supasurvey.facts import OTHER_CODE
+from supasurvey.models import SurveyResponse, AnswerFact
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+
+
+
+class AnswerFactTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(2)]
+
+        first, second = self.survey_responses
+        answer(first, 1, 1, [{'questionset_1__answer_1': 'Rex', 'questionset_1__answer_2': ''}])
+        answer(first, 1, 2, [{'questionset_2__answer_1': 'Sad'}])
+        answer(first, 1, 7, [{'questionset_7__answer_1': ['Other', 'Purple']}])
+        answer(first, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        answer(first, 2, 2, [{'questionset_2__answer_4': ['Smell']}, {'questionset_2__answer_4': ['Teeth', 'Coat']}])
+
+        answer(second, 1, 2, [{'questionset_2__answer_1': 'Happy'}])
+
+
+    def facts(self, survey_response, section_id, number):
+        return list(AnswerFact.objects.filter(survey_response=survey_response, survey_section=section_id, number=number).values_list(
+            'row', 'answer_id', 'option', 'option_code', 'value', 'score'))
+
+
+    def test_facts_follow_responses(self):
+        first = self.survey_responses[0]
+
+        self.assertEqual(self.facts(first, 1, 1), [(0, 1, None, None, 'Rex', Decimal('0'))])
+        self.assertEqual(self.facts(first, 1, 2), [(0, 1, 'Sad', 3, None, Decimal('0'))])
+        self.assertEqual(self.facts(first, 1, 7), [(0, 1, 'Other', OTHER_CODE, 'Purple', Decimal('0'))])
+        self.assertEqual(self.facts(first, 2, 2), [
+            (0, 4, 'Smell', 1, None, Decimal('1')),
+            (1, 4, 'Teeth', 3, None, Decimal('1')),
+            (1, 4, 'Coat', 5, None, Decimal('1'))])
+
+        # the scores of the facts add up to the question's score
+        question_response = first.question_responses.get(survey_section=2, number=2)
+        self.assertEqual(sum(score for row, answer_id, option, code, value, score in self.facts(first, 2, 2)), question_response.computed_score)
+
+        answer(first, 1, 2, [{'questionset_2__answer_1': 'Neutral'}])
+        self.assertEqual(self.facts(first, 1, 2), [(0, 1, 'Neutral', 2, None, Decimal('0'))])
+
+
+    def test_disabled_questions_have_no_facts(self):
+        first = self.survey_responses[0]
+
+        answer(first, 2, 1, [{'questionset_1__answer_1': 'No'}])
+        self.assertEqual(self.facts(first, 2, 2), [])
+
+        answer(first, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        self.assertEqual(len(self.facts(first, 2, 2)), 3)
+
+
+    def test_first_answer_only_adds_facts(self):
+        second = self.survey_responses[1]
+
+        # a question without responses has no facts to read back or delete
+        with CaptureQueriesContext(connection) as queries:
+            answer(second, 1, 7, [{'questionset_7__answer_1': ['Blue']}])
+
+        fact_queries = [query['sql'] for query in queries if 'supasurvey_answerfact' in query['sql']]
+        self.assertEqual(len(fact_queries), 1)
+        self.assertIn('INSERT INTO', fact_queries[0])
+        self.assertEqual(len(self.facts(second, 1, 7)), 1)
+
+        answer(second, 1, 7, [{'questionset_7__answer_1': ['Red']}])
+        self.assertEqual([fact[2] for fact in self.facts(second, 1, 7)], ['Red'])
+
+
+    def test_indexed_query(self):
+        chosen = AnswerFact.objects.filter(survey_response__survey=self.survey, survey_response__year=2015,
+            survey_section=1, number=2, answer_id=1, option_code=3)
+
+        self.assertEqual(list(chosen.values_list('survey_response', flat=True)), [self.survey_responses[0].id])
+
+
+    def test_backfill_command(self):
+        facts = list(AnswerFact.objects.order_by('id').values_list('question_response', 'row', 'answer_id', 'option', 'value', 'score'))
+        AnswerFact.objects.all().delete()
+
+        call_command('backfill_answer_facts', self.survey.id, chunk_size=5, stdout=StringIO())
+
+        self.assertEqual(sorted(AnswerFact.objects.values_list('question_response', 'row', 'answer_id', 'option', 'value', 'score')), sorted(facts))
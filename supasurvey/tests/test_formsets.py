@@ -0,0 +1,141 @@
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from supasurvey.forms import _formsets, get_formset_class
+from supasurvey.models import SurveyResponse
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+from supasurvey.utils import get_schema_version
+
+
+
+class BindSubmittedTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+        self.answer_goals('Yes')
+        self.data = {
+            'fs_2-TOTAL_FORMS': '1',
+            'fs_2-INITIAL_FORMS': '0',
+            'fs_2-MAX_NUM_FORMS': '1000',
+            'fs_2-0-questionset_2__answer_4': ['Coat'],
+        }
+
+
+    def answer_goals(self, value):
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': value}])
+
+
+    def test_only_submitted_formsets_bound(self):
+        ctx = self.survey_response.get_section_context(section_id=2, response_edit=True, data=self.data, bind_submitted_only=True)
+        formsets = ctx['formsets']
+
+        self.assertFalse(formsets['1'].is_bound)
+        self.assertFalse(formsets['1'].meta['verifier_form'].is_bound)
+        self.assertTrue(formsets['2'].is_bound)
+        self.assertEqual(ctx['bound_formsets'], [formsets['2']])
+        self.assertTrue(formsets['2'].is_valid())
+
+
+    def test_all_formsets_bound_by_default(self):
+        # without the mode every formset needs its management form
+        self.assertRaises(ValidationError, self.survey_response.get_section_context, section_id=2, response_edit=True, data=self.data)
+
+
+    def test_disabled_formsets_not_bound(self):
+        self.answer_goals('No')
+
+        ctx = self.survey_response.get_section_context(section_id=2, response_edit=True, data=self.data, bind_submitted_only=True)
+        self.assertFalse(ctx['formsets']['2'].meta['enabled'])
+        self.assertFalse(ctx['formsets']['2'].is_bound)
+        self.assertEqual(ctx['bound_formsets'], [])
+
+
+    def test_enabled_by_submitted_answers(self):
+        self.answer_goals('No')
+
+        self.data.update({
+            'fs_1-TOTAL_FORMS': '1',
+            'fs_1-INITIAL_FORMS': '0',
+            'fs_1-MAX_NUM_FORMS': '1000',
+            'fs_1-0-questionset_1__answer_1': 'Yes',
+        })
+
+        ctx = self.survey_response.get_section_context(section_id=2, response_edit=True, data=self.data, bind_submitted_only=True)
+        self.assertTrue(ctx['formsets']['2'].meta['enabled'])
+        self.assertEqual(ctx['bound_formsets'], [ctx['formsets']['1'], ctx['formsets']['2']])
+
+
+
+class FormsetClassCacheTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+        self.schema_handler = self.survey_response.get_schema_handler()
+
+        _formsets.clear()
+        self.addCleanup(_formsets.clear)
+
+
+    def get_formset_class(self, section_id, questionset_id, extra=1):
+        schema = self.schema_handler.get_questionsets(section_id)[str(questionset_id)]
+        return get_formset_class(get_schema_version(schema), schema, extra), schema
+
+
+    def test_cached_class(self):
+        FormSet, schema = self.get_formset_class(1, 2)
+
+        self.assertIs(self.get_formset_class(1, 2)[0], FormSet)
+        self.assertIsNot(self.get_formset_class(1, 2, extra=0)[0], FormSet)
+        self.assertEqual(len(_formsets), 2)
+
+
+    def test_same_questionset_in_other_section(self):
+        # both sections have a questionset 1, with different answers
+        FormSet, schema = self.get_formset_class(1, 1)
+        OtherFormSet, other_schema = self.get_formset_class(2, 1)
+
+        self.assertIsNot(OtherFormSet, FormSet)
+        self.assertEqual([field_spec.type for field_spec in FormSet.field_specs], ['textfield', 'textfield', 'emailfield', 'textfield'])
+        self.assertEqual([field_spec.type for field_spec in OtherFormSet.field_specs], ['radio-yes-no'])
+
+
+    def test_least_recently_used_dropped(self):
+        size = _formsets.size
+        _formsets.size = 2
+        self.addCleanup(setattr, _formsets, 'size', size)
+
+        FormSet = self.get_formset_class(1, 1)[0]
+        self.get_formset_class(1, 2)
+        self.assertIs(self.get_formset_class(1, 1)[0], FormSet)
+
+        # questionset 2 was used least recently
+        self.get_formset_class(1, 3)
+        self.assertEqual(len(_formsets), 2)
+        self.assertIs(self.get_formset_class(1, 1)[0], FormSet)
+
+        FormSet = self.get_formset_class(1, 3)[0]
+        self.get_formset_class(1, 2)
+        self.get_formset_class(1, 1)
+        self.assertIsNot(self.get_formset_class(1, 3)[0], FormSet)
+
+
+    def test_forms_do_not_share_field_kwargs(self):
+        FormSet, schema = self.get_formset_class(1, 8)
+        answer_key = 'questionset_8__answer_1'
+
+        # the uploaded files of one form are not left in the shared spec
+        form = FormSet(initial=[{answer_key: [1, 2]}], schema=schema, edit=True).forms[0]
+        other_form = FormSet(initial=[{}], schema=schema, edit=True).forms[0]
+
+        self.assertIsNot(other_form.fields[answer_key], form.fields[answer_key])
+        self.assertEqual(FormSet.field_specs[0].kwargs['uploaded'], [])
+
+        FormSet, schema = self.get_formset_class(1, 6)
+        answer_key = 'questionset_6__answer_1'
+
+        form = FormSet(schema=schema, edit=True).forms[0]
+        form.fields[answer_key].choices.append(('Huge', 'Huge'))
+
+        other_form = FormSet(schema=schema, edit=True).forms[0]
+        self.assertEqual([label for value, label in other_form.fields[answer_key].choices], ['Small', 'Medium', 'Large'])
+        self.assertEqual(FormSet.field_specs[0].kwargs['choices'], ['Small', 'Medium', 'Large'])
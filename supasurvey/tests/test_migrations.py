@@ -0,0 +1,61 @@
+from decimal import Decimal
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+BEFORE = [('supasurvey', '0001_initial')]
+AFTER = [('supasurvey', '0002_numeric_scores')]
+
+
+
+class NumericScoresMigrationTest(TransactionTestCase):
+    def setUp(self):
+        self.migrate(BEFORE)
+
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).render()
+
+
+    def test_scores_to_numeric_and_back(self):
+        apps = MigrationExecutor(connection).loader.project_state(BEFORE).render()
+        Survey = apps.get_model('supasurvey', 'Survey')
+        SurveyResponse = apps.get_model('supasurvey', 'SurveyResponse')
+        QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+
+        survey = Survey.objects.create(title='Test survey', data={})
+        report = SurveyResponse.objects.create(survey=survey, completion='N/A', max_score='12', verified_score='', computed_score=' 4.5 ')
+        question = QuestionResponse.objects.create(survey_response=report, number=1, completion='50', fields_total='2',
+            fields_complete='1', max_score='woof', verified_score=None, computed_score='1.25')
+        empty = QuestionResponse.objects.create(survey_response=report, number=2, completion='N/A', fields_total='', max_score='-')
+
+        apps = self.migrate(AFTER)
+        SurveyResponse = apps.get_model('supasurvey', 'SurveyResponse')
+        QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+
+        columns = ('completion', 'max_score', 'verified_score', 'computed_score')
+        self.assertEqual(SurveyResponse.objects.values_list(*columns).get(id=report.id), (None, Decimal('12'), None, Decimal('4.5')))
+
+        columns = ('completion', 'fields_total', 'fields_complete', 'max_score', 'verified_score', 'computed_score')
+        self.assertEqual(QuestionResponse.objects.values_list(*columns).get(id=question.id), (Decimal('50'), Decimal('2'), Decimal('1'), None, None, Decimal('1.25')))
+        self.assertEqual(QuestionResponse.objects.values_list(*columns).get(id=empty.id), (None,) * 6)
+
+        apps = self.migrate(BEFORE)
+        SurveyResponse = apps.get_model('supasurvey', 'SurveyResponse')
+        QuestionResponse = apps.get_model('supasurvey', 'QuestionResponse')
+
+        # the strings of the numbers, however the backend formats them
+        report = SurveyResponse.objects.get(id=report.id)
+        self.assertEqual((report.completion, Decimal(report.max_score), Decimal(report.computed_score)), (None, 12, Decimal('4.5')))
+
+        question = QuestionResponse.objects.get(id=question.id)
+        self.assertEqual((Decimal(question.completion), question.max_score, Decimal(question.computed_score)), (50, None, Decimal('1.25')))
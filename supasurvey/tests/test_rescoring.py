@@ -0,0 +1,182 @@
+import os, copy, json, random, shutil, tempfile
+
+from decimal import *
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from supasurvey.models import SurveyResponse, QuestionResponse, SchemaFragment, AnswerCounter
+from supasurvey.rescoring import Rescorer, rescore_survey
+from supasurvey.stats import get_survey_stats
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+
+
+
+SCORE_COLUMNS = ('fields_total', 'fields_complete', 'completion', 'max_score', 'computed_score')
+
+ANSWERS = {
+    (2, 1): ['questionset_1__answer_1', ['Yes', 'No', 'YES', ['Yes'], ['No', ''], '']],
+    (2, 2): ['questionset_2__answer_4', [['Smell'], ['Smell', 'Teeth', 'Coat'], ['Wings'], []]],
+    (1, 2): ['questionset_2__answer_1', ['Happy', 'Sad', ['Neutral', ''], None]],
+    (1, 7): ['questionset_7__answer_1', ['Red', ['Other', 'Purple'], '']],
+    (3, 2): ['questionset_2__answer_1', ['Some text', '']],
+}
+
+
+
+class RescorerTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(3)]
+
+        generator = random.Random(7)
+        for survey_response in self.survey_responses:
+            for (section_id, number), (field_key, values) in ANSWERS.items():
+                rows = [{field_key: generator.choice(values)} for i in range(generator.randint(0, 3))]
+                question_response = survey_response.question_responses.get(survey_section=section_id, number=number)
+                question_response.response_data = rows
+                question_response.save()
+
+
+    def get_scores(self):
+        return dict((question_response.id, tuple(getattr(question_response, column) for column in SCORE_COLUMNS)) for question_response in QuestionResponse.objects.all())
+
+
+    def get_report_totals(self):
+        return [(survey_response.completion, survey_response.max_score, survey_response.computed_score) for survey_response in SurveyResponse.objects.order_by('id')]
+
+
+    def test_matches_calculate_scores(self):
+        scores = self.get_scores()
+        totals = self.get_report_totals()
+
+        # nothing changes when the stored scores are current
+        result = rescore_survey(self.survey, chunk_size=10)
+        self.assertEqual(result.questions, 42)
+        self.assertEqual(result.changed, 0)
+
+        QuestionResponse.objects.update(computed_score=0, max_score=None, completion=None, fields_complete=0)
+        SurveyResponse.objects.update(computed_score=0, max_score=0)
+
+        result = rescore_survey(self.survey, chunk_size=10)
+        self.assertEqual(result.changed, 42)
+        self.assertEqual(self.get_scores(), scores)
+        self.assertEqual(self.get_report_totals(), totals)
+
+
+    def change_scoring(self, scoring):
+        """ Changes the option scores of the goal areas in the survey schema. """
+        data = copy.deepcopy(self.survey.data)
+        data['2']['questionsets']['2']['answers']['4']['scoring'] = scoring
+        self.survey.data = data
+        self.survey.save()
+        return data['2']['questionsets']['2']
+
+
+    def test_changed_survey_scores(self):
+        survey_response = self.survey_responses[0]
+        answer(survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        question_response = answer(survey_response, 2, 2, [{'questionset_2__answer_4': ['Smell', 'Teeth']}])
+        self.assertEqual(question_response.computed_score, Decimal('2.000'))
+
+        schema_data = self.change_scoring('2|1|0.5|1|1')
+        rescore_survey(self.survey)
+
+        rescored = QuestionResponse.objects.get(id=question_response.id)
+        self.assertEqual(rescored.computed_score, Decimal('2.500'))
+        self.assertEqual(rescored.schema_id, SchemaFragment.objects.get_for_data(schema_data))
+        self.assertEqual(sorted(rescored.answer_facts.values_list('option', 'score')), [('Smell', Decimal('2')), ('Teeth', Decimal('0.5'))])
+
+        # the goals question scores 1
+        self.assertEqual(SurveyResponse.objects.get(id=survey_response.id).computed_score, Decimal('3.500'))
+        self.assertEqual(SurveyResponse.objects.get(id=survey_response.id).get_computed_score_for_section(2), Decimal('3.500'))
+        self.assertEqual(get_survey_stats(self.survey, 2015)['2-2']['answers'][4]['Smell']['score_sum'], Decimal('2'))
+
+        # saving the question again scores it the same
+        rescored.calculate_scores()
+        self.assertEqual(rescored.computed_score, Decimal('2.500'))
+        self.assertEqual(rescore_survey(self.survey).changed, 0)
+
+
+    def test_dry_run(self):
+        QuestionResponse.objects.filter(survey_section=2, number=1).update(max_score=0)
+
+        result = Rescorer(dry_run=True).rescore(QuestionResponse.objects.all())
+        self.assertEqual(result.changed, 3)
+        self.assertEqual(set(change[1] for change in result.changes), set(['max_score']))
+        self.assertEqual(QuestionResponse.objects.filter(survey_section=2, number=1, max_score=0).count(), 3)
+
+
+    def test_inexact_scores_fall_back(self):
+        question_response = self.survey_responses[0].question_responses.get(survey_section=2, number=2)
+        question_response.schema_data = self.change_scoring('0.3333|0.3333|0.3333|1|1')
+        question_response.response_data = [{'questionset_2__answer_4': ['Smell', 'Slobber', 'Teeth']}]
+        question_response.save()
+        expected = question_response.computed_score
+
+        QuestionResponse.objects.filter(id=question_response.id).update(computed_score=0)
+        rescore_survey(self.survey)
+
+        self.assertEqual(expected, Decimal('1.000'))
+        self.assertEqual(QuestionResponse.objects.get(id=question_response.id).computed_score, expected)
+
+
+
+class RescoreSurveyCommandTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(3)]
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'rescore.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.checkpoint))
+
+        QuestionResponse.objects.filter(survey_section=2, number=1).update(max_score=0)
+
+
+    def call(self, **options):
+        stdout = StringIO()
+        call_command('rescore_survey', self.survey.id, processes=1, shard_size=2, stdout=stdout, **options)
+        return stdout.getvalue()
+
+
+    def test_dry_run(self):
+        output = self.call(dry_run=True, verbosity=2)
+
+        self.assertIn('Dry run, 3 of 42 questions would change.', output)
+        self.assertIn('max_score: 0 -> 1.000', output)
+        self.assertEqual(QuestionResponse.objects.filter(max_score=0, survey_section=2, number=1).count(), 3)
+
+
+    def test_resume_from_checkpoint(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'survey': self.survey.id, 'completed': [self.survey_responses[0].id]}, f)
+
+        output = self.call(checkpoint=self.checkpoint)
+
+        self.assertIn('Rescored 2/2 reports, 28 questions, 2 changed.', output)
+        self.assertEqual(QuestionResponse.objects.filter(max_score=0, survey_section=2, number=1).count(), 1)
+
+        with open(self.checkpoint) as f:
+            data = json.load(f)
+            self.assertEqual(data['completed'], sorted(survey_response.id for survey_response in self.survey_responses))
+            self.assertTrue(data['changed'])
+
+
+    def test_resume_rebuilds_counters(self):
+        question_response = self.survey_responses[0].question_responses.get(survey_section=2, number=1)
+        question_response.response_data = [{'questionset_1__answer_1': 'Yes'}]
+        question_response.save()
+
+        counters = list(AnswerCounter.objects.order_by('kind', 'number', 'option', 'bucket').values_list('kind', 'number', 'option', 'bucket', 'count'))
+        self.assertTrue(counters)
+
+        # the interrupted run changed scores, the rest of the reports change nothing
+        with open(self.checkpoint, 'w') as f:
+            json.dump({'survey': self.survey.id, 'completed': [self.survey_responses[0].id], 'changed': True}, f)
+        QuestionResponse.objects.filter(survey_section=2, number=1).update(max_score=1)
+        AnswerCounter.objects.update(count=99)
+
+        output = self.call(checkpoint=self.checkpoint)
+
+        self.assertIn('Rescored 2/2 reports, 28 questions, 0 changed.', output)
+        self.assertEqual(list(AnswerCounter.objects.order_by('kind', 'number', 'option', 'bucket').values_list('kind', 'number', 'option', 'bucket', 'count')), counters)
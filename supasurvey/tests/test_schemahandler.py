@@ -1,8 +1,14 @@
-import os
+import os, copy, json, shutil, tempfile
 
+from StringIO import StringIO
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.test.utils import override_settings
 
-from supasurvey.utils import SchemaHandler
+from supasurvey.models import Survey
+from supasurvey.utils import SchemaHandler, SchemaRegistry, LRUCache, schema_registry
+from supasurvey.utils import get_schema_handler, get_schema_version
 
 
 TESTDIR = os.path.dirname(__file__)
@@ -33,3 +39,148 @@ class SchemaHandlerTest(TestCase):
 
         # schema_handler.flatten()
         # schema_handler.nest()
+
+
+
+class SchemaRegistryTest(TestCase):
+    def setUp(self):
+        self.registry = SchemaRegistry()
+        self.compiled = []
+
+
+    def compile_schema(self):
+        schema_handler = SchemaHandler()
+        schema_handler.read_lines(os.path.join(TESTDIR, 'data.csv'))
+        schema_handler.parse_as_dct()
+        schema_handler.nest()
+        self.compiled.append(schema_handler)
+        return schema_handler
+
+
+    def test_compiles_once_per_version(self):
+        first = self.registry.get(1, 'v1', self.compile_schema)
+        second = self.registry.get(1, 'v1', self.compile_schema)
+
+        self.assertTrue(first is second)
+        self.assertEqual(len(self.compiled), 1)
+        self.assertEqual(self.registry.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+
+    def test_new_version_replaces_old(self):
+        first = self.registry.get(1, 'v1', self.compile_schema)
+        second = self.registry.get(1, 'v2', self.compile_schema)
+
+        self.assertFalse(first is second)
+        self.assertEqual(self.registry.stats()['size'], 1)
+
+
+    def test_invalidate(self):
+        self.registry.get(1, 'v1', self.compile_schema)
+        self.registry.get(2, 'v1', self.compile_schema)
+
+        self.registry.invalidate(1)
+        self.assertEqual(self.registry.stats()['size'], 1)
+
+        self.registry.get(1, 'v1', self.compile_schema)
+        self.assertEqual(self.registry.stats()['misses'], 3)
+
+        self.registry.invalidate()
+        self.assertEqual(self.registry.stats()['size'], 0)
+
+
+
+class LRUCacheTest(TestCase):
+    def test_built_outside_lock(self):
+        cache = LRUCache(2)
+
+        # the factory may read the cache, and a value cached while it built wins
+        def factory():
+            self.assertEqual(cache.get('a'), None)
+            cache.set('a', 'cached')
+            return 'built'
+
+        self.assertEqual(cache.get_or_create('a', factory), 'cached')
+        self.assertEqual(cache.get_or_create('a', lambda: 'other'), 'cached')
+
+
+    def test_least_recently_used_dropped(self):
+        cache = LRUCache(2)
+        cache.get_or_create('a', lambda: 1)
+        cache.get_or_create('b', lambda: 2)
+        cache.get_or_create('a', lambda: 3)
+        cache.get_or_create('c', lambda: 4)
+
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertEqual(len(cache), 2)
+
+
+
+class SurveySchemaTest(TestCase):
+    def setUp(self):
+        schema_handler = SchemaHandler()
+        schema_handler.read_lines(os.path.join(TESTDIR, 'data.csv'))
+        schema_handler.parse_as_dct()
+        schema_handler.nest()
+        schema_handler.json_raw = schema_handler.export_json()
+        schema_handler.to_python()
+
+        self.data = schema_handler.data
+        self.survey = Survey.objects.create(title='Test survey', data=self.data)
+        schema_registry.invalidate()
+        schema_registry.reset_stats()
+
+
+    def test_version_is_content_hash(self):
+        self.assertEqual(self.survey.version, get_schema_version(self.data))
+
+        self.survey.title = 'Renamed survey'
+        self.survey.save()
+        self.assertEqual(self.survey.version, get_schema_version(self.data))
+
+
+    def test_handler_loaded_once_per_version(self):
+        first = get_schema_handler(self.survey.pk)
+        second = get_schema_handler(self.survey.pk)
+
+        self.assertTrue(first is second)
+        self.assertEqual(first.data, self.data)
+        self.assertEqual(schema_registry.stats()['misses'], 1)
+        self.assertEqual(schema_registry.stats()['hits'], 1)
+
+
+    def test_handler_follows_version(self):
+        first = get_schema_handler(self.survey.pk)
+
+        data = copy.deepcopy(self.data)
+        data['1']['title'] = 'Changed'
+        self.survey.data = data
+        self.survey.save()
+
+        second = get_schema_handler(self.survey.pk)
+        self.assertFalse(first is second)
+        self.assertEqual(second.get_section_schema(1)['title'], 'Changed')
+
+
+    def test_import_command(self):
+        project_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, project_root)
+        os.mkdir(os.path.join(project_root, 'bin'))
+
+        data = copy.deepcopy(self.data)
+        data['1']['title'] = 'Imported'
+        with open(os.path.join(project_root, 'bin', 'par_out.json'), 'w') as f:
+            json.dump(data, f)
+
+        # a survey with a version only takes a new schema file from the command
+        with override_settings(PROJECT_ROOT=project_root, SUPASURVEY_DEVELOPMENT=False):
+            self.assertEqual(get_schema_handler(self.survey.pk).get_section_schema(1)['title'], self.data['1']['title'])
+
+            stdout = StringIO()
+            call_command('import_survey_schema', self.survey.id, stdout=stdout)
+            self.assertEqual(stdout.getvalue().strip(), 'Imported schema version %s into survey %s.' % (get_schema_version(data), self.survey.id))
+            self.assertEqual(get_schema_handler(self.survey.pk).get_section_schema(1)['title'], 'Imported')
+
+            stdout = StringIO()
+            call_command('import_survey_schema', self.survey.id, stdout=stdout)
+            self.assertIn('already has the schema', stdout.getvalue())
@@ -0,0 +1,72 @@
+from decimal import *
+from collections import OrderedDict
+
+from django.test import TestCase
+
+from supasurvey.scoring import ScoringPlan, get_scoring_plan
+
+
+
+SCHEMA = OrderedDict([
+    ('id', '3'),
+    ('title', 'Good dogs'),
+    ('repeater', True),
+    ('answers', OrderedDict([
+        ('1', {'id': 1, 'type': 'radio', 'label': 'How long?', 'options': '1-2 years|3-5 years|5-10 years', 'scoring': '1|2.5|4', 'maxscore': '4'}),
+        ('2', {'id': 2, 'type': 'checkbox', 'label': 'Tricks', 'options': 'sit|stay|roll', 'scoring': '1.1|2.2|3.3', 'maxscore': '6.6'}),
+        ('3', {'id': 3, 'type': 'radio-yes-no', 'label': 'Good dog?', 'correct': 'Yes', 'minscore': '1', 'maxscore': '5'}),
+        ('4', {'id': 4, 'type': 'textarea', 'label': 'Describe'}),
+        ('5', {'id': 5, 'type': 'file-multiple', 'label': 'Photos'}),
+    ]))
+])
+
+
+
+class ScoringPlanTest(TestCase):
+    def setUp(self):
+        self.plan = ScoringPlan(SCHEMA)
+
+
+    def test_totals(self):
+        self.assertEqual(self.plan.max_score, Decimal('15.600'))
+        self.assertEqual(self.plan.fields_total, 4)
+        self.assertEqual(self.plan.scored_answers, frozenset(['1', '2', '3', '4']))
+
+
+    def test_choice_scores(self):
+        self.assertEqual(self.plan.get_score('questionset_3__answer_1', '3-5 years'), Decimal('2.5'))
+        self.assertEqual(self.plan.get_score('questionset_3__answer_1', ['5-10 years', '']), 4)
+        self.assertEqual(self.plan.get_score('questionset_3__answer_1', 'unknown'), 0)
+        self.assertEqual(self.plan.get_score('questionset_3__answer_2', ['sit', 'roll']), Decimal('4.4'))
+
+
+    def test_invalid_option_score(self):
+        schema_data = OrderedDict(SCHEMA)
+        schema_data['answers'] = OrderedDict(SCHEMA['answers'])
+        schema_data['answers']['2'] = dict(SCHEMA['answers']['2'], scoring='1.1|two|3.3')
+
+        # only the option with the malformed score scores nothing
+        plan = ScoringPlan(schema_data)
+        self.assertEqual(plan.get_score('questionset_3__answer_2', ['sit', 'stay', 'roll']), Decimal('4.4'))
+        self.assertEqual(plan.get_score('questionset_3__answer_1', '3-5 years'), Decimal('2.5'))
+
+
+    def test_correct_scores(self):
+        self.assertEqual(self.plan.get_score('questionset_3__answer_3', 'yes'), 5)
+        self.assertEqual(self.plan.get_score('questionset_3__answer_3', ['No']), 1)
+
+
+    def test_repeater_rows(self):
+        response_data = [
+            {'questionset_3__answer_1': '1-2 years', 'questionset_3__answer_4': 'Woof', 'questionset_3__answer_5': [1]},
+            {'questionset_3__answer_2': ['stay'], 'questionset_3__answer_3': 'Yes', 'questionset_3__answer_4': ''},
+        ]
+
+        self.assertEqual(self.plan.get_computed_score(response_data), Decimal('8.200'))
+        self.assertEqual(self.plan.get_fields_complete(response_data), 2)
+        self.assertEqual(self.plan.get_fields_complete([]), 0)
+        self.assertEqual(self.plan.get_fields_total(None), 0)
+
+
+    def test_plan_is_cached(self):
+        self.assertTrue(get_scoring_plan(SCHEMA) is get_scoring_plan(OrderedDict(SCHEMA)))
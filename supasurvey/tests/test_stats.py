@@ -0,0 +1,142 @@
+import json
+
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from supasurvey.models import SurveyResponse, AnswerCounter
+from supasurvey.stats import get_survey_stats
+from supasurvey.tests.test_surveyresponse import answer, create_survey
+from supasurvey.views import survey_stats
+
+
+
+class SurveyStatsTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(2)]
+        self.previous = SurveyResponse.objects.create(survey=self.survey, year=2014)
+
+        first, second = self.survey_responses
+        answer(first, 1, 2, [{'questionset_2__answer_1': 'Sad'}])
+        answer(first, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        answer(first, 2, 2, [{'questionset_2__answer_4': ['Smell']}, {'questionset_2__answer_4': ['Smell', 'Coat']}])
+
+        answer(second, 1, 2, [{'questionset_2__answer_1': 'Happy'}])
+        answer(self.previous, 1, 2, [{'questionset_2__answer_1': 'Sad'}])
+
+
+    def counters(self):
+        return sorted(AnswerCounter.objects.filter(survey=self.survey).exclude(count=0, score_sum=0).values_list(
+            'year', 'kind', 'survey_section', 'number', 'answer_id', 'option', 'bucket', 'count', 'score_sum'))
+
+
+    def test_counters_follow_responses(self):
+        stats = get_survey_stats(self.survey, 2015)
+
+        self.assertEqual(stats['1-2']['answered'], 2)
+        self.assertEqual(stats['1-2']['completion'][100]['count'], 2)
+        self.assertEqual(dict((option, counts['count']) for option, counts in stats['1-2']['answers'][1].items()), {'Sad': 1, 'Happy': 1})
+
+        # options chosen in several repeater rows count once, and sum every score
+        self.assertEqual(stats['2-2']['answers'][4]['Smell'], {'count': 1, 'score_sum': Decimal('2')})
+        self.assertEqual(stats['2-2']['score_sum'], Decimal('3'))
+
+        answer(self.survey_responses[0], 1, 2, [{'questionset_2__answer_1': 'Happy'}])
+
+        stats = get_survey_stats(self.survey, 2015)
+        self.assertEqual(stats['1-2']['answers'][1]['Sad']['count'], 0)
+        self.assertEqual(stats['1-2']['answers'][1]['Happy']['count'], 2)
+
+        # every year together
+        self.assertEqual(get_survey_stats(self.survey)['1-2']['answers'][1]['Sad']['count'], 1)
+
+
+    def test_disabled_questions_are_not_counted(self):
+        answer(self.survey_responses[0], 2, 1, [{'questionset_1__answer_1': 'No'}])
+
+        stats = get_survey_stats(self.survey, 2015)
+        self.assertEqual(stats['2-2']['answered'], 0)
+        self.assertEqual(stats['2-2']['answers'][4]['Smell']['count'], 0)
+
+
+    def test_rebuild_matches_counters(self):
+        counters = self.counters()
+        AnswerCounter.objects.rebuild(self.survey)
+        self.assertEqual(self.counters(), counters)
+
+
+    def assertCountersRebuilt(self):
+        counters = self.counters()
+        AnswerCounter.objects.rebuild(self.survey)
+        self.assertEqual(counters, self.counters())
+
+
+    def test_year_change_moves_counts(self):
+        survey_response = SurveyResponse.objects.get(pk=self.survey_responses[0].pk)
+        survey_response.year = 2016
+        survey_response.save()
+
+        self.assertEqual(get_survey_stats(self.survey, 2015)['1-2']['answered'], 1)
+        self.assertEqual(get_survey_stats(self.survey, 2015)['1-2']['answers'][1]['Sad']['count'], 0)
+        self.assertEqual(get_survey_stats(self.survey, 2016)['1-2']['answers'][1]['Sad']['count'], 1)
+        self.assertEqual(get_survey_stats(self.survey, 2016)['2-2']['score_sum'], Decimal('3'))
+        self.assertCountersRebuilt()
+
+        # answers are counted under the stored year of the report
+        answer(self.survey_responses[0], 1, 2, [{'questionset_2__answer_1': 'Neutral'}])
+        self.assertEqual(get_survey_stats(self.survey, 2016)['1-2']['answers'][1]['Neutral']['count'], 1)
+        self.assertCountersRebuilt()
+
+
+    def test_deleted_reports_are_not_counted(self):
+        survey_response = SurveyResponse.objects.get(pk=self.survey_responses[0].pk)
+        survey_response.deleted = True
+        survey_response.save()
+
+        self.assertEqual(get_survey_stats(self.survey, 2015)['1-2']['answered'], 1)
+        self.assertEqual(get_survey_stats(self.survey, 2015)['2-2']['answered'], 0)
+        self.assertCountersRebuilt()
+
+        answer(survey_response, 1, 2, [{'questionset_2__answer_1': 'Neutral'}])
+        self.assertNotIn('Neutral', get_survey_stats(self.survey, 2015)['1-2']['answers'][1])
+
+        survey_response.deleted = False
+        survey_response.save()
+
+        self.assertEqual(get_survey_stats(self.survey, 2015)['1-2']['answers'][1]['Neutral']['count'], 1)
+        self.assertEqual(get_survey_stats(self.survey, 2015)['2-2']['answered'], 1)
+        self.assertCountersRebuilt()
+
+
+    def test_deleted_responses_are_not_counted(self):
+        first, second = self.survey_responses
+
+        first.question_responses.get(survey_section=2, number=2).delete()
+        self.assertEqual(get_survey_stats(self.survey, 2015)['2-2']['answered'], 0)
+        self.assertEqual(get_survey_stats(self.survey, 2015)['2-2']['score_sum'], 0)
+        self.assertCountersRebuilt()
+
+        SurveyResponse.objects.get(pk=second.pk).delete()
+        self.assertEqual(get_survey_stats(self.survey, 2015)['1-2']['answered'], 1)
+        self.assertEqual(get_survey_stats(self.survey, 2015)['1-2']['answers'][1]['Happy']['count'], 0)
+        self.assertCountersRebuilt()
+
+
+    def test_stats_read_once(self):
+        with self.assertNumQueries(1):
+            get_survey_stats(self.survey, 2015)
+
+
+    def test_view(self):
+        request = RequestFactory().get('/', {'year': 2015})
+        request.user = User.objects.create_user('staff', 'staff@example.com', 'woof')
+        request.user.is_staff = True
+
+        response = survey_stats(request, id=self.survey.id)
+        data = json.loads(response.content)
+
+        self.assertEqual(data['year'], 2015)
+        self.assertEqual(data['questions']['1-2']['answers']['1']['Sad']['count'], 1)
@@ -0,0 +1,422 @@
+import os, copy, collections
+
+from decimal import *
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from supasurvey.jsonfields import StoredJSON
+from supasurvey.models import Survey, SurveyResponse, QuestionResponse, SchemaFragment
+from supasurvey.utils import SchemaHandler
+
+
+TESTDIR = os.path.dirname(__file__)
+
+
+def create_survey():
+    schema_handler = SchemaHandler()
+    schema_handler.read_lines(os.path.join(TESTDIR, 'data.csv'))
+    schema_handler.parse_as_dct()
+    schema_handler.nest()
+    schema_handler.json_raw = schema_handler.export_json()
+    schema_handler.to_python()
+
+    return Survey.objects.create(title='Test survey', data=schema_handler.data)
+
+
+def answer(survey_response, section_id, number, response_data):
+    """ Saves the response data of a question of a report. """
+    question_response = survey_response.question_responses.get(survey_section=section_id, number=number)
+    question_response.response_data = response_data
+    question_response.save()
+    return question_response
+
+
+
+class SurveyResponseScoresTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+
+
+    def test_questions_created(self):
+        self.assertEqual(self.survey_response.question_responses.count(), 14)
+
+        # the goals only count once the report says it has any
+        self.assertEqual(self.survey_response.max_score, Decimal('1.000'))
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        self.assertEqual(self.survey_response.max_score, Decimal('6.000'))
+
+
+    def test_questions_bulk_created(self):
+        # the fragments are stored and the totals counted once for all the questions
+        with self.assertNumQueries(12):
+            SurveyResponse.objects.create(survey=self.survey, year=2016)
+
+        survey_response = SurveyResponse.objects.get(survey=self.survey, year=2016)
+        self.assertEqual(survey_response.question_responses.count(), 14)
+        self.assertEqual(survey_response.max_score, Decimal('1.000'))
+        self.assertEqual(survey_response.question_responses.filter(enabled=False).count(), 2)
+
+
+    def test_section_totals_single_query(self):
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        answer(self.survey_response, 2, 2, [{'questionset_2__answer_4': ['Smell', 'Teeth']}])
+
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(survey_response.get_computed_score(), Decimal('3.000'))
+            self.assertEqual(survey_response.get_computed_score_for_section(2), Decimal('3.000'))
+            self.assertEqual(survey_response.get_computed_score_for_section(1), 0)
+            self.assertEqual(survey_response.get_completion_for_section(2), 40)
+
+
+    def test_totals_applied_on_save(self):
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        answer(self.survey_response, 2, 2, [{'questionset_2__answer_4': ['Smell', 'Teeth']}])
+
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+        self.assertEqual(survey_response.computed_score, Decimal('3.000'))
+        self.assertEqual(survey_response.completion, 5)
+
+        # the in-memory report follows along
+        self.assertEqual(self.survey_response.computed_score, Decimal('3.000'))
+
+        answer(self.survey_response, 2, 2, [{'questionset_2__answer_4': ['Smell']}])
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+        self.assertEqual(survey_response.computed_score, Decimal('2.000'))
+
+        survey_response.calculate_scores()
+        self.assertEqual(survey_response.computed_score, Decimal('2.000'))
+        self.assertEqual(survey_response.completion, 5)
+
+
+    def test_stale_instances_apply_stored_change(self):
+        first = self.survey_response.question_responses.get(survey_section=1, number=2)
+        second = self.survey_response.question_responses.get(survey_section=1, number=2)
+
+        first.response_data = [{'questionset_2__answer_1': 'Sad'}]
+        first.save()
+        second.response_data = [{'questionset_2__answer_1': 'Happy'}]
+        second.save()
+
+        summary = self.survey_response.section_summaries.get(survey_section=1)
+        self.assertEqual(summary.fields_complete, 1)
+
+        completion = SurveyResponse.objects.get(pk=self.survey_response.pk).completion
+        self.survey_response.rebuild_totals()
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_response.pk).completion, completion)
+        self.assertEqual(self.survey_response.section_summaries.get(survey_section=1).fields_complete, 1)
+
+
+    def test_missing_questions_bulk_created(self):
+        answer(self.survey_response, 2, 1, [{'questionset_1__answer_1': 'Yes'}])
+        max_score = self.survey_response.max_score
+        self.survey_response.question_responses.filter(survey_section=2, number=2).delete()
+        self.survey_response.rebuild_totals()
+        self.assertEqual(self.survey_response.max_score, 1)
+
+        questionsets = self.survey_response.get_schema_handler().get_questionsets(2)
+        question_responses = self.survey_response.get_question_responses_for_section(2, questionsets)
+
+        self.assertEqual(sorted(question_responses.keys()), [1, 2])
+        self.assertTrue(all(q.id for q in question_responses.values()))
+        self.assertTrue(question_responses[2].enabled)
+        self.assertEqual(question_responses[2].fields_total, 4)
+        self.assertEqual(self.survey_response.max_score, max_score)
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_response.pk).max_score, max_score)
+
+        # the question responses and their uploaded files
+        with self.assertNumQueries(2):
+            self.survey_response.get_question_responses_for_section(2, questionsets)
+
+        # bulk created questions apply their changes like loaded ones
+        question_responses[2].response_data = [{'questionset_2__answer_4': ['Smell', 'Teeth']}]
+        question_responses[2].save()
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_response.pk).computed_score, Decimal('3.000'))
+
+
+    def test_uploaded_files_prefetched(self):
+        question_response = self.survey_response.question_responses.get(survey_section=1, number=8)
+        question_response.uploaded_files.create(upload='reports/1/dog.jpg')
+        question_response.uploaded_files.create(upload='reports/1/cat.jpg')
+
+        questionsets = self.survey_response.get_schema_handler().get_questionsets(1)
+
+        with self.assertNumQueries(2):
+            question_responses = self.survey_response.get_question_responses_for_section(1, questionsets)
+            uploaded_files = question_responses[8].get_uploaded_files()
+            urls = sorted(uploaded_file.get_absolute_url() for uploaded_file in uploaded_files.values())
+
+        self.assertEqual(urls, ['/reports/%s/cat.jpg' % self.survey_response.id, '/reports/%s/dog.jpg' % self.survey_response.id])
+
+
+
+class QuestionResponseSaveTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+
+        goals = QuestionResponse.objects.get(survey_response=self.survey_response, survey_section=2, number=1)
+        goals.response_data = [{'questionset_1__answer_1': 'Yes'}]
+        goals.save()
+
+        self.question_response = QuestionResponse.objects.get(survey_response=self.survey_response, survey_section=2, number=2)
+        self.rescored = []
+
+        calculate_scores = self.question_response.calculate_scores
+        def counting_calculate_scores():
+            self.rescored.append(True)
+            calculate_scores()
+
+        self.question_response.calculate_scores = counting_calculate_scores
+
+
+    def test_verifier_edit_skips_rescoring(self):
+        self.question_response.verifier_notes = 'Looks good'
+        self.question_response.save()
+        self.assertEqual(len(self.rescored), 0)
+
+
+    def test_response_change_rescores(self):
+        self.question_response.response_data = [{'questionset_2__answer_4': ['Coat']}]
+        self.question_response.save()
+        self.assertEqual(len(self.rescored), 1)
+        self.assertEqual(self.question_response.computed_score, Decimal('1.000'))
+
+        self.question_response.save()
+        self.assertEqual(len(self.rescored), 1)
+
+
+    def test_in_place_change_rescores(self):
+        self.question_response.response_data.append({'questionset_2__answer_4': ['Coat', 'Teeth']})
+        self.question_response.save()
+        self.assertEqual(len(self.rescored), 1)
+        self.assertEqual(self.question_response.computed_score, Decimal('2.000'))
+
+
+
+class LazyJSONTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+
+        question_response = self.survey_response.question_responses.get(survey_section=2, number=2)
+        question_response.response_data = [{'questionset_2__answer_4': ['Coat']}]
+        question_response.save()
+
+
+    def load(self):
+        return QuestionResponse.objects.get(survey_response=self.survey_response, survey_section=2, number=2)
+
+
+    def test_decoded_on_first_access(self):
+        question_response = self.load()
+        self.assertTrue(isinstance(question_response.__dict__['response_data'], StoredJSON))
+
+        response_data = question_response.response_data
+        self.assertEqual(response_data, [{'questionset_2__answer_4': ['Coat']}])
+        self.assertTrue(isinstance(response_data[0], collections.OrderedDict))
+        self.assertTrue(question_response.response_data is response_data)
+
+
+    def test_save_without_reading(self):
+        question_response = self.load()
+        question_response.verifier_notes = 'Looks good'
+        question_response.save()
+
+        self.assertTrue(isinstance(question_response.__dict__['response_data'], StoredJSON))
+        self.assertFalse(question_response.needs_scoring())
+
+        question_response = self.load()
+        self.assertEqual(question_response.response_data, [{'questionset_2__answer_4': ['Coat']}])
+        self.assertEqual(question_response.verifier_notes, 'Looks good')
+
+
+    def test_reading_is_not_a_change(self):
+        question_response = self.load()
+        question_response.response_data
+        self.assertFalse(question_response.needs_scoring())
+
+        question_response.response_data[0]['questionset_2__answer_4'].append('Teeth')
+        self.assertTrue(question_response.needs_scoring())
+
+
+
+class ReadOnlySectionTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+
+
+    def test_review_renders_without_forms(self):
+        from supasurvey.display import DisplayQuestion
+
+        question_response = self.survey_response.question_responses.get(survey_section=1, number=1)
+        question_response.response_data = [{'questionset_1__answer_1': 'Rex <3', 'questionset_1__answer_3': 'rex@example.com'}]
+        question_response.save()
+
+        question_response = self.survey_response.question_responses.get(survey_section=1, number=8)
+        uploaded_file = question_response.uploaded_files.create(upload='reports/1/dog.jpg')
+        question_response.response_data = [{'questionset_8__answer_1': [uploaded_file.id]}]
+        question_response.save()
+
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+
+        # the schema version, the question responses, their uploaded files and the section summaries
+        with self.assertNumQueries(4):
+            ctx = survey_response.get_section_context(section_id=1, response_edit=False)
+
+        self.assertEqual(ctx['title'], 'General Information')
+        self.assertTrue(all(isinstance(question, DisplayQuestion) for question in ctx['formsets'].values()))
+        self.assertEqual([question.meta['id'] for question in ctx['files']], ['8'])
+
+        fields = list(ctx['formsets']['1'].forms[0])
+        self.assertEqual([field.label for field in fields], ['Name', 'Title', 'E-mail', 'Telephone'])
+        self.assertEqual(unicode(fields[0]), '<pre>Rex &lt;3</pre>')
+        self.assertEqual(unicode(fields[1]), '<pre>None</pre>')
+        self.assertEqual(unicode(fields[2]), 'rex@example.com')
+
+        fields = list(ctx['formsets']['8'].forms[0])
+        self.assertEqual(fields[0].label, 'Attached files')
+        self.assertEqual(unicode(fields[0]), '<ul><li><a href="/reports/%s/dog.jpg">dog.jpg</a></li></ul>' % survey_response.id)
+
+
+    def test_all_sections(self):
+        sections = self.survey_response.get_all_sections()
+        self.assertEqual([section['title'] for section in sections[:3]], ['General Information', 'Goals', 'Review'])
+        self.assertEqual(len(sections[1]['formsets']['2'].forms), 1)
+
+
+
+class SchemaFragmentTest(TestCase):
+    def setUp(self):
+        self.survey = create_survey()
+        self.survey_responses = [SurveyResponse.objects.create(survey=self.survey, year=2015) for i in range(2)]
+
+        for survey_response in self.survey_responses:
+            goals = survey_response.question_responses.get(survey_section=2, number=1)
+            goals.response_data = [{'questionset_1__answer_1': 'Yes'}]
+            goals.save()
+
+
+    def test_reports_share_schemas(self):
+        self.assertEqual(SchemaFragment.objects.count(), 14)
+
+        first, second = [survey_response.question_responses.get(survey_section=2, number=2) for survey_response in self.survey_responses]
+        self.assertEqual(first.schema_id, second.schema_id)
+        self.assertTrue(first.schema_data is second.schema_data)
+        self.assertEqual(first.schema_data['title'], 'What were your goals?  Please list and describe.')
+
+
+    def test_new_schema_rescores(self):
+        question_response = self.survey_responses[0].question_responses.get(survey_section=2, number=2)
+        schema_data = copy.deepcopy(question_response.schema_data)
+        schema_data['answers']['4']['maxscore'] = '10'
+        question_response.schema_data = schema_data
+        question_response.save()
+
+        self.assertEqual(SchemaFragment.objects.count(), 15)
+        self.assertEqual(QuestionResponse.objects.get(pk=question_response.pk).max_score, Decimal('10.000'))
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_responses[0].pk).max_score, Decimal('11.000'))
+        self.assertEqual(SurveyResponse.objects.get(pk=self.survey_responses[1].pk).max_score, Decimal('6.000'))
+
+
+
+@override_settings(SUPASURVEY_FRAGMENT_CACHE='default')
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.survey = create_survey()
+        self.survey_response = SurveyResponse.objects.create(survey=self.survey, year=2015)
+        self.rendered = []
+
+        render_display = QuestionResponse.render_display
+        def counting_render_display(question_response, *args, **kwargs):
+            self.rendered.append(question_response.number)
+            return render_display(question_response, *args, **kwargs)
+
+        QuestionResponse.render_display = counting_render_display
+        self.addCleanup(setattr, QuestionResponse, 'render_display', render_display)
+
+
+    def get_section(self, section_id):
+        survey_response = SurveyResponse.objects.get(pk=self.survey_response.pk)
+        self.rendered = []
+        return survey_response.get_section_context(section_id=section_id, response_edit=False)
+
+
+    def test_fragments_reused(self):
+        ctx = self.get_section(3)
+        self.assertEqual(self.rendered, [1, 2, 3])
+
+        cached = self.get_section(3)
+        self.assertEqual(self.rendered, [])
+        self.assertEqual([unicode(field) for field in cached['formsets']['3'].forms[0]], [unicode(field) for field in ctx['formsets']['3'].forms[0]])
+        self.assertEqual(cached['formsets']['3'].meta['question_response'].number, 3)
+
+
+    def test_save_invalidates(self):
+        self.get_section(2)
+
+        question_response = self.survey_response.question_responses.get(survey_section=2, number=1)
+        question_response.response_data = [{'questionset_1__answer_1': 'Yes'}]
+        question_response.save()
+
+        # answering the goals question enables the goals
+        ctx = self.get_section(2)
+        self.assertEqual(self.rendered, [1, 2])
+        self.assertEqual(unicode(ctx['formsets']['1'].forms[0].fields[0]), 'Yes')
+
+
+    def test_uploaded_files_invalidate(self):
+        self.get_section(3)
+
+        question_response = self.survey_response.question_responses.get(survey_section=3, number=3)
+        uploaded_file = question_response.uploaded_files.create(upload='reports/1/certificate.pdf')
+        self.get_section(3)
+        self.assertEqual(self.rendered, [3])
+
+        uploaded_file.delete()
+        self.get_section(3)
+        self.assertEqual(self.rendered, [3])
+
+
+    def test_rescore_invalidates(self):
+        from supasurvey.rescoring import rescore_survey
+
+        self.get_section(3)
+
+        # a bulk update, like the rescoring one, leaves updated_at alone
+        QuestionResponse.objects.filter(survey_section=3, number=2).update(fields_total=9)
+        self.get_section(3)
+        self.assertEqual(self.rendered, [])
+
+        self.assertEqual(rescore_survey(self.survey).changed, 1)
+        self.get_section(3)
+        self.assertEqual(self.rendered, [2])
+
+
+    def test_bulk_invalidation(self):
+        from supasurvey.fragments import invalidate_question_fragments_many
+
+        self.get_section(3)
+
+        invalidate_question_fragments_many(self.survey_response.question_responses.filter(survey_section=3, number__gt=1).values_list('id', flat=True))
+        self.get_section(3)
+        self.assertEqual(self.rendered, [2, 3])
+
+
+    def test_edit_mode_cached_separately(self):
+        from supasurvey.fragments import FragmentCache
+
+        question_response = self.survey_response.question_responses.get(survey_section=3, number=1)
+
+        review = FragmentCache.for_section('review')
+        review.get_many([(question_response, 'v1')])
+        review.set_many({question_response.id: 'rendered'})
+
+        self.assertEqual(FragmentCache.for_section('review').get_many([(question_response, 'v1')]), {question_response.id: 'rendered'})
+        self.assertEqual(FragmentCache.for_section('verify').get_many([(question_response, 'v1')]), {})
+        self.assertEqual(FragmentCache.for_section('review').get_many([(question_response, 'v2')]), {})
@@ -0,0 +1,7 @@
+from django.conf.urls import patterns, url
+
+
+urlpatterns = patterns('supasurvey.views',
+    url(r'^reports/(?P<id>\d+)/sections/(?P<section_id>\d+)/questions/(?P<number>\d+)/answer/$', 'answer_patch', name='supasurvey-answer-patch'),
+    url(r'^surveys/(?P<id>\d+)/stats/$', 'survey_stats', name='supasurvey-survey-stats'),
+)
@@ -1,9 +1,10 @@
-import csv, os, codecs, collections, json, copy
+import csv, os, codecs, collections, json, copy, threading, hashlib
 
 from decimal import Decimal
 
 from django.utils.html import conditional_escape
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 
 # # http://stackoverflow.com/questions/1846135/python-csv-library-with-unicode-utf-8-support-that-just-works
@@ -178,8 +179,13 @@ class SchemaHandler(object):
         self.data = json.loads(self.json_raw, object_pairs_hook=collections.OrderedDict)
 
 
-    def get_questionsets(self, section_id):
+    def get_questionsets(self, section_id, deep=True):
+        """ Pass deep=False to read the shared schema without copying it. """
         section_schema = self.get_section_schema(section_id)
+        if section_schema is None:
+            return collections.OrderedDict()
+        if not deep:
+            return section_schema.get('questionsets')
         return copy.deepcopy(section_schema).get('questionsets')
 
 
@@ -187,38 +193,277 @@ class SchemaHandler(object):
         return self.data.get(unicode(section_id))
 
 
+    def get_dependency_graph(self):
+        """ The question dependencies of the schema, compiled once per handler. """
+        dependency_graph = getattr(self, '_dependency_graph', None)
+        if dependency_graph is None:
+            from supasurvey.dependencies import DependencyGraph
+            dependency_graph = self._dependency_graph = DependencyGraph(self.data)
+
+        return dependency_graph
+
+
+
+class SchemaRegistry(object):
+    """ Process-wide registry of compiled schema handlers.
+
+    Handlers are keyed by survey and by a version string describing the source
+    they were compiled from, so each worker compiles a schema once per version
+    and every request after that reuses the in-memory result.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._handlers = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, survey_key, version, compile_schema):
+        key = (survey_key, version)
+
+        with self._lock:
+            schema_handler = self._handlers.get(key, None)
+            if schema_handler is not None:
+                self.hits += 1
+                return schema_handler
+
+            self.misses += 1
+            schema_handler = compile_schema()
+
+            # a new version replaces whatever was compiled for this survey before
+            for stale_key in [k for k in self._handlers.keys() if k[0] == survey_key]:
+                del self._handlers[stale_key]
+
+            self._handlers[key] = schema_handler
+
+        return schema_handler
+
+
+    def invalidate(self, survey_key=None):
+        with self._lock:
+            if survey_key is None:
+                self._handlers.clear()
+            else:
+                for key in [k for k in self._handlers.keys() if k[0] == survey_key]:
+                    del self._handlers[key]
+
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._handlers)
+        }
+
+
+schema_registry = SchemaRegistry()
+
+
+
+class LRUCache(object):
+    """ Bounded, thread safe cache of compiled schema parts.  The least recently
+    used entries are dropped once it holds more than size entries.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            value = self._entries[key] = self._entries.pop(key)
+            return value
+
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+
+    def get_or_create(self, key, factory):
+        """ The cached value of key, built with factory() on a miss.
+
+        The value is built without holding the lock, so factory may use the
+        cache itself.  Threads missing the same key at once may each build it,
+        and all of them return the value cached first.
+        """
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self._set(key, value)
+                return value
+
+        value = factory()
+
+        with self._lock:
+            cached = self._entries.pop(key, None)
+            if cached is not None:
+                value = cached
+            self._set(key, value)
+
+        return value
+
+
+    def _set(self, key, value):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
 
-def get_schema_handler(survey):
-    schema_handler = SchemaHandler()
 
-    # currently reading from file
-    # schema_handler.survey = survey
-    # schema_handler.data = survey.data
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+
+def get_data_fingerprint(data):
+    """ Content hash of JSON data, as it would be stored in a JSONField.  JSON
+    not decoded yet is hashed as it was stored.
+    """
+    from supasurvey.jsonfields import StoredJSON
+
+    if isinstance(data, StoredJSON):
+        json_data = data.json
+    else:
+        json_data = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return hashlib.sha1(json_data.encode('utf-8')).hexdigest()
+
+
+
+def get_schema_version(data):
+    """ Content hash of a compiled schema, used as the survey version. """
+    return get_data_fingerprint(data)
+
+
+
+def get_source_version(pth):
+    """ Cheap fingerprint of a schema source file, from its mtime and size. """
+    stat = os.stat(pth)
+    return '%s:%s' % (stat.st_mtime, stat.st_size)
+
+
+
+def invalidate_schema_handler(survey=None):
+    survey_key = getattr(survey, 'pk', survey)
+    schema_registry.invalidate(survey_key)
+
+
+
+def get_schema_source_path():
+    """ The file the schema is imported from, the csv in development and the
+    exported par_out.json otherwise.
+    """
+    DEVELOPLMENT = getattr(settings, 'SUPASURVEY_DEVELOPMENT', False)
+    if DEVELOPLMENT:
+        return os.path.join(settings.PROJECT_ROOT, 'bin', 'par.csv')
+    return os.path.join(settings.PROJECT_ROOT, 'bin', 'par_out.json')
+
+
+
+_imported_sources = {}
+
+def import_schema_file(survey, force=False):
+    """ Imports the schema from PROJECT_ROOT/bin into survey.data.
+
+    In development the csv is re-nested whenever it changes on disk, otherwise
+    the previously exported par_out.json is used.  This only runs when the
+    survey has no stored schema, or in development, so the request path reads
+    from the database.  Run the import_survey_schema command to import a
+    changed file otherwise.
+    """
 
-    # replace data with this
     in_csv_pth = os.path.join(settings.PROJECT_ROOT, 'bin', 'par.csv')
     out_json_pth = os.path.join(settings.PROJECT_ROOT, 'bin', 'par_out.json')
-    out_json_pth_processed = os.path.join(settings.PROJECT_ROOT, 'bin', 'par_out_processed.json')
     in_json_pth = os.path.join(settings.PROJECT_ROOT, 'bin', 'par_out.json')
 
-    DEVELOPLMENT = getattr(settings, 'SUPASURVEY_DEVELOPMENT', True)
+    DEVELOPLMENT = getattr(settings, 'SUPASURVEY_DEVELOPMENT', False)
+    source_pth = get_schema_source_path()
+
+    if not os.path.exists(source_pth):
+        return False
+
+    source_version = get_source_version(source_pth)
+    if not force and _imported_sources.get(survey.pk) == source_version:
+        return False
+
+    schema_handler = SchemaHandler()
+
     if DEVELOPLMENT:
         schema_handler.read_lines(in_csv_pth)
         schema_handler.parse_as_dct()
         schema_handler.nest()
-        schema_handler.data_bak1 = schema_handler.data
         schema_handler.write_json(out_json_pth, pretty=True)
 
     schema_handler.read_json(in_json_pth)
     schema_handler.to_python()
-    # schema_handler.flatten()
-    # schema_handler.nest()
-    # schema_handler.data_bak2 = schema_handler.data
-    # schema_handler.write_json(out_json_pth_processed, pretty=True)
-    # assert schema_handler.data_bak1 == schema_handler.data_bak2
 
-    # save updated data
-    # survey.data = schema_handler.data
-    # survey.save()
+    if get_schema_version(schema_handler.data) == survey.version:
+        _imported_sources[survey.pk] = source_version
+        return False
+
+    # a schema with invalid dependencies is not saved, and imported again
+    # until it is fixed
+    survey.data = schema_handler.data
+    survey.save()
+
+    _imported_sources[survey.pk] = source_version
+    return True
+
+
+
+def get_schema_handler(survey):
+    """ Returns the compiled schema handler for a survey (instance or pk).
+
+    The schema is read from Survey.data once per Survey.version and shared by
+    the whole process, so the handler must be treated as read-only.
+    """
+
+    from supasurvey.models import Survey
+
+    if not isinstance(survey, Survey):
+        survey = Survey.objects.only('id', 'version').get(pk=survey)
+
+    DEVELOPLMENT = getattr(settings, 'SUPASURVEY_DEVELOPMENT', False)
+    if DEVELOPLMENT or not survey.version:
+        survey = Survey.objects.get(pk=survey.pk)
+        import_schema_file(survey)
+
+    def compile_schema():
+        schema_handler = SchemaHandler()
+        schema_handler.survey_id = survey.pk
+        schema_handler.version = survey.version
+
+        # only the version is loaded on the request path, fetch the schema itself
+        if 'data' in survey.__dict__:
+            data = survey.data
+        else:
+            data = Survey.objects.get(pk=survey.pk).data
+
+        schema_handler.data = data or collections.OrderedDict()
+
+        return schema_handler
 
-    return schema_handler
+    return schema_registry.get(survey.pk, survey.version, compile_schema)
@@ -0,0 +1,79 @@
+import json
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_GET, require_POST
+
+from supasurvey.models import Survey, SurveyResponse, QuestionResponse
+from supasurvey.stats import get_survey_stats
+
+
+
+@login_required
+@require_POST
+def answer_patch(request, id, section_id, number):
+    """ Autosaves a single answer.  The body is a JSON object holding one answer
+    key and its value, and optionally the repeater row:
+
+        {"questionset_3__answer_2": ["sit", "stay"], "row": 0}
+
+    Responds with the new question and report totals.  Who may patch a report
+    is decided by SurveyResponse.can_patch.
+    """
+    survey_response = get_object_or_404(SurveyResponse, id=id)
+    if not survey_response.can_patch(request.user):
+        return JsonResponse({'errors': ['You may not edit this report.']}, status=403)
+
+    if not survey_response.can_edit:
+        return JsonResponse({'errors': ['This report can not be edited.']}, status=403)
+
+    try:
+        patch = json.loads(request.body)
+    except ValueError, e:
+        return JsonResponse({'errors': ['Invalid JSON.']}, status=400)
+
+    if not isinstance(patch, dict):
+        return JsonResponse({'errors': ['Invalid patch.']}, status=400)
+
+    row = patch.pop('row', 0)
+    if len(patch) != 1:
+        return JsonResponse({'errors': ['Patch exactly one answer.']}, status=400)
+
+    field_key, value = patch.items()[0]
+
+    with transaction.atomic():
+        queryset = QuestionResponse.objects.select_for_update().filter(survey_response=survey_response)
+        question_response = get_object_or_404(queryset, survey_section=section_id, number=number)
+        question_response.survey_response = survey_response
+
+        try:
+            totals = question_response.patch_answer(field_key, value, row)
+        except ValidationError, e:
+            return JsonResponse({'errors': e.messages}, status=400)
+
+    return JsonResponse(totals)
+
+
+
+@staff_member_required
+@require_GET
+def survey_stats(request, id):
+    """ The answer statistics of a survey, optionally of one ?year=, read from
+    its counters.  Cheap enough for dashboards that poll it.
+    """
+    survey = get_object_or_404(Survey, id=id)
+
+    year = request.GET.get('year', None)
+    if year:
+        try:
+            year = int(year)
+        except ValueError, e:
+            return JsonResponse({'errors': ['Invalid year.']}, status=400)
+    else:
+        year = None
+
+    return JsonResponse({'survey': survey.id, 'year': year, 'questions': get_survey_stats(survey, year)})